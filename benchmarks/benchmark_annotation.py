@@ -0,0 +1,112 @@
+# This script benchmarks the annotation of the frames, as done when SAVE_VIDEO or PLOT is set to True.
+# A synthetic long and crowded clip is simulated, where tracks appear, move and disappear over time.
+# The per-frame annotation time is reported at the start and at the end of the clip, for the annotate_frame function
+# (loops over all objects and redraws every trajectory segment) and for the FrameAnnotator class (visible objects, polylines).
+# Usage: python benchmarks/benchmark_annotation.py --frames 3000 --tracks 40 --track-length 300 [--save-video annotated.mp4]
+
+# Local imports
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('MIN_STATIC_DISTANCE', '50')
+from utils.AnnotateFrame import annotate_frame, FrameAnnotator
+from utils.ClassificationObject import ClassificationObject
+
+# External imports
+import cv2
+import time
+import argparse
+import numpy as np
+
+
+def simulate_clip(number_of_frames: int, number_of_tracks: int, track_length: int, seed: int = 0):
+    """ Simulate the tracking results of a crowded clip, yielding the detections per frame.
+    There are number_of_tracks tracks visible at the same time, each track is replaced by a new one after track_length frames.
+
+    :param number_of_frames: The number of frames of the clip.
+    :param number_of_tracks: The number of tracks visible in each frame.
+    :param track_length: The number of frames a track is visible.
+    :param seed: The seed of the random generator.
+    :returns: A generator of lists of (id, bounding box) tuples, one list per frame.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    next_id = 0
+    tracks = {}
+    for frame_number in range(number_of_frames):
+        # Replace the tracks that ended, the start of the tracks is spread to keep the number of visible tracks constant.
+        for slot in range(number_of_tracks):
+            if slot not in tracks or (frame_number + slot * track_length // number_of_tracks) % track_length == 0:
+                tracks[slot] = (next_id, rng.uniform([0, 0], [1700, 900]), rng.normal(0, 2, size=2))
+                next_id += 1
+
+        detections = []
+        for slot, (track_id, position, velocity) in tracks.items():
+            position += velocity + rng.normal(0, 0.5, size=2)
+            np.clip(position, 0, [1800, 980], out=position)
+            detections.append((track_id, [position[0], position[1], position[0] + 100, position[1] + 80]))
+        yield detections
+
+
+def run(annotator: str, args) -> list[float]:
+    """ Annotate the simulated clip with the given annotator.
+
+    :param annotator: Either 'annotate_frame' or 'FrameAnnotator'.
+    :returns: The annotation time of each frame in seconds.
+
+    """
+
+    frame_annotator = FrameAnnotator(min_distance=50, min_detections=5)
+    video_out = cv2.VideoWriter(
+        filename=args.save_video,
+        fourcc=cv2.VideoWriter.fourcc(*'mp4v'),
+        fps=5,
+        frameSize=(1920, 1080)) if args.save_video else None
+
+    classification_objects: dict[int, ClassificationObject] = {}
+    background = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    annotation_times = []
+    for frame_number, detections in enumerate(simulate_clip(args.frames, args.tracks, args.track_length)):
+        frame_objects = []
+        for track_id, trajectory in detections:
+            if track_id in classification_objects:
+                classification_object = classification_objects[track_id]
+                classification_object.add_object_conf(0.8)
+                classification_object.add_trajectory(trajectory)
+                classification_object.add_frame_number(frame_number)
+            else:
+                classification_object = ClassificationObject(track_id, 'car', 0.8, trajectory, frame_number, 1920, 1080)
+                classification_objects[track_id] = classification_object
+            frame_objects.append(classification_object)
+
+        frame = background.copy()
+        start_time = time.perf_counter()
+        if annotator == 'annotate_frame':
+            annotated_frame = annotate_frame(frame, frame_number, list(classification_objects.values()), 50, 5)
+        else:
+            annotated_frame = frame_annotator.annotate(frame, frame_objects)
+        annotation_times.append(time.perf_counter() - start_time)
+
+        video_out.write(annotated_frame) if video_out is not None else None
+
+    video_out.release() if video_out is not None else None
+    return annotation_times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the annotation of a long and crowded clip.')
+    parser.add_argument('--frames', type=int, default=3000, help='The number of frames of the clip.')
+    parser.add_argument('--tracks', type=int, default=40, help='The number of tracks visible in each frame.')
+    parser.add_argument('--track-length', type=int, default=300, help='The number of frames a track is visible.')
+    parser.add_argument('--save-video', help='Write the annotated frames to this path, in the same way as SAVE_VIDEO.')
+    args = parser.parse_args()
+
+    # The start and end of the clip are compared, to show how the annotation time grows with the length of the clip.
+    window = max(1, args.frames // 10)
+    print(f'{args.frames} frames, {args.tracks} visible tracks, {args.track_length} frames per track')
+    for annotator in ['annotate_frame', 'FrameAnnotator']:
+        annotation_times = run(annotator, args)
+        print(f'\t - {annotator}: total {sum(annotation_times):.2f}s, '
+              f'first {window} frames {1000 * np.mean(annotation_times[:window]):.2f} ms/frame, '
+              f'last {window} frames {1000 * np.mean(annotation_times[-window:]):.2f} ms/frame')
@@ -0,0 +1,111 @@
+# This script load tests the batch inference server, with simulated concurrent video pipelines.
+# Each pipeline is a thread tracking the frames of a clip (decoded up front) through its own client, as the workers do with CONCURRENT_VIDEOS > 1.
+# For each batch policy (max batch size and max wait) the total throughput, the p50/p99 latency per frame and the average batch size are reported.
+# A max batch size of 1 is the baseline, in which every frame is detected separately.
+# Usage: python benchmarks/benchmark_batching.py --clips data/clips --model yolov8n.pt --streams 4 --batch-sizes 1 4 8 --max-wait-ms 0 5 20
+
+# Local imports
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.BatchInference import BatchInferenceServer
+
+# External imports
+import cv2
+import glob
+import time
+import torch
+import argparse
+import itertools
+import threading
+import numpy as np
+from ultralytics import YOLO
+
+
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.ts']
+
+
+def load_streams(clips_directory: str, number_of_streams: int, number_of_frames: int) -> list[list[np.ndarray]]:
+    """ Decode the frames of the simulated streams up front, so only the inference is measured.
+    The clips are divided over the streams, if no clips are given the streams consist of random 720p frames.
+
+    """
+
+    clips = sorted(path for path in glob.glob(os.path.join(clips_directory, '*'))
+                   if os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS) if clips_directory else []
+    if not clips:
+        rng = np.random.default_rng(0)
+        return [[rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8) for _ in range(number_of_frames)] for _ in range(number_of_streams)]
+
+    streams = []
+    for clip in itertools.islice(itertools.cycle(clips), number_of_streams):
+        cap = cv2.VideoCapture(clip)
+        frames = []
+        while len(frames) < number_of_frames:
+            success, frame = cap.read()
+            if not success:
+                break
+            frames.append(frame)
+        cap.release()
+        streams.append(frames)
+    return streams
+
+
+def run_policy(model, streams: list[list[np.ndarray]], max_batch_size: int, max_wait_ms: float, conf: float) -> dict:
+    """ Track all streams concurrently through a server with the given batch policy.
+    :returns: The throughput in frames/s, the p50/p99 latency in milliseconds and the average batch size.
+
+    """
+
+    server = BatchInferenceServer(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, conf=conf)
+    latencies = [[] for _ in streams]
+
+    def track_stream(index: int):
+        client = server.client()
+        for frame in streams[index]:
+            start_time = time.perf_counter()
+            client.track(frame)
+            latencies[index].append(time.perf_counter() - start_time)
+        client.close()
+
+    threads = [threading.Thread(target=track_stream, args=(index,)) for index in range(len(streams))]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start_time
+    server.close()
+
+    latencies = 1000 * np.concatenate(latencies)
+    return {'throughput': len(latencies) / duration,
+            'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99)),
+            'batch_size': server.batched_frames / max(server.batches, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the batch inference server with concurrent video pipelines.')
+    parser.add_argument('--clips', default='', help='Directory containing the clips, if not given random frames are used.')
+    parser.add_argument('--model', default='yolov8n.pt', help='The model to benchmark.')
+    parser.add_argument('--streams', type=int, default=4, help='The number of concurrent video pipelines.')
+    parser.add_argument('--frames', type=int, default=100, help='The number of frames per pipeline.')
+    parser.add_argument('--conf', type=float, default=0.3, help='The confidence threshold.')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 4, 8], help='The max batch sizes.')
+    parser.add_argument('--max-wait-ms', nargs='+', type=float, default=[0, 5, 20], help='The max wait times in milliseconds.')
+    args = parser.parse_args()
+
+    streams = load_streams(args.clips, args.streams, args.frames)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = YOLO(args.model).to(device)
+    # A warm-up run, so the model initialization is not included in the first policy.
+    run_policy(model, [stream[:2] for stream in streams], 1, 0, args.conf)
+
+    print(f'{len(streams)} concurrent pipelines, {sum(len(stream) for stream in streams)} frames, on {device}')
+    for max_batch_size, max_wait_ms in itertools.product(args.batch_sizes, args.max_wait_ms):
+        # The max wait has no effect without batching, the baseline is only run once.
+        if max_batch_size == 1 and max_wait_ms != args.max_wait_ms[0]:
+            continue
+        result = run_policy(model, streams, max_batch_size, max_wait_ms, args.conf)
+        print(f'\t - max batch size {max_batch_size}, max wait {max_wait_ms:g} ms: {result["throughput"]:.1f} frames/s, '
+              f'p50 {result["p50"]:.1f} ms, p99 {result["p99"]:.1f} ms, average batch size {result["batch_size"]:.2f}')
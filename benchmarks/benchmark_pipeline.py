@@ -0,0 +1,217 @@
+# This script benchmarks the classification pipeline on a local directory of clips, without RabbitMQ or Kerberos Vault.
+# Every clip is classified for each configuration of the matrix (model, CLASSIFICATION_FPS, colors on/off).
+# It reports frames/s, the time per pipeline stage, the peak RSS and the output equivalence against stored golden ReturnJSONs.
+# Usage:
+#   python benchmarks/benchmark_pipeline.py --clips data/clips --models yolov8n.pt yolov8n-seg.pt --fps 3 5 --colors off on \
+#       --golden data/golden [--update-golden] [--report report.json] [--baseline previous_report.json]
+
+# Local imports
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.Metrics import Metrics
+from utils.ReturnObject import StreamingReturnJSON
+from utils.VariableClass import VariableClass
+from utils.ClassificationPipeline import classify_video
+from utils.ModelLoader import load_model, warm_up, reset_model
+
+# External imports
+import cv2
+import json
+import time
+import glob
+import torch
+import resource
+import argparse
+import itertools
+import multiprocessing
+from dotenv import load_dotenv
+
+
+# Default values for the environment variables needed by the pipeline, these are only used if not set in the environment or .env file.
+DEFAULT_ENVIRONMENT = {
+    'MODEL_NAME': 'yolov8n.pt',
+    'COLOR_PREDICTION_INTERVAL': '5',
+    'MIN_CLUSTERS': '3',
+    'MAX_CLUSTERS': '3',
+    'CLASSIFICATION_FPS': '5',
+    'CLASSIFICATION_THRESHOLD': '0.3',
+    'MAX_NUMBER_OF_PREDICTIONS': '100000',
+    'MIN_DISTANCE': '50',
+    'MIN_STATIC_DISTANCE': '50',
+    'MIN_DETECTIONS': '5',
+    'ALLOWED_CLASSIFICATIONS': '0, 1, 2, 3, 5, 7, 14, 15, 16, 24, 26, 28',
+}
+
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.ts']
+
+
+def create_variables(config: dict) -> VariableClass:
+    """ Create a VariableClass object for a benchmark configuration.
+    All saving, plotting and logging features are disabled, only the ReturnJSON is created.
+
+    :param config: The configuration, a dictionary of environment variable names and values.
+
+    """
+
+    load_dotenv()
+    for name, value in DEFAULT_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    var = VariableClass()
+
+    var.PLOT, var.LOGGING, var.TIME_VERBOSE = False, False, False
+    var.SAVE_VIDEO, var.SAVE_BBOX_FRAME, var.CREATE_BBOX_FRAME, var.SAVE_RETURN_JSON = False, False, False, False
+    var.CREATE_RETURN_JSON = True
+    for name, value in config.items():
+        setattr(var, name, value)
+    return var
+
+
+def config_name(config: dict) -> str:
+    """ Create a readable and file system friendly name for a configuration.
+
+    """
+
+    return '_'.join(f'{name.lower()}-{value}' for name, value in config.items()).replace('/', '-')
+
+
+def run_config(config: dict, clips: list[str]) -> dict:
+    """ Classify all clips using a configuration. This runs in a separate process, so the peak RSS is per configuration.
+
+    :param config: The configuration, a dictionary of environment variable names and values.
+    :param clips: The paths of the clips to classify.
+    :returns: The results per clip, the startup time and the peak RSS in MB.
+
+    """
+
+    var = create_variables(config)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+    # The model is loaded and warmed up once per configuration, in the same way as once per worker in the queue loop.
+    start_time_model_load = time.perf_counter()
+    model = load_model(var.MODEL_NAME, var.MODEL_DIR, device)
+    startup = {'model_load': time.perf_counter() - start_time_model_load, 'warm_up': warm_up(model)}
+
+    clip_results = {}
+    for clip in clips:
+        metrics = Metrics(enabled=True)
+        metrics.start_message()
+        start_time_video = metrics.start()
+
+        # The model is reused for each clip, with the trackers of the previous clip removed, as per message in the queue loop.
+        reset_model(model)
+        cap = cv2.VideoCapture(clip)
+        start_time = time.perf_counter()
+        return_json, predicted_frames = classify_video(
+            cap=cap,
+            model=model,
+            var=var,
+            metrics=metrics)
+        classification_time = time.perf_counter() - start_time
+        cap.release()
+        metrics.stop('video', start_time_video)
+
+        # The details of a streaming ReturnJSON are loaded from its file, so they are compared before the file is closed.
+        return_json.load_details() if isinstance(return_json, StreamingReturnJSON) else None
+        clip_results[os.path.basename(clip)] = {
+            'predicted_frames': predicted_frames,
+            'seconds': classification_time,
+            'fps': predicted_frames / classification_time if classification_time > 0 else 0.0,
+            'stages': {stage: metrics.total(stage) for stage in metrics.ordered_stages()},
+            'return_object': return_json.return_object,
+        }
+        return_json.close() if isinstance(return_json, StreamingReturnJSON) else None
+
+    # ru_maxrss is reported in kilobytes on Linux.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'clips': clip_results, 'startup': startup, 'peak_rss_mb': peak_rss}
+
+
+def compare_objects(output, golden, tolerance: float, path: str = '') -> list[str]:
+    """ Compare an output with a golden output, floats are compared with an absolute tolerance.
+    :returns: A list of the paths where the outputs differ.
+
+    """
+
+    if isinstance(output, dict) and isinstance(golden, dict):
+        if output.keys() != golden.keys():
+            return [path or '/']
+        return [difference for key in output for difference in compare_objects(output[key], golden[key], tolerance, f'{path}/{key}')]
+    if isinstance(output, list) and isinstance(golden, list):
+        if len(output) != len(golden):
+            return [path or '/']
+        return [difference for i, (a, b) in enumerate(zip(output, golden)) for difference in compare_objects(a, b, tolerance, f'{path}/{i}')]
+    if isinstance(output, float) or isinstance(golden, float):
+        numeric = isinstance(output, (int, float)) and isinstance(golden, (int, float))
+        return [] if numeric and abs(output - golden) <= tolerance else [path]
+    return [] if output == golden else [path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the classification pipeline on a local directory of clips.')
+    parser.add_argument('--clips', required=True, help='Directory containing the clips to classify.')
+    parser.add_argument('--models', nargs='+', default=['yolov8n.pt'], help='The models to benchmark, e.g. yolov8n.pt yolov8n-seg.pt.')
+    parser.add_argument('--fps', nargs='+', type=int, default=[5], help='The CLASSIFICATION_FPS values to benchmark.')
+    parser.add_argument('--colors', nargs='+', choices=['off', 'on'], default=['off'], help='Benchmark with FIND_DOMINANT_COLORS off and/or on.')
+    parser.add_argument('--golden', help='Directory with the golden ReturnJSONs, stored per configuration and clip.')
+    parser.add_argument('--update-golden', action='store_true', help='Store the outputs as the new golden ReturnJSONs.')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Absolute tolerance for floats when comparing to the golden ReturnJSONs.')
+    parser.add_argument('--report', help='Path where the benchmark report is saved as json.')
+    parser.add_argument('--baseline', help='A previous benchmark report, used to detect performance regressions.')
+    parser.add_argument('--max-slowdown', type=float, default=0.1, help='The maximum allowed relative decrease in frames/s compared to the baseline.')
+    args = parser.parse_args()
+
+    clips = sorted(path for path in glob.glob(os.path.join(args.clips, '*')) if os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS)
+    if not clips:
+        sys.exit(f'No clips found in {args.clips}')
+
+    configs = [{'MODEL_NAME': model, 'CLASSIFICATION_FPS': fps, 'FIND_DOMINANT_COLORS': colors == 'on'}
+               for model, fps, colors in itertools.product(args.models, args.fps, args.colors)]
+    baseline = json.load(open(args.baseline)) if args.baseline else {}
+
+    report, failures = {}, []
+    context = multiprocessing.get_context('spawn')
+    for config in configs:
+        name = config_name(config)
+        with context.Pool(1) as pool:
+            result = pool.apply(run_config, (config, clips))
+
+        print(f'\n{name} (peak RSS {result["peak_rss_mb"]:.0f} MB, model load {result["startup"]["model_load"]:.2f}s, warm-up {result["startup"]["warm_up"]:.2f}s)')
+        for clip, clip_result in result['clips'].items():
+            return_object = clip_result.pop('return_object')
+
+            # Compare the output with the golden ReturnJSON, or store it as the new golden ReturnJSON.
+            equivalence = 'no golden'
+            if args.golden:
+                golden_path = os.path.join(args.golden, name, os.path.splitext(clip)[0] + '.json')
+                if args.update_golden:
+                    os.makedirs(os.path.dirname(golden_path), exist_ok=True)
+                    with open(golden_path, 'w') as file:
+                        json.dump(return_object, file, indent='\t')
+                    equivalence = 'updated'
+                elif os.path.exists(golden_path):
+                    differences = compare_objects(json.loads(json.dumps(return_object)), json.load(open(golden_path)), args.tolerance)
+                    equivalence = 'equal' if not differences else f'{len(differences)} differences, first at {differences[0]}'
+                    if differences:
+                        failures.append(f'{name}/{clip}: output differs from golden, first at {differences[0]}')
+            clip_result['equivalence'] = equivalence
+
+            # Compare the frames/s with the baseline report.
+            baseline_fps = baseline.get(name, {}).get('clips', {}).get(clip, {}).get('fps')
+            if baseline_fps and clip_result['fps'] < baseline_fps * (1 - args.max_slowdown):
+                failures.append(f'{name}/{clip}: {clip_result["fps"]:.1f} frames/s, baseline {baseline_fps:.1f} frames/s')
+
+            stages = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in clip_result['stages'].items())
+            print(f'\t - {clip}: {clip_result["predicted_frames"]} frames in {clip_result["seconds"]:.2f}s, {clip_result["fps"]:.1f} frames/s, {equivalence}')
+            print(f'\t\t - {stages}')
+        report[name] = result
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent='\t')
+
+    if failures:
+        print('\nBenchmark failed:')
+        for failure in failures:
+            print(f'\t - {failure}')
+        sys.exit(1)
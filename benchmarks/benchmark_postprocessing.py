@@ -0,0 +1,115 @@
+# This script benchmarks the post-processing of the tracking results, i.e. updating the classification objects from a frame.
+# Synthetic ultralytics Results are created with many detections per frame (with or without masks), and the per-box tensor access
+# of the previous implementation is compared with the vectorized update_classification_objects, including the equivalence of the objects.
+# Usage: python benchmarks/benchmark_postprocessing.py --detections 50 100 --frames 200 [--masks]
+
+# Local imports
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('MIN_STATIC_DISTANCE', '50')
+from utils.TranslateObject import translate
+from utils.ClassificationObject import ClassificationObject
+from utils.Detections import create_translation_table
+from utils.ClassificationObjectFunctions import update_classification_objects, create_classification_object, edit_classification_object
+
+# External imports
+import time
+import torch
+import argparse
+import numpy as np
+from ultralytics.engine.results import Results
+
+
+NAMES = {0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck', 14: 'bird', 15: 'cat', 16: 'dog'}
+
+
+def create_synthetic_results(number_of_frames: int, number_of_detections: int, masks: bool, seed: int = 0) -> list[Results]:
+    """ Create synthetic tracking results, with the same tracks moving through all frames.
+
+    :param number_of_frames: The number of frames.
+    :param number_of_detections: The number of tracked detections per frame.
+    :param masks: Add segmentation masks to the results.
+    :param seed: The seed of the random generator.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    positions = rng.uniform([0, 0], [1700, 900], size=(number_of_detections, 2))
+    classes = rng.choice(list(NAMES), size=number_of_detections)
+
+    results = []
+    for _ in range(number_of_frames):
+        positions += rng.normal(0, 2, size=positions.shape)
+        # The boxes of a tracker have 7 columns: x1, y1, x2, y2, track id, confidence and class.
+        boxes = np.column_stack([positions, positions + [100, 80], np.arange(1, number_of_detections + 1),
+                                 rng.uniform(0.3, 1, size=number_of_detections), classes])
+        mask_data = None
+        if masks:
+            mask_data = torch.zeros((number_of_detections, 384, 640))
+            for i, (x, y) in enumerate(positions / 3):
+                mask_data[i, int(y):int(y) + 26, int(x):int(x) + 33] = 1
+        results.append(Results(orig_img=frame, path='', names=NAMES, boxes=torch.tensor(boxes, dtype=torch.float32), masks=mask_data))
+    return results
+
+
+def update_per_box(results, frame_number: int, classification_object_list: list[ClassificationObject], classification_object_ids: list[int]):
+    """ The previous implementation, converting each box and mask tensor separately and translating each name.
+
+    """
+
+    for box, mask in zip(results[0].boxes, results[0].masks or [None] * len(results[0].boxes)):
+        if box.id is None:
+            break
+        object_id = int(box.id)
+        object_name = translate(results[0].names[int(box.cls)])
+        object_conf = float(box.conf)
+        object_trajectory = box.xyxy.tolist()[0]
+        object_mask = np.int32(mask.xy[0].tolist()) if mask is not None else None
+
+        if object_id in classification_object_ids:
+            edit_classification_object(object_id, object_name, object_conf, object_trajectory, frame_number, classification_object_list)
+        else:
+            classification_object_ids.append(object_id)
+            classification_object_list.append(create_classification_object(
+                object_id, object_name, object_conf, object_trajectory, frame_number, 1920, 1080))
+
+
+def run(method: str, results: list[Results]) -> tuple[float, list[ClassificationObject]]:
+    """ Update the classification objects from all results.
+
+    :param method: Either 'per_box' or 'vectorized'.
+    :returns: The time per frame in milliseconds, and the classification objects.
+
+    """
+
+    classification_object_list, classification_object_ids = [], []
+    translation_table = create_translation_table(NAMES)
+    start_time = time.perf_counter()
+    for frame_number, frame_results in enumerate(results):
+        if method == 'per_box':
+            update_per_box([frame_results], frame_number, classification_object_list, classification_object_ids)
+        else:
+            update_classification_objects([frame_results], None, frame_number, 1920, 1080,
+                                          classification_object_list, classification_object_ids, translation_table=translation_table)
+    return 1000 * (time.perf_counter() - start_time) / len(results), classification_object_list
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the post-processing of the tracking results.')
+    parser.add_argument('--detections', nargs='+', type=int, default=[50, 100], help='The numbers of detections per frame.')
+    parser.add_argument('--frames', type=int, default=200, help='The number of frames.')
+    parser.add_argument('--masks', action='store_true', help='Add segmentation masks, as returned by a segmentation model.')
+    args = parser.parse_args()
+
+    for number_of_detections in args.detections:
+        results = create_synthetic_results(args.frames, number_of_detections, args.masks)
+        per_box_time, per_box_objects = run('per_box', results)
+        vectorized_time, vectorized_objects = run('vectorized', results)
+
+        # The objects should be identical, regardless of the implementation.
+        equal = [(o.id, o.object_names, o.object_confs, o.trajectory.tolist(), o.frames) for o in per_box_objects] == \
+                [(o.id, o.object_names, o.object_confs, o.trajectory.tolist(), o.frames) for o in vectorized_objects]
+        print(f'{number_of_detections} detections/frame: per box {per_box_time:.2f} ms/frame, '
+              f'vectorized {vectorized_time:.2f} ms/frame ({per_box_time / vectorized_time:.1f}x), objects equal: {equal}')
@@ -0,0 +1,87 @@
+# This script benchmarks the size and encode time of the ReturnJSON serializers and the compact schema.
+# A synthetic result is created, similar to a long and crowded clip, with many objects and many detections per object.
+# Usage: python benchmarks/benchmark_serializer.py --objects 200 --detections 500
+
+# Local imports
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('MIN_STATIC_DISTANCE', '50')
+from utils.ReturnObject import ReturnJSON
+from utils.Serializer import SERIALIZERS
+from utils.ClassificationObject import ClassificationObject
+
+# External imports
+import time
+import argparse
+import numpy as np
+
+
+def create_synthetic_return_json(number_of_objects: int, number_of_detections: int, seed: int = 0) -> ReturnJSON:
+    """ Create a synthetic ReturnJSON object with random trajectories and colors.
+
+    :param number_of_objects: The number of detected objects.
+    :param number_of_detections: The number of detections per object.
+    :param seed: The seed of the random generator.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    return_json = ReturnJSON()
+    for object_id in range(number_of_objects):
+        # Random walk of a bounding box in a 1920x1080 frame, detected every 5th frame.
+        corners = rng.uniform(0, 1000, size=2) + np.cumsum(rng.normal(0, 3, size=(number_of_detections, 2)), axis=0)
+        trajectory = np.concatenate([corners, corners + rng.uniform(20, 200, size=2)], axis=1).tolist()
+        first_frame = int(rng.integers(0, 1000))
+        colors_bgr = rng.uniform(0, 255, size=(3, 3)).tolist()
+
+        classification_object = ClassificationObject(
+            object_id, 'car', 0.8, trajectory[0], first_frame, 1920, 1080,
+            colors_bgr, [[0, 0, 0]] * 3, ['dark grey', 'white', 'black'])
+        for detection in range(1, number_of_detections):
+            classification_object.add_object_name('car')
+            classification_object.add_object_conf(0.8)
+            classification_object.add_trajectory(trajectory[detection])
+            classification_object.add_frame_number(first_frame + 5 * detection)
+            classification_object.add_object_colors_bgr(colors_bgr)
+            classification_object.add_object_colors_hls([[0, 0, 0]] * 3)
+            classification_object.add_object_colors_str(['dark grey', 'white', 'black'])
+        return_json.add_detected_object(classification_object)
+    return return_json
+
+
+def time_function(function, repeats: int) -> float:
+    """ Return the median time of a function call in milliseconds.
+
+    """
+
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return 1000 * float(np.median(times))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ReturnJSON serializers.')
+    parser.add_argument('--objects', type=int, default=200, help='The number of detected objects.')
+    parser.add_argument('--detections', type=int, default=500, help='The number of detections per object.')
+    parser.add_argument('--precision', type=int, default=2, help='The float precision of the compact schema.')
+    parser.add_argument('--repeats', type=int, default=5, help='The number of repeats per measurement.')
+    args = parser.parse_args()
+
+    return_json = create_synthetic_return_json(args.objects, args.detections)
+    print(f'Synthetic result: {args.objects} objects x {args.detections} detections\n')
+    print(f'{"serializer":<10} {"schema":<8} {"size (MB)":>10} {"encode (ms)":>12}')
+
+    for serializer in SERIALIZERS:
+        for compact in [False, True]:
+            try:
+                serialized = return_json.serialize(serializer, compact, args.precision)
+            except ImportError as error:
+                print(f'{serializer:<10} {"compact" if compact else "default":<8} skipped, {error}')
+                break
+            encode_time = time_function(
+                lambda: return_json.serialize(serializer, compact, args.precision), args.repeats)
+            print(f'{serializer:<10} {"compact" if compact else "default":<8} {len(serialized) / 1024**2:>10.2f} {encode_time:>12.1f}')
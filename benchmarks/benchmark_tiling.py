@@ -0,0 +1,123 @@
+# This script benchmarks tiled inference against full-frame inference, on the frames of a directory of high-resolution clips.
+# The reference are the detections of full-frame inference at a high resolution (--reference-imgsz), which is the alternative
+# of raising the resolution globally. For each mode the time per frame and the recall against the reference are reported,
+# overall and for small objects (smaller than --small-size pixels, in the original frame).
+# Usage: python benchmarks/benchmark_tiling.py --clips data/clips_4k --model yolov8n.pt --reference-imgsz 1920 --tile-size 640
+
+# Local imports
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.TiledInference import TiledDetector
+
+# External imports
+import cv2
+import glob
+import time
+import torch
+import argparse
+import numpy as np
+from ultralytics import YOLO
+
+
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.ts']
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """ The intersection over union between each pair of boxes, shape (len(boxes_a), len(boxes_b)).
+
+    """
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def matched_references(reference, detections, iou_threshold: float = 0.5) -> np.ndarray:
+    """ Match the detections to the reference detections of the same class, greedily on IoU.
+    :returns: A boolean array, True for each reference detection that is matched.
+
+    """
+
+    reference_xyxy, _, reference_classes = reference
+    xyxy, _, classes = detections
+    matched = np.zeros(len(reference_xyxy), dtype=bool)
+    if len(reference_xyxy) == 0 or len(xyxy) == 0:
+        return matched
+    iou = box_iou(reference_xyxy, xyxy)
+    iou[reference_classes[:, None] != classes[None, :]] = 0
+    for _ in range(min(iou.shape)):
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matched[i] = True
+        iou[i, :], iou[:, j] = 0, 0
+    return matched
+
+
+def detect_full_frame(model, frame, imgsz: int, conf: float):
+    """ Detect the objects in the full frame, at the given inference resolution.
+
+    """
+
+    boxes = model.predict(source=frame, imgsz=imgsz, conf=conf, verbose=False)[0].boxes.cpu().numpy()
+    return boxes.xyxy.astype(np.float64), boxes.conf.astype(np.float64), boxes.cls.astype(np.float64)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark tiled inference against full-frame inference.')
+    parser.add_argument('--clips', required=True, help='Directory containing the high-resolution clips.')
+    parser.add_argument('--model', default='yolov8n.pt', help='The model to benchmark.')
+    parser.add_argument('--frames', type=int, default=20, help='The number of frames sampled per clip.')
+    parser.add_argument('--conf', type=float, default=0.3, help='The confidence threshold.')
+    parser.add_argument('--reference-imgsz', type=int, default=1920, help='The resolution of the full-frame reference inference.')
+    parser.add_argument('--tile-size', type=int, default=640, help='The tile size, the native resolution of the model.')
+    parser.add_argument('--overlap', type=float, default=0.2, help='The overlap between neighbouring tiles.')
+    parser.add_argument('--small-size', type=int, default=64, help='Objects with a longest side below this size are small.')
+    args = parser.parse_args()
+
+    clips = sorted(path for path in glob.glob(os.path.join(args.clips, '*')) if os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS)
+    if not clips:
+        sys.exit(f'No clips found in {args.clips}')
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = YOLO(args.model).to(device)
+    tiled_detector = TiledDetector(model, tile_size=args.tile_size, overlap=args.overlap, conf=args.conf)
+
+    # The modes that are compared with the reference, as functions detecting a frame.
+    modes = {f'full frame {args.tile_size}': lambda frame: detect_full_frame(model, frame, args.tile_size, args.conf),
+             f'tiled {args.tile_size}': tiled_detector.detect,
+             f'full frame {args.reference_imgsz}': lambda frame: detect_full_frame(model, frame, args.reference_imgsz, args.conf)}
+    times = {mode: [] for mode in modes}
+    matches = {mode: [] for mode in modes}
+    small = []
+
+    for clip in clips:
+        cap = cv2.VideoCapture(clip)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for frame_number in np.linspace(0, max(0, frame_count - 1), args.frames).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            success, frame = cap.read()
+            if not success:
+                continue
+            tiled_detector.tiles = None
+
+            reference = detect_full_frame(model, frame, args.reference_imgsz, args.conf)
+            small.append((reference[0][:, 2:] - reference[0][:, :2]).max(axis=1, initial=0) < args.small_size)
+            for mode, detect in modes.items():
+                start_time = time.perf_counter()
+                detections = detect(frame)
+                times[mode].append(time.perf_counter() - start_time)
+                matches[mode].append(matched_references(reference, detections))
+        cap.release()
+
+    small = np.concatenate(small)
+    print(f'{len(times[next(iter(modes))])} frames, {len(small)} reference objects of which {small.sum()} small')
+    for mode in modes:
+        matched = np.concatenate(matches[mode])
+        recall = matched.mean() if len(matched) else 0.0
+        small_recall = matched[small].mean() if small.any() else 0.0
+        print(f'\t - {mode}: {1000 * np.mean(times[mode]):.1f} ms/frame, recall {recall:.2f}, small object recall {small_recall:.2f}')
@@ -3,25 +3,34 @@
 # It saves the detected objects in a json file and the annotated video locally.
 # For this it uses the ultralytics package to perform object detection and tracking.
 
+# The startup time is measured from the start of the imports.
+import time
+start_time_import = time.perf_counter()
+
 # Local imports
-from utils.ReturnObject import ReturnJSON
-from utils.TranslateObject import translate
+# The color prediction and live stream modules are only imported when they are used, as they are slow to import.
+# The other modules, including ultralytics and torch, are needed before the first message, so they are imported and measured here.
+from utils.ReturnObject import ReturnJSON, StreamingReturnJSON
 from utils.VariableClass import VariableClass
-from utils.ColorDetector import FindObjectColors
-from utils.ClassificationObject import ClassificationObject
-from utils.AnnotateFrame import annotate_frame, annotate_bbox_frame
-from utils.ClassificationObjectFunctions import create_classification_object, edit_classification_object, find_classification_object
+from utils.Metrics import Metrics
+from utils.StreamCapture import StreamCapture, stream_media
+from utils.ClassificationPipeline import classify_video
+from utils.BatchInference import BatchInferenceServer
+from utils.Detections import create_translation_table, resolve_allowed_classes
+from utils.ModelLoader import load_model, warm_up
+from utils.ModelCascade import cascade_min_conf
+from utils.MessageBroker import AcknowledgingRabbitMQ
+from utils.ResultPublisher import ResultPublisher
+from utils.Checkpoint import GracefulShutdown, VideoCheckpoint, ClassificationInterrupted, checkpoint_key
 
 # External imports
 import os
+import sys
 import cv2
-import time
-import json
 import torch
-import numpy as np
-from ultralytics import YOLO
-from uugai_python_dynamic_queue.MessageBrokers import RabbitMQ
+import threading
 from uugai_python_kerberos_vault.KerberosVault import KerberosVault
+import_time = time.perf_counter() - start_time_import
 
 # Following error is thrown: [W NNPACK.cpp:64] Could not initialize NNPACK! Reason: Unsupported hardware.
 # https://stackoverflow.com/questions/69711410/could-not-initialize-nnpack
@@ -31,10 +40,11 @@ from uugai_python_kerberos_vault.KerberosVault import KerberosVault
 var = VariableClass()
 
 # Initialize a message broker using the python_queue_reader package
+# A message is only acknowledged after its results are published, so it is redelivered if the worker stops before.
 if var.LOGGING:
     print('a) Initializing RabbitMQ')
 
-rabbitmq = RabbitMQ(
+rabbitmq = AcknowledgingRabbitMQ(
     queue_name=var.QUEUE_NAME,
     target_queue_name=var.TARGET_QUEUE_NAME,
     exchange=var.QUEUE_EXCHANGE,
@@ -42,6 +52,30 @@ rabbitmq = RabbitMQ(
     username=var.QUEUE_USERNAME,
     password=var.QUEUE_PASSWORD)
 
+# Depending on the PUBLISH_ASYNC parameter, the results are published by a separate thread with its own connection.
+# The publisher waits for the confirms of the broker and retries failed publishes, while the next video is classified.
+# The message of a video is acknowledged once its results are confirmed, or requeued if they could not be published.
+publisher = ResultPublisher(
+    host=var.QUEUE_HOST,
+    username=var.QUEUE_USERNAME,
+    password=var.QUEUE_PASSWORD,
+    exchange=var.QUEUE_EXCHANGE,
+    routing_key=var.TARGET_QUEUE_NAME,
+    serializer=var.RETURN_JSON_SERIALIZER,
+    batch_size=var.PUBLISH_BATCH_SIZE,
+    batch_wait_ms=var.PUBLISH_BATCH_WAIT_MS,
+    batch_max_bytes=var.PUBLISH_BATCH_MAX_BYTES,
+    compress_min_bytes=var.PUBLISH_COMPRESS_MIN_BYTES,
+    max_retries=var.PUBLISH_MAX_RETRIES,
+    max_pending=var.PUBLISH_MAX_PENDING) if var.TARGET_QUEUE_NAME != "" and var.PUBLISH_ASYNC and not var.LIVE_MODE else None
+
+# Initialize the metrics, measuring the duration of each pipeline stage.
+# The metrics are disabled, and have a negligible overhead, if both TIME_VERBOSE and METRICS are set to False.
+# Depending on the METRICS_PORT parameter, the histograms are exposed on http://0.0.0.0:METRICS_PORT/metrics.
+metrics = Metrics(enabled=var.TIME_VERBOSE or var.METRICS)
+if var.METRICS and var.METRICS_PORT > 0:
+    metrics.start_http_server(var.METRICS_PORT)
+
 # Initialize Kerberos Vault
 if var.LOGGING:
     print('b) Initializing Kerberos Vault')
@@ -50,301 +84,278 @@ kerberos_vault = KerberosVault(
     storage_access_key=var.STORAGE_ACCESS_KEY,
     storage_secret_key=var.STORAGE_SECRET_KEY)
 
-
-while True:
-
-    # Receive message from the queue, and retrieve the media from the Kerberos Vault utilizing the message information.
-    if var.LOGGING:
-        print('1) Receiving message from RabbitMQ')
-    message = rabbitmq.receive_message()
-    if message == []:
+# Initialize the yolo model once, before the first message is received, additionally use the device parameter to specify the device to run the model on.
+# Depending on the MODEL_DIR parameter, the model pre-baked in the image is used instead of downloading it.
+# A warm-up inference initializes the model, so the first video is not slowed down by it.
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+if var.LOGGING:
+    print(f'c) Loading model {var.MODEL_NAME}, using device: {device}')
+start_time_model_load = time.perf_counter()
+MODEL = load_model(var.MODEL_NAME, var.MODEL_DIR, device)
+model_load_time = time.perf_counter() - start_time_model_load
+warm_up_time = warm_up(MODEL)
+
+# Depending on the TIME_VERBOSE and METRICS parameters, the startup time is reported, split in the imports, model load and warm-up.
+metrics.observe('startup_import', import_time)
+metrics.observe('startup_model_load', model_load_time)
+metrics.observe('startup_warm_up', warm_up_time)
+if var.TIME_VERBOSE:
+    print(f'\t - Startup took: {round(time.perf_counter() - start_time_import, 1)} seconds.')
+    print(f'\t\t - {round(import_time, 2)}s for imports')
+    print(f'\t\t - {round(model_load_time, 2)}s for model load')
+    print(f'\t\t - {round(warm_up_time, 2)}s for warm-up')
+
+
+# Depending on the LIVE_MODE parameter, a live stream is classified continuously instead of the recordings from the queue.
+# Partial results are emitted per time window or when a track ends, to the target queue and/or the RETURN_JSON_SAVEPATH.
+if var.LIVE_MODE:
+    def emit_live_results(return_json: ReturnJSON):
+        if var.TARGET_QUEUE_NAME != "":
+            rabbitmq.send_message(return_json.serialize(
+                serializer=var.RETURN_JSON_SERIALIZER,
+                compact=var.RETURN_JSON_COMPACT,
+                precision=var.RETURN_JSON_PRECISION))
+        return_json.save_returnjson(
+            var.RETURN_JSON_SAVEPATH,
+            serializer=var.RETURN_JSON_SERIALIZER,
+            compact=var.RETURN_JSON_COMPACT,
+            precision=var.RETURN_JSON_PRECISION) if var.SAVE_RETURN_JSON else None
         if var.LOGGING:
-            print('No message received, waiting for 3 seconds')
-        time.sleep(3)
-        continue
-    if var.LOGGING:
-        print('2) Retrieving media from Kerberos Vault')
-    resp = kerberos_vault.retrieve_media(
-        message=message,
-        media_type='video',
-        media_savepath=var.MEDIA_SAVEPATH)
-
-    if var.TIME_VERBOSE:
-        start_time = time.time()
-        total_time_preprocessing = 0
-        total_time_class_prediction = 0
-        total_time_color_prediction = 0
-        total_time_processing = 0
-        total_time_postprocessing = 0
-
-        start_time_preprocessing = time.time()
-
-    # Perform object classification on the media
-    # initialise the yolo model, additionally use the device parameter to specify the device to run the model on.
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    MODEL = YOLO(var.MODEL_NAME).to(device)
-    if var.LOGGING:
-        print(f'3) Using device: {device}')
+            print(f"\t - Emitted {len(return_json.return_object['data']['details'])} objects for frames {return_json.return_object['data']['window']['startFrame']} to {return_json.return_object['data']['window']['endFrame']}.")
 
-    # Open video-capture/recording using the video-path. Throw FileNotFoundError if cap is unable to open.
+    from utils.LiveStream import classify_live_stream
+    if var.FIND_DOMINANT_COLORS:
+        from utils.ColorDetector import FindObjectColors
     if var.LOGGING:
-        print(f'4) Opening video file: {var.MEDIA_SAVEPATH}')
-    cap = cv2.VideoCapture(var.MEDIA_SAVEPATH)
-    if not cap.isOpened():
-        FileNotFoundError('Unable to open video file')
-
-    # Initialize the video-writer if the SAVE_VIDEO is set to True.
-    if var.SAVE_VIDEO:
-        fourcc = cv2.VideoWriter.fourcc(*'avc1')
-        video_out = cv2.VideoWriter(
-            filename=var.OUTPUT_MEDIA_SAVEPATH,
-            fourcc=fourcc,
-            fps=var.CLASSIFICATION_FPS,
-            frameSize=(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                       int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-        )
+        print(f'd) Classifying live stream: {var.LIVE_STREAM_URL}')
 
-    if var.FIND_DOMINANT_COLORS:
-        color_detector = FindObjectColors(
+    classify_live_stream(
+        model=MODEL,
+        var=var,
+        emit=emit_live_results,
+        color_detector=FindObjectColors(
             downsample_factor=0.7,
             min_clusters=var.MIN_CLUSTERS,
-            max_clusters=var.MAX_CLUSTERS,
-        )
-
-    # Initialize the classification process.
-    # 2 lists are initialized:
-        # Classification objects
-        # Additional list for easy access to the ids.
-    classification_object_list: list[ClassificationObject] = []
-    classification_object_ids: list[int] = []
-
-    # frame_number -> The current frame number. Depending on the frame_skip_factor this can make jumps.
-    # predicted_frames -> The number of frames, that were used for the prediction. This goes up by one each prediction iteration.
-    # frame_skip_factor is the factor by which the input video frames are skipped.
-    frame_number, predicted_frames = 0, 0
-    frame_skip_factor = int(cap.get(cv2.CAP_PROP_FPS) / var.CLASSIFICATION_FPS)
-
-    # Loop over the video frames, and perform object classification.
-    # The classification process is done until the counter reaches the MAX_NUMBER_OF_PREDICTIONS or the last frame is reached.
-    MAX_FRAME_NUMBER = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-    if var.LOGGING:
-        print(f'5) Classifying frames')
-    if var.TIME_VERBOSE:
-        total_time_preprocessing += time.time() - start_time_preprocessing
-        start_time_processing = time.time()
-    while (predicted_frames < var.MAX_NUMBER_OF_PREDICTIONS) and (frame_number < MAX_FRAME_NUMBER):
-
-        # Read the frame from the video-capture.
-        success, frame = cap.read()
-        if not success:
-            break
+            max_clusters=var.MAX_CLUSTERS) if var.FIND_DOMINANT_COLORS else None)
+    sys.exit(0)
 
-        # Keep the first frame in memory, if the CREATE_BBOX_FRAME is set to True.
-        # This is used to draw the tracking results on.
-        if var.CREATE_BBOX_FRAME and frame_number == 0:
-            bbox_frame = frame.copy()
-
-        # Check if the frame_number corresponds to a frame that should be classified.
-        if frame_number % frame_skip_factor == 0:
-
-            # Perform object classification on the frame.
-            # persist=True -> The tracking results are stored in the model.
-            # persist should be kept True, as this provides unique IDs for each detection.
-            # More information about the tracking results via https://docs.ultralytics.com/reference/engine/results/
-            if var.TIME_VERBOSE:
-                start_time_class_prediction = time.time()
-            results = MODEL.track(
-                source=frame,
-                persist=True,
-                verbose=False,
-                conf=var.CLASSIFICATION_THRESHOLD,
-                classes=var.ALLOWED_CLASSIFICATIONS)
-            if var.TIME_VERBOSE:
-                total_time_class_prediction += time.time() - start_time_class_prediction
-
-            # Check if the results are not None,
-            #  Otherwise, the postprocessing should not be done.
-            # Iterate over the detected objects and their masks.
-            if results is not None:
-                # Loop over boxes and masks.
-                # If no masks are found, meaning the model used is not a segmentation model, the mask is set to None.
-                for box, mask in zip(results[0].boxes, results[0].masks or [None] * len(results[0].boxes)):
-
-                    # Check if object are detected.
-                    # If no object is detected, the box.id will be None.
-                    # In this case, the inner-loop is broken. Not calling the object related functions.
-                    if box.id is None:
-                        break
-
-                    # Extract the object's id, name, confidence, and trajectory.
-                    # Also include the mask, if a segmentation model was used. Otherwise, the mask is set to None.
-                    # The crop_and_detect function will use trajectory instead if no mask is provided.
-                    object_id = int(box.id)
-                    object_name = translate(results[0].names[int(box.cls)])
-                    object_conf = float(box.conf)
-                    object_trajectory = box.xyxy.tolist()[0]
-                    object_mask = np.int32(
-                        mask.xy[0].tolist()) if mask is not None else None
-
-                    # Check if the id is already in the classification_object_ids list.
-                    # If it is, edit the classification object.
-                    # Otherwise, create a new classification object.
-                    if object_id in classification_object_ids:
-                        classification_object = find_classification_object(
-                            classification_object_list, object_id)
-
-                        # Calculate the dominant colors of the object if the FIND_DOMINANT_COLORS parameter is set to True.
-                        # And the object has been detected a multiple of COLOR_PREDICTION_INTERVAL times.
-                        if var.FIND_DOMINANT_COLORS and classification_object.occurences % var.COLOR_PREDICTION_INTERVAL == 0:
-                            if var.TIME_VERBOSE:
-                                start_time_color_prediction = time.time()
-                            main_colors_bgr, main_colors_hls, main_colors_str = color_detector.crop_and_detect(
-                                frame=frame,
-                                trajectory=object_trajectory,
-                                mask_polygon=object_mask)
-                            if var.TIME_VERBOSE:
-                                total_time_color_prediction += time.time() - start_time_color_prediction
-                        else:
-                            main_colors_bgr, main_colors_hls, main_colors_str = None, None, None
-
-                        edit_classification_object(
-                            id=object_id,
-                            object_name=object_name,
-                            object_conf=object_conf,
-                            trajectory=object_trajectory,
-                            frame_number=frame_number,
-                            classification_object_list=classification_object_list,
-                            colors_bgr=main_colors_bgr,
-                            colors_hls=main_colors_hls,
-                            colors_str=main_colors_str)
-
-                    else:
-                        # Calculate the dominant colors of the object if the FIND_DOMINANT_COLORS parameter is set to True.
-                        if var.FIND_DOMINANT_COLORS:
-                            if var.TIME_VERBOSE:
-                                start_time_color_prediction = time.time()
-                            main_colors_bgr, main_colors_hls, main_colors_str = color_detector.crop_and_detect(
-                                frame=frame,
-                                trajectory=object_trajectory,
-                                mask_polygon=object_mask)
-                            if var.TIME_VERBOSE:
-                                total_time_color_prediction += time.time() - start_time_color_prediction
-                        else:
-                            main_colors_bgr, main_colors_hls, main_colors_str = None, None, None
-
-                        classification_object = create_classification_object(
-                            id=object_id,
-                            first_object_name=object_name,
-                            first_object_conf=object_conf,
-                            first_trajectory=object_trajectory,
-                            first_frame=frame_number,
-                            frame_width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                            frame_height=int(
-                                cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-                            first_colors_bgr=main_colors_bgr,
-                            first_colors_hls=main_colors_hls,
-                            first_colors_str=main_colors_str)
-
-                        classification_object_ids.append(object_id)
-                        classification_object_list.append(
-                            classification_object)
-
-            # Depending on the SAVE_VIDEO or PLOT parameter, the frame is annotated.
-            # This is done using a custom annotation function.
-            if var.SAVE_VIDEO or var.PLOT:
-                annotated_frame = annotate_frame(
-                    frame=frame,
-                    frame_number=frame_number,
-                    classification_object_list=classification_object_list,
-                    min_distance=var.MIN_DISTANCE,
-                    min_detections=var.MIN_DETECTIONS)
-
-                # Show the annotated frame if the PLOT parameter is set to True.
-                cv2.imshow("YOLOv8 Tracking",
-                           annotated_frame) if var.PLOT else None
-                cv2.waitKey(1) if var.PLOT else None
-
-                # Write the annotated frame to the video-writer if the SAVE_VIDEO parameter is set to True.
-                video_out.write(annotated_frame) if var.SAVE_VIDEO else None
-
-            # Increase the frame_number and predicted_frames by one.
-            predicted_frames += 1
-        frame_number += 1
-
-    if var.TIME_VERBOSE:
-        total_time_processing += time.time() - start_time_processing
-        start_time_postprocessing = time.time()
-
-    # Depending on the CREATE_BBOX_FRAME parameter, the bbox_frame is annotated.
-    # This is done using a custom annotation function.
-    if var.CREATE_BBOX_FRAME:
+
+# On SIGTERM or SIGINT, e.g. when the pod is evicted, no new messages are received.
+# The current video is checkpointed and requeued if CHECKPOINT_DIR is set, otherwise it is finished first.
+shutdown = GracefulShutdown()
+
+
+def published_callback(rabbitmq: AcknowledgingRabbitMQ, delivery_tag: int, checkpoint: VideoCheckpoint = None):
+    """ Create the function called by the ResultPublisher, once the results of a message are published or could not be published.
+    The message is settled by the worker that received it, and the checkpoint is only removed if the results were published.
+
+    :param rabbitmq: The message broker that received the message.
+    :param delivery_tag: The delivery tag of the detached message.
+    :param checkpoint: The checkpoint of the video, if any.
+
+    """
+
+    def on_published(published: bool):
+        rabbitmq.settle_later(delivery_tag, published)
+        checkpoint.remove() if published and checkpoint is not None else None
+    return on_published
+
+
+def process_messages(var: VariableClass, rabbitmq: AcknowledgingRabbitMQ, model, metrics: Metrics, inference_server: BatchInferenceServer = None):
+    """ Receive and classify the messages from the queue, until a shutdown is requested.
+
+    :param var: The VariableClass object, containing the environment variables.
+    :param rabbitmq: The message broker of this worker, a connection can only be used by a single thread.
+    :param model: The loaded ultralytics YOLO model, it is reused for all messages. With batch inference this is the model of the inference server.
+    :param metrics: The metrics of this worker. With several workers a view of the shared metrics, so the per message totals are kept per worker.
+    :param inference_server: The BatchInferenceServer shared by the workers, if several videos are classified at once.
+
+    """
+
+    # Depending on the CASCADE_MODEL_NAME parameter, the larger model of the cascade is loaded once per worker.
+    # It has no state per video, so it is reused for all messages, and warmed up before the first message.
+    CASCADE_MODEL = load_model(var.CASCADE_MODEL_NAME, var.MODEL_DIR, device) if var.CASCADE_MODEL_NAME else None
+    metrics.observe('startup_warm_up', warm_up(CASCADE_MODEL, imgsz=var.CASCADE_IMGSZ)) if CASCADE_MODEL is not None else None
+
+    while not shutdown.requested:
+
+        # Receive message from the queue, and retrieve the media from the Kerberos Vault utilizing the message information.
+        if var.LOGGING:
+            print('1) Receiving message from RabbitMQ')
+        start_time_receive = metrics.start()
+        message = rabbitmq.receive_message()
+        if message == []:
+            if var.LOGGING:
+                print('No message received, waiting for 3 seconds')
+            time.sleep(3)
+            continue
+        metrics.start_message()
+        metrics.stop('receive', start_time_receive)
+
+        # Depending on the CHECKPOINT_DIR parameter, the classification state is checkpointed periodically.
+        # A redelivered message has the same checkpoint, so an interrupted video is resumed instead of classified from the start.
+        checkpoint = VideoCheckpoint(
+            directory=var.CHECKPOINT_DIR,
+            key=checkpoint_key(message),
+            interval=var.CHECKPOINT_INTERVAL) if var.CHECKPOINT_DIR else None
+
+        # The heartbeats of the connection are processed while classifying, as the message is only acknowledged afterwards.
+        def should_stop() -> bool:
+            rabbitmq.keep_alive()
+            return shutdown.requested and checkpoint is not None
+        start_time_video = metrics.start()
+
+        # Depending on the MEDIA_INPUT_MODE, the media is written to disk or streamed and decoded while it is received.
         if var.LOGGING:
-            print('6) Annotating bbox frame')
-        bbox_frame = annotate_bbox_frame(
-            bbox_frame=bbox_frame,
-            classification_object_list=classification_object_list)
-
-    # Depending on the CREATE_RETURN_JSON parameter, the detected objects are saved in a json file.
-    # Initialize the ReturnJSON object.
-    # This creates a json object with the correct structure.
-    if var.CREATE_RETURN_JSON:
+            print('2) Retrieving media from Kerberos Vault')
+        # In stream mode, the download overlaps with the decoding, only the request is measured.
+        with metrics.span('download'):
+            if var.MEDIA_INPUT_MODE == 'stream':
+                media_stream = stream_media(
+                    message=message,
+                    storage_uri=var.STORAGE_URI,
+                    storage_access_key=var.STORAGE_ACCESS_KEY,
+                    storage_secret_key=var.STORAGE_SECRET_KEY)
+            else:
+                resp = kerberos_vault.retrieve_media(
+                    message=message,
+                    media_type='video',
+                    media_savepath=var.MEDIA_SAVEPATH)
+
+        # Perform object classification on the media, using the model loaded at startup.
+        # With batch inference, the model of the inference server is used, and the video is tracked by its own client.
+        inference_client = inference_server.client() if inference_server is not None else None
         if var.LOGGING:
-            print('7) Creating ReturnJSON object')
-        return_json = ReturnJSON()
-
-        # Depending on the user preference, the detected objects are filtered.
-        # In this case, the objects are filtered based on the MIN_DETECTIONS parameters.
-        filtered_classification_object_list = []
-        for classification_object in classification_object_list:
-            if classification_object.occurences >= var.MIN_DETECTIONS:
-                filtered_classification_object_list.append(
-                    classification_object)
-                return_json.add_detected_object(classification_object)
+            print(f'3) Using device: {device}')
+
+        # Open video-capture/recording using the video-path. Throw FileNotFoundError if cap is unable to open.
+        # In stream mode the video is decoded while it is received, the MEDIA_SAVEPATH is only used if this is not possible.
+        if var.MEDIA_INPUT_MODE == 'stream':
+            if var.LOGGING:
+                print('4) Opening video stream')
+            cap = StreamCapture(
+                source=media_stream,
+                fallback_path=var.MEDIA_SAVEPATH)
+        else:
+            if var.LOGGING:
+                print(f'4) Opening video file: {var.MEDIA_SAVEPATH}')
+            cap = cv2.VideoCapture(var.MEDIA_SAVEPATH)
+        if not cap.isOpened():
+            FileNotFoundError('Unable to open video file')
+
+        # Classify the objects in the video.
+        # The annotated video, bbox frame and return json are created and saved depending on the environment variables.
+        # If the classification is interrupted by a shutdown, the message is requeued and resumed from the checkpoint.
+        try:
+            return_json, predicted_frames = classify_video(
+                cap=cap,
+                model=model,
+                var=var,
+                metrics=metrics,
+                checkpoint=checkpoint,
+                should_stop=should_stop,
+                inference_client=inference_client,
+                cascade_model=CASCADE_MODEL)
+        except ClassificationInterrupted as interruption:
+            if var.LOGGING:
+                print(f'\t - {interruption}, the message is requeued.')
+            rabbitmq.reject(requeue=True)
+            cap.release()
+            break
+        finally:
+            inference_client.close() if inference_client is not None else None
+
+        # Depending on the TARGET_QUEUE_NAME parameter, the resulting JSON-object is sent to the target queue.
+        #  This is done by adding the data to the original message.
+        # The message is serialized using the RETURN_JSON_SERIALIZER, optionally using the compact schema.
+        # With the publisher, only the submission is measured, and the message is detached to be settled once the publish is confirmed.
+        if var.TARGET_QUEUE_NAME != "":
+            start_time_publish = metrics.start()
+            return_message = return_json.to_message(
+                message,
+                serializer=var.RETURN_JSON_SERIALIZER,
+                compact=var.RETURN_JSON_COMPACT,
+                precision=var.RETURN_JSON_PRECISION)
+            if publisher is not None:
+                publisher.publish(return_message, on_published=published_callback(rabbitmq, rabbitmq.detach(), checkpoint))
+            else:
+                rabbitmq.send_message(return_message)
+            metrics.stop('publish', start_time_publish)
+        metrics.stop('video', start_time_video)
+
+        # The file of a streaming ReturnJSON is closed, as the results are serialized and saved.
+        return_json.close() if isinstance(return_json, StreamingReturnJSON) else None
+
+        # The message is acknowledged once the results are published, after which the checkpoint is no longer needed.
+        # A detached message is acknowledged by the next receive or keep-alive of this worker instead.
+        rabbitmq.ack()
+        checkpoint.remove() if checkpoint is not None and publisher is None else None
+
+        # Depending on the METRICS_JSON_PATH parameter, the histograms are periodically dumped to a json file.
+        if var.METRICS and var.METRICS_JSON_PATH:
+            metrics.dump_json(var.METRICS_JSON_PATH, interval=var.METRICS_DUMP_INTERVAL)
+
+        # Depending on the TIME_VERBOSE parameter, the time it took to classify the objects is printed.
+        # The total time of each measured stage is printed for this video.
+        if var.TIME_VERBOSE:
+            print(
+                f'\t - Classification took: {round(metrics.total("video"), 1)} seconds, @ {var.CLASSIFICATION_FPS} fps.')
+            for stage in metrics.ordered_stages():
+                if stage not in ['receive', 'video'] and not stage.startswith('startup'):
+                    print(f'\t\t - {round(metrics.total(stage), 2)}s for {stage.replace("_", " ")}')
+            # The frame count and file size are unknown for a stream, the number of read frames and received bytes are used instead.
+            if var.MEDIA_INPUT_MODE == 'stream':
+                print(f'\t - Original video: {round(cap.get(cv2.CAP_PROP_POS_FRAMES)/cap.get(cv2.CAP_PROP_FPS), 1)} seconds read, @ {round(cap.get(cv2.CAP_PROP_FPS), 1)} fps @ {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}. Streamed {round(cap.bytes_received/1024**2, 1)} MB')
+            else:
+                print(f'\t - Original video: {round(cap.get(cv2.CAP_PROP_FRAME_COUNT)/cap.get(cv2.CAP_PROP_FPS), 1)} seconds, @ {round(cap.get(cv2.CAP_PROP_FPS), 1)} fps @ {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}. File size of {round(os.path.getsize(var.MEDIA_SAVEPATH)/1024**2, 1)} MB')
+
+        # Close the video-capture and destroy all windows.
         if var.LOGGING:
-            print(f"\t - {len(classification_object_list)} objects where detected. Of which {len(filtered_classification_object_list)} objects where detected more than {var.MIN_DETECTIONS} times.")
-
-    # Depending on the SAVE_RETURN_JSON parameter, the return_json object is saved locally.
-    return_json.save_returnjson(
-        var.RETURN_JSON_SAVEPATH) if var.SAVE_RETURN_JSON else None
-
-    # Depending on the SAVE_BBOX_FRAME parameter, the bbox_frame is saved locally.
-    cv2.imwrite(var.BBOX_FRAME_SAVEPATH,
-                bbox_frame) if var.SAVE_BBOX_FRAME else None
-
-    if var.TIME_VERBOSE:
-        total_time_postprocessing += time.time() - start_time_postprocessing
-
-    # Depending on the TARGET_QUEUE_NAME parameter, the resulting JSON-object is sent to the target queue.
-    #  This is done by adding the data to the original message.
-    if var.TARGET_QUEUE_NAME != "":
-        message['operation'] = return_json.return_object['operation']
-        message['data'] = return_json.return_object['data']
-        return_message = json.dumps(message)
-        rabbitmq.send_message(return_message)
-
-    # Depending on the TIME_VERBOSE parameter, the time it took to classify the objects is printed.
-    if var.TIME_VERBOSE:
-        print(
-            f'\t - Classification took: {round(time.time() - start_time, 1)} seconds, @ {var.CLASSIFICATION_FPS} fps.')
-        print(
-            f'\t\t - {round(total_time_preprocessing, 2)}s for preprocessing and initialisation')
-        print(
-            f'\t\t - {round(total_time_processing, 2)}s for processing of which:')
-        print(
-            f'\t\t\t - {round(total_time_class_prediction, 2)}s for class prediction')
-        print(
-            f'\t\t\t - {round(total_time_color_prediction, 2)}s for color prediction')
-        print(
-            f'\t\t\t - {round(total_time_processing - total_time_class_prediction - total_time_color_prediction, 2)}s for other processing')
-        print(
-            f'\t\t - {round(total_time_postprocessing, 2)}s for postprocessing')
-        print(f'\t - Original video: {round(cap.get(cv2.CAP_PROP_FRAME_COUNT)/cap.get(cv2.CAP_PROP_FPS), 1)} seconds, @ {round(cap.get(cv2.CAP_PROP_FPS), 1)} fps @ {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}. File size of {round(os.path.getsize(var.MEDIA_SAVEPATH)/1024**2, 1)} MB')
-
-    # If the videowriter was active, the videowriter is released.
-    # Close the video-capture and destroy all windows.
+            print('8) Closing video capture')
+            print("\n\n")
+        cap.release()
+        cv2.destroyAllWindows() if var.PLOT else None
+
+
+# Depending on the CONCURRENT_VIDEOS parameter, several videos are classified at once, each by a worker thread with its own RabbitMQ connection.
+# The frames of the workers are detected in batches by a shared inference server, the tracking stays separate per video.
+# With a cascade, the frames are detected down to the lower end of the uncertainty band, so the uncertain detections are verified.
+if var.CONCURRENT_VIDEOS > 1:
+    inference_server = BatchInferenceServer(
+        model=MODEL,
+        max_batch_size=var.BATCH_MAX_SIZE,
+        max_wait_ms=var.BATCH_MAX_WAIT_MS,
+        conf=cascade_min_conf(var.CLASSIFICATION_THRESHOLD, var.CASCADE_UNCERTAINTY_BAND) if var.CASCADE_MODEL_NAME else var.CLASSIFICATION_THRESHOLD,
+        classes=resolve_allowed_classes(
+            var.ALLOWED_CLASSIFICATIONS,
+            MODEL.names,
+            create_translation_table(MODEL.names, var.TRANSLATED_CLASSIFICATIONS)))
+    brokers = [rabbitmq] + [AcknowledgingRabbitMQ(
+        queue_name=var.QUEUE_NAME,
+        target_queue_name=var.TARGET_QUEUE_NAME,
+        exchange=var.QUEUE_EXCHANGE,
+        host=var.QUEUE_HOST,
+        username=var.QUEUE_USERNAME,
+        password=var.QUEUE_PASSWORD) for _ in range(var.CONCURRENT_VIDEOS - 1)]
+    workers = [threading.Thread(target=process_messages, args=(var.for_worker(index), broker, MODEL, metrics.worker_view(), inference_server))
+               for index, broker in enumerate(brokers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    inference_server.close()
+else:
+    brokers = [rabbitmq]
+    process_messages(var, rabbitmq, MODEL, metrics)
+
+# Close the connections to RabbitMQ after a shutdown was requested.
+# The submitted results are published first, after which their messages are acknowledged or requeued.
+if var.LOGGING:
+    print('Shutting down')
+if publisher is not None:
+    publisher.close()
     if var.LOGGING:
-        print('8) Releasing video writer and closing video capture')
-        print("\n\n")
-    video_out.release() if var.SAVE_VIDEO else None
-    cap.release()
-    cv2.destroyAllWindows()
+        print(f'Published {publisher.published} results in {publisher.batches} messages, {publisher.failed} results could not be published')
+for broker in brokers:
+    broker.settle()
+    broker.close()
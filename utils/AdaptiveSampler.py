@@ -0,0 +1,108 @@
+from utils.ClassificationObject import ClassificationObject
+import math
+
+
+class AdaptiveSampler():
+    """ Class to decide which frames of a video are classified, adapting the sampling rate to the activity in the scene.
+    The rate is raised when the tracked objects move fast relative to their size, or when many objects are tracked,
+    and lowered to min_fps when the scene is empty or static. The rate is raised immediately, and lowered gradually.
+    A token bucket keeps the average rate within the budget: quiet stretches save inferences, which are spent on busy stretches.
+    Only the choice of frames changes, the frame numbers of the detections are the frame numbers of the video.
+
+    """
+
+    def __init__(self, video_fps: float, min_fps: float, max_fps: float, budget_fps: float, max_displacement: float = 0.25,
+                 crowd_size: int = 10, burst_seconds: float = 10, decay: float = 0.8):
+        """ Initialize the class with the given parameters.
+
+        :param video_fps: The fps of the video.
+        :param min_fps: The minimum sampling rate, used when the scene is empty or static.
+        :param max_fps: The maximum sampling rate, at most the fps of the video.
+        :param budget_fps: The average sampling rate over the video, this bounds the number of inferences per video.
+        :param max_displacement: The displacement between two samples, as a fraction of the box size, above which the rate is raised.
+        :param crowd_size: The number of tracked objects at which the rate is doubled.
+        :param burst_seconds: The number of seconds at budget_fps, that can be saved for a busy stretch.
+        :param decay: The factor by which the rate is lowered at most per sample.
+
+        """
+
+        self.video_fps = video_fps
+        # The sampling intervals in frames, the budget is kept within the range of the sampling rates.
+        self.min_interval = max(1, round(video_fps / max_fps))
+        self.max_interval = max(self.min_interval, round(video_fps / min_fps))
+        self.min_fps = video_fps / self.max_interval
+        self.max_fps = video_fps / self.min_interval
+        self.budget_fps = min(max(budget_fps, self.min_fps), self.max_fps)
+        self.max_displacement = max_displacement
+        self.crowd_size = crowd_size
+        self.burst = max(self.budget_fps * burst_seconds, 1)
+        self.decay = decay
+
+        # fps, interval -> The current sampling rate, and the corresponding interval in frames.
+        # tokens -> The inferences that can be spent above the budget, one token is added per 1 / budget_fps seconds of video.
+        # next_frame -> The frame number of the next sample.
+        # samples -> The number of classified frames.
+        self.fps = self.budget_fps
+        self.interval = min(max(round(video_fps / self.fps), self.min_interval), self.max_interval)
+        self.tokens = 1.0
+        self.last_frame = 0
+        self.next_frame = 0
+        self.samples = 0
+
+    def should_sample(self, frame_number: int) -> bool:
+        """ Check if the frame should be classified.
+
+        """
+
+        return frame_number >= self.next_frame
+
+    def object_speed(self, classification_object: ClassificationObject) -> float:
+        """ The speed of an object between its last two detections, in box sizes per second.
+
+        """
+
+        if classification_object.frozen or len(classification_object.trajectory) < 2 or len(classification_object.frames) < 2:
+            return 0.0
+        box = classification_object.trajectory[-1]
+        centroids = classification_object.trajectory_centroids
+        box_size = max(min(box[2] - box[0], box[3] - box[1]), 1)
+        frame_gap = max(classification_object.frames[-1] - classification_object.frames[-2], 1)
+        return math.dist(centroids[-1], centroids[-2]) / box_size / frame_gap * self.video_fps
+
+    def update(self, frame_number: int, frame_objects: list[ClassificationObject]):
+        """ Update the sampling rate with the objects detected in the classified frame, and schedule the next sample.
+
+        :param frame_number: The frame number of the classified frame.
+        :param frame_objects: The classification objects detected in this frame.
+
+        """
+
+        # Each sample costs a token, the tokens are refilled at the budget rate.
+        self.tokens = min(self.tokens + (frame_number - self.last_frame) / self.video_fps * self.budget_fps, self.burst) - 1
+        self.last_frame = frame_number
+        self.samples += 1
+
+        # The rate needed to keep the displacement between two samples below max_displacement, raised for crowded scenes.
+        # New objects are sampled at least at the budget rate, as the tracker confirms a new track on its next detection.
+        # An empty or static scene is sampled at min_fps.
+        motion_fps = max((self.object_speed(classification_object) for classification_object in frame_objects), default=0.0) / self.max_displacement
+        new_objects = any(len(classification_object.frames) < 2 for classification_object in frame_objects)
+        if motion_fps > self.min_fps or new_objects:
+            desired_fps = max(motion_fps, self.budget_fps) * (1 + len(frame_objects) / self.crowd_size)
+        else:
+            desired_fps = self.min_fps
+        self.fps = min(max(desired_fps, self.fps * self.decay, self.min_fps), self.max_fps)
+        self.interval = min(max(round(self.video_fps / self.fps), self.min_interval), self.max_interval)
+
+        # Without tokens left, the rate can't exceed the budget.
+        if self.tokens < 1:
+            self.fps = min(self.fps, self.budget_fps)
+            self.interval = min(max(self.interval, math.ceil(self.video_fps / self.budget_fps)), self.max_interval)
+        self.next_frame = frame_number + self.interval
+
+    def average_fps(self, frame_number: int) -> float:
+        """ The average sampling rate up to the given frame.
+
+        """
+
+        return self.samples / max(frame_number, 1) * self.video_fps
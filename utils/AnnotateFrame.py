@@ -1,12 +1,75 @@
 import cv2
 from utils.ClassificationObject import ClassificationObject
+import numpy as np
+import itertools
+import weakref
 import random
 import os
 
 
 
+def draw_object(frame, classification_object: ClassificationObject, color):
+    """ Draw the object's last bounding box, name, confidence score and colors on the frame.
+
+    :param frame: The frame to annotate.
+    :param classification_object: The classification object to draw.
+    :param color: The color of the bounding box and text.
+
+    """
+
+    last_trajectory = classification_object.trajectory[-1]
+
+    # Annotate the frame with the object's bounding box.
+    # Aswell as the object's name and confidence score.
+    cv2.rectangle(
+        img=frame,
+        pt1=(int(last_trajectory[0]), int(last_trajectory[1])),
+        pt2= (int(last_trajectory[2]), int(last_trajectory[3])),
+        color=color,
+        thickness= 2)
+
+    cv2.putText(
+        img=frame,
+        text=classification_object.object_name + ' ' + str(int(100 * classification_object.object_confs[-1])) + '%',
+        org=(int(last_trajectory[0]), int(last_trajectory[1]) - 10),
+        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+        fontScale=0.7,
+        color=color,
+        thickness=2)
+
+    if classification_object.object_colors_bgr != []:
+        for i, object_color in enumerate(classification_object.object_colors_bgr[-1]):
+            cv2.circle(
+                img=frame,
+                center=(int(last_trajectory[0]) + 10, int(last_trajectory[1]) - 40 - i*25),
+                radius=10,
+                color=object_color,
+                thickness=-1)
+
+            # Write the text on the rotated frame
+            cv2.putText(
+                img=frame,
+                text=str(classification_object.object_colors_str[-1][i]),
+                org=(int(last_trajectory[0]) + 30, int(last_trajectory[1]) - 35 - i*25),
+                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+                fontScale=0.7,
+                color=object_color,
+                thickness=2)
+
+
+def object_color(classification_object: ClassificationObject, min_distance, min_detections):
+    """ Get the annotation color of an object.
+    If the object is too far away or has too few detections, the color of the bounding box is red.
+    Otherwise, the color is green.
+
+    """
+
+    return (0, 255, 0) if classification_object.distance > min_distance and classification_object.occurences > min_detections else (0, 0, 255)
+
+
 def annotate_frame(frame, frame_number, classification_object_list: list[ClassificationObject], min_distance, min_detections):
     """ Annotate the frame with the classification objects.
+    This loops over all objects and redraws each trajectory segment, the FrameAnnotator class is faster for videos.
 
     :param frame: The frame to annotate.
     :param frame_number: The current frame number.
@@ -22,60 +85,107 @@ def annotate_frame(frame, frame_number, classification_object_list: list[Classif
     for classification_object in classification_object_list:
         if classification_object.frames[-1] == frame_number:
 
-            # If the object is too far away or has too few detections, the color of the bounding box is red.
-            # Otherwise, the color is green.
-            color = (0, 255, 0) if classification_object.distance > min_distance and len(classification_object.trajectory) > min_detections else (0, 0, 255)
-            last_trajectory = classification_object.trajectory[-1]
+            color = object_color(classification_object, min_distance, min_detections)
             trajectory_list_length = len(classification_object.trajectory_centroids)
 
             # Annotate the frame with the object's bounding box and trajectory.
-            # Aswell as the object's name and confidence score.
-            cv2.rectangle(
-                img=frame,
-                pt1=(int(last_trajectory[0]), int(last_trajectory[1])),
-                pt2= (int(last_trajectory[2]), int(last_trajectory[3])),
-                color=color,
-                thickness= 2)
+            draw_object(frame, classification_object, color)
 
-            cv2.putText(
-                img=frame,
-                text=classification_object.object_name + ' ' + str(int(100 * classification_object.object_confs[-1])) + '%',
-                org=(int(last_trajectory[0]), int(last_trajectory[1]) - 10),
-                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                fontScale=0.7,
-                color=color,
-                thickness=2)
-            
-            if classification_object.object_colors_bgr != []:
-                for i, object_color in enumerate(classification_object.object_colors_bgr[-1]):
-                    cv2.circle(
-                        img=frame,
-                        center=(int(last_trajectory[0]) + 10, int(last_trajectory[1]) - 40 - i*25),
-                        radius=10,
-                        color=object_color,
-                        thickness=-1)
-
-                    # Write the text on the rotated frame
-                    cv2.putText(
-                        img=frame,
-                        text=str(classification_object.object_colors_str[-1][i]), 
-                        org=(int(last_trajectory[0]) + 30, int(last_trajectory[1]) - 35 - i*25), 
-                        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                        fontScale=0.7,
-                        color=object_color,
-                        thickness=2)
-
-            
             for i in range(1, trajectory_list_length):
                 cv2.line(img=frame,
                         pt1=list(map(int, classification_object.trajectory_centroids[i-1])),
                         pt2=list(map(int, classification_object.trajectory_centroids[i])),
                         color = color,
                         thickness=2)
-                
+
     return frame
 
 
+class FrameAnnotator():
+    """ Class to annotate the frames of a video with the classification objects.
+    Only the objects detected in the current frame are drawn, and each trajectory is drawn as a single polyline
+    over an array of points that grows with the trajectory, so the annotation cost depends on the visible objects only.
+
+    """
+
+    def __init__(self, min_distance, min_detections):
+        """ Initialize the class with the given parameters.
+
+        :param min_distance: The minimum distance to be considered.
+        :param min_detections: The minimum amount of detections to be considered.
+
+        """
+
+        self.min_distance = min_distance
+        self.min_detections = min_detections
+
+        # The trail points of each object, as an int32 array with spare capacity, and the number of used points.
+        # The objects are weakly referenced, so the trails are dropped together with the objects.
+        self.trails = weakref.WeakKeyDictionary()
+
+        # The rank of each object in the classification object list, the objects are drawn in this order, in the same way as annotate_frame.
+        # New objects are appended to the list in the frame they are first detected, so the order in which they are first seen is their list order.
+        self.ranks = weakref.WeakKeyDictionary()
+        self.next_rank = itertools.count()
+
+    def register(self, classification_object_list: list[ClassificationObject]):
+        """ Rank the existing objects in their list order, e.g. after the objects are restored from a checkpoint.
+
+        :param classification_object_list: The list of classification objects.
+
+        """
+
+        for classification_object in classification_object_list:
+            if classification_object not in self.ranks:
+                self.ranks[classification_object] = next(self.next_rank)
+
+    def trail_points(self, classification_object: ClassificationObject):
+        """ Get the trail points of an object, only the centroids added since the previous frame are converted.
+
+        :param classification_object: The classification object.
+        :returns: An int32 array of shape (n, 2), containing the centroids of the object.
+
+        """
+
+        points, count = self.trails.get(classification_object, (np.empty((16, 2), dtype=np.int32), 0))
+        centroids = classification_object.trajectory_centroids
+        if len(centroids) > count:
+            # Grow the array by doubling the capacity, to keep the amortized cost per point constant.
+            if len(centroids) > len(points):
+                grown_points = np.empty((max(2 * len(points), len(centroids)), 2), dtype=np.int32)
+                grown_points[:count] = points[:count]
+                points = grown_points
+            points[count:len(centroids)] = np.asarray(centroids[count:], dtype=np.float64).astype(np.int32)
+            count = len(centroids)
+            self.trails[classification_object] = (points, count)
+        return points[:count]
+
+    def annotate(self, frame, frame_objects: list[ClassificationObject]):
+        """ Annotate the frame with the objects detected in this frame.
+
+        :param frame: The frame to annotate.
+        :param frame_objects: The classification objects detected in this frame.
+
+        """
+
+        for classification_object in frame_objects:
+            if classification_object not in self.ranks:
+                self.ranks[classification_object] = next(self.next_rank)
+
+        # Overlapping objects are drawn in the order of the classification object list, not in the order of the detections.
+        for classification_object in sorted(frame_objects, key=self.ranks.__getitem__):
+            color = object_color(classification_object, self.min_distance, self.min_detections)
+            draw_object(frame, classification_object, color)
+            cv2.polylines(
+                img=frame,
+                pts=[self.trail_points(classification_object)],
+                isClosed=False,
+                color=color,
+                thickness=2)
+
+        return frame
+
+
 def annotate_bbox_frame(bbox_frame, classification_object_list: list[ClassificationObject]):
     """ Annotate the frame with the classification objects.
 
@@ -91,7 +201,7 @@ def annotate_bbox_frame(bbox_frame, classification_object_list: list[Classificat
     for classification_object in classification_object_list:
 
         min_detections = int(os.getenv('MIN_DETECTIONS'))
-        if len(classification_object.trajectory) >= min_detections:
+        if classification_object.occurences >= min_detections:
 
             first_trajectory = classification_object.trajectory[0]
             random_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
@@ -0,0 +1,206 @@
+from utils.Detections import Detections
+import time
+import queue
+import threading
+import numpy as np
+
+
+class InferenceRequest():
+    """ A frame submitted to the BatchInferenceServer, and its result once the batch is predicted.
+
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.submit_time = time.perf_counter()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class BatchInferenceServer():
+    """ Class to batch the frames of several concurrent video pipelines into a single model call.
+    The pipelines submit single frames from their own threads, a batch is predicted once max_batch_size frames are collected,
+    every connected pipeline has submitted a frame, or the oldest frame has waited max_wait_ms milliseconds.
+    Only the detection is batched, each pipeline tracks the detections with its own tracker using a BatchInferenceClient.
+
+    """
+
+    def __init__(self, model, max_batch_size: int = 8, max_wait_ms: float = 10, conf: float = 0.3, classes: list[int] = None):
+        """ Initialize the class with the given parameters, and start the inference thread.
+
+        :param model: The ultralytics YOLO model used for detection, it is only called from the inference thread.
+        :param max_batch_size: The maximum number of frames in a batch.
+        :param max_wait_ms: The maximum time in milliseconds a frame waits for other frames, before its batch is predicted.
+        :param conf: The confidence threshold of the detections.
+        :param classes: The class indices to detect, if None all classes are detected.
+
+        """
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.conf = conf
+        self.classes = classes
+
+        # clients -> The number of connected pipelines, a batch can't get larger as each pipeline waits for its result.
+        # batches, batched_frames -> The number of predicted batches and frames, the average batch size is their ratio.
+        self.clients = 0
+        self.batches = 0
+        self.batched_frames = 0
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def predict(self, frame):
+        """ Detect the objects in a frame, this blocks until the batch containing the frame is predicted.
+
+        :param frame: The frame to detect.
+        :returns: The ultralytics Results of the frame.
+
+        """
+
+        request = InferenceRequest(frame)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def collect_batch(self, first_request: InferenceRequest) -> list[InferenceRequest]:
+        """ Collect the frames of a batch, starting with the given request.
+
+        """
+
+        batch = [first_request]
+        deadline = first_request.submit_time + self.max_wait
+        while len(batch) < min(self.max_batch_size, max(self.clients, 1)):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def run(self):
+        """ The inference thread, predicting the batches until the server is closed.
+
+        """
+
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = self.collect_batch(request)
+            try:
+                results = self.model.predict(
+                    source=[request.frame for request in batch],
+                    conf=self.conf,
+                    classes=self.classes,
+                    verbose=False)
+                for request, frame_results in zip(batch, results):
+                    request.results = frame_results
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+            self.batches += 1
+            self.batched_frames += len(batch)
+            for request in batch:
+                request.done.set()
+
+    def client(self, tracker: str = 'bytetrack.yaml'):
+        """ Connect a pipeline to the server, a client should be created per video.
+
+        :param tracker: The ultralytics tracker configuration.
+
+        """
+
+        with self.lock:
+            self.clients += 1
+        return BatchInferenceClient(self, tracker)
+
+    def disconnect(self):
+        """ Disconnect a pipeline, called when a client is closed.
+
+        """
+
+        with self.lock:
+            self.clients -= 1
+
+    def close(self):
+        """ Stop the inference thread, after the submitted frames are predicted.
+
+        """
+
+        self.requests.put(None)
+        self.thread.join()
+
+
+class BatchInferenceClient():
+    """ Class to track the objects of a single video, using the batched detections of a BatchInferenceServer.
+    Each client has its own tracker, so the tracking of concurrent videos stays separate.
+
+    """
+
+    def __init__(self, server: BatchInferenceServer, tracker: str = 'bytetrack.yaml'):
+        """ Initialize the class with the given parameters.
+
+        :param server: The BatchInferenceServer predicting the frames.
+        :param tracker: The ultralytics tracker configuration.
+
+        """
+
+        # The ultralytics trackers are only imported when batch inference is used.
+        from ultralytics.trackers.basetrack import BaseTrack
+        from ultralytics.trackers.byte_tracker import BYTETracker
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        self.server = server
+        # The track ids are global in ultralytics, and reset when a tracker is created.
+        # The counter is kept, so the ids of the other videos that are classified at the same time stay unique.
+        track_count = BaseTrack._count
+        self.tracker = BYTETracker(args=IterableSimpleNamespace(**yaml_load(check_yaml(tracker))), frame_rate=30)
+        BaseTrack._count = max(BaseTrack._count, track_count)
+
+    def track(self, frame) -> Detections:
+        """ Detect the objects in the frame using the server, and track them.
+
+        :param frame: The frame to detect and track.
+        :returns: A Detections object of the tracked objects, or None if no objects are tracked.
+
+        """
+
+        results = self.server.predict(frame)
+        boxes = results.boxes.cpu().numpy()
+        # In the same way as YOLO.track, the tracker is not updated without detections.
+        if len(boxes) == 0:
+            return None
+        tracks = self.tracker.update(boxes, frame)
+        if len(tracks) == 0:
+            return None
+
+        # The tracks contain x1, y1, x2, y2, track id, confidence, class and the index of the detection.
+        # The index is used to select the masks of the tracked detections, if a segmentation model is used.
+        return Detections(
+            ids=tracks[:, 4].astype(np.int64),
+            classes=tracks[:, 6].astype(np.int64),
+            confs=tracks[:, 5].astype(np.float64),
+            xyxy=tracks[:, :4].astype(np.float64),
+            masks=results.masks.data[tracks[:, 7].astype(np.int64)] if results.masks is not None else None,
+            frame_shape=results.orig_shape,
+            names=results.names)
+
+    def close(self):
+        """ Disconnect from the server, once the video is classified.
+
+        """
+
+        self.server.disconnect()
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import pickle
+import signal
+import hashlib
+import cv2
+
+
+class ClassificationInterrupted(Exception):
+    """ Raised when the classification of a video is interrupted by a shutdown, after its state is checkpointed.
+
+    """
+
+
+class GracefulShutdown():
+    """ Class to handle SIGTERM and SIGINT, e.g. when a pod is evicted.
+    The first signal only sets the requested flag, so the current video can be finished or checkpointed.
+    The default handlers are restored, so a second signal stops the worker immediately.
+
+    """
+
+    def __init__(self):
+        """ Initialize the class, and install the signal handlers.
+
+        """
+
+        self.requested = False
+        signal.signal(signal.SIGTERM, self.request)
+        signal.signal(signal.SIGINT, self.request)
+
+    def request(self, signum, frame):
+        """ The signal handler, which requests the shutdown.
+
+        """
+
+        print(f'Received {signal.Signals(signum).name}, shutting down after the current video')
+        self.requested = True
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+
+def checkpoint_key(message: dict) -> str:
+    """ Create the key of the checkpoint of a message, a redelivered message has the same key.
+
+    :param message: The message received from the queue.
+
+    """
+
+    return hashlib.sha1(json.dumps(message, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class VideoCheckpoint():
+    """ Class to periodically checkpoint the classification state of a video to local disk.
+    The classification objects, tracker state and frame position are pickled, so a restarted worker can resume the video.
+
+    """
+
+    def __init__(self, directory: str, key: str, interval: float = 60):
+        """ Initialize the class with the given parameters.
+
+        :param directory: The directory the checkpoints are saved in, this should survive a restart of the worker.
+        :param key: The key of the checkpoint, e.g. created using checkpoint_key.
+        :param interval: The minimum time in seconds between two checkpoints.
+
+        """
+
+        self.path = os.path.join(directory, f'{key}.pkl')
+        # The details of the finalized objects of a StreamingReturnJSON, these are kept next to the checkpoint.
+        self.results_path = os.path.join(directory, f'{key}.results')
+        self.interval = interval
+        self.last_save_time = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def due(self) -> bool:
+        """ Check if the interval since the last checkpoint has passed.
+
+        """
+
+        return time.monotonic() - self.last_save_time >= self.interval
+
+    def save(self, state: dict):
+        """ Save the state, it is written to a temporary file first so a crash never leaves a partial checkpoint.
+
+        :param state: The classification state, which should be picklable.
+
+        """
+
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+        self.last_save_time = time.monotonic()
+
+    def load(self) -> dict:
+        """ Load the state of a previous run, if a checkpoint exists.
+        :returns: The state, or None if no (readable) checkpoint exists.
+
+        """
+
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as error:
+            print(f'Unable to load checkpoint {self.path}: {error}')
+            return None
+
+    def remove(self):
+        """ Remove the checkpoint, once the results of the video are published.
+
+        """
+
+        for path in [self.path, self.results_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_tracker_state(model, detector=None) -> tuple[list, int]:
+    """ Get the tracker state to checkpoint, the trackers and the global track id counter of ultralytics.
+
+    :param model: The ultralytics YOLO model used for tracking.
+    :param detector: The TiledDetector or BatchInferenceClient used for tracking, if None the trackers of the model are used.
+    :returns: A tuple (trackers, track_count), trackers is None if no frame has been tracked yet.
+
+    """
+
+    from ultralytics.trackers.basetrack import BaseTrack
+
+    trackers = [detector.tracker] if detector is not None else getattr(model.predictor, 'trackers', None)
+    return trackers, BaseTrack._count
+
+
+def restore_tracker_state(model, trackers: list, track_count: int, detector=None):
+    """ Restore the checkpointed tracker state, so the restored objects keep their ids.
+
+    :param model: The ultralytics YOLO model used for tracking.
+    :param trackers: The checkpointed trackers, as returned by get_tracker_state.
+    :param track_count: The checkpointed global track id counter.
+    :param detector: The TiledDetector or BatchInferenceClient used for tracking, if None the trackers of the model are used.
+
+    """
+
+    from ultralytics.trackers.basetrack import BaseTrack
+
+    if trackers is not None and detector is not None:
+        detector.tracker = trackers[0]
+    elif trackers is not None and hasattr(model.predictor, 'trackers'):
+        model.predictor.trackers = trackers
+    elif trackers is not None:
+        # The predictor and its trackers are only created by the first YOLO.track call.
+        # This callback runs before the tracker callback of ultralytics, which keeps existing trackers when persist=True.
+        def on_predict_start(predictor):
+            if not hasattr(predictor, 'trackers'):
+                predictor.trackers = trackers
+                predictor.vid_path = [None] * len(trackers)
+        model.add_callback('on_predict_start', on_predict_start)
+
+    # The track ids are global in ultralytics, and reset when a tracker is created.
+    # The counter is never decreased, as other videos can be classified at the same time.
+    BaseTrack._count = max(BaseTrack._count, track_count)
+
+
+def seek_frame(cap, frame_number: int):
+    """ Seek the video to the given frame, so the next read returns this frame.
+    A stream can't be seeked, in which case the frames up to the given frame are read and dropped.
+
+    :param cap: The opened video, a cv2.VideoCapture or StreamCapture object.
+    :param frame_number: The frame to seek to.
+
+    """
+
+    if hasattr(cap, 'set') and cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number):
+        return
+    for _ in range(frame_number):
+        success, _ = cap.read()
+        if not success:
+            break
@@ -1,3 +1,4 @@
+from utils.Thumbnail import crop_size_score, sharpness_score, extract_thumbnail
 from collections import Counter
 import math
 from itertools import chain
@@ -24,17 +25,17 @@ class ClassificationObject:
         :param object_names: List of predicted object names, coupled to a confidence score in object_confs.
         :param object_confs: List of Confidence scores, coupled to an object_name in object_names.
                              Two above variables will be used for a final classification name.
-        :param distance: Total distance object travelled on screen, measured in pixels.
-        :param static_distance: Distance object travelled from first centroid to last centroid, measured in pixels.
-        :param is_static: Boolean value, True if object is static, False if object is moving.
+        :param distance: Total distance object travelled on screen, measured in pixels. Calculated lazily.
+        :param static_distance: Distance object travelled from first centroid to last centroid, measured in pixels. Calculated lazily.
+        :param is_static: Boolean value, True if object is static, False if object is moving. Calculated lazily.
         :param occurences: Amount of occurences the object makes, equals the length of :param frames.
-        :param trajectory: List[List[int]] containing 2D coordinates for 2 diagonally opposite corners of the object's bounding box for each frame.
+        :param trajectory: Array of shape (n, 4) containing 2D coordinates for 2 diagonally opposite corners of the object's bounding box for each frame.
                            [[x11, y11, x12, y12], [x21, y21, x22, y22],
                                [x31, y31, x32, y32], [...], ...]
                            x11: frame -> 1, x-coordinate of corner -> 1
                            x12: frame -> 1, x-coordinate of corner -> 2
                            x21: frame -> 2, x-coordinate of corner -> 1
-        :param trajectory_centroids: List[List[int]] containing 2D coordinates for the centroid of the object's bounding box for each frame.
+        :param trajectory_centroids: Array of shape (n, 2) containing 2D coordinates for the centroid of the object's bounding box for each frame.
                                      [[x1, y1], [x2, y2], [x3, y3], ...]
                                      x1: frame -> 1, x-coordinate of centroid
                                      x2: frame -> 2, x-coordinate of centroid
@@ -42,6 +43,10 @@ class ClassificationObject:
         :param object_colors_hls: Primary colors of the object in HLS format.
         :param object_colors_str: Primary colors of the object mapped to string.
 
+        :param thumbnail: The best crop of the object so far, downscaled to a thumbnail. Only one crop is kept per object.
+        :param thumbnail_score: The quality score of the thumbnail, the product of confidence, size and sharpness.
+        :param thumbnail_frame: Frame number the thumbnail was cropped from.
+
         :param self.valid = True: Unused (inherited from the YOLOv3 pipeline)
         :param self.w = 0: Unused (inherited from the YOLOv3 pipeline)
         :param self.x = 0: Unused (inherited from the YOLOv3 pipeline)
@@ -60,12 +65,28 @@ class ClassificationObject:
         self.object_names = [first_object_name]
         self.object_name = first_object_name
         self.object_confs = [first_object_conf]
-        self.distance = 0
-        self.static_distance = 0
-        self.is_static = True
+        # The names verified by the larger model of a cascade, these take precedence in the name voting.
+        self.verified_name_counts = Counter()
         self.occurences = 1
-        self.trajectory = [first_trajectory]
-        self.trajectory_centroids = [self.find_centroid(first_trajectory)]
+
+        # The trajectory and centroids are stored in arrays with spare capacity, the capacity is doubled when full.
+        # The distance is calculated lazily over the centroids added since the previous calculation.
+        # The trajectory is run-length compressed, each row is repeated _trajectory_repeats times.
+        # Only frozen objects repeat rows, when a detection has exactly the same bounding box as the previous detection.
+        self._trajectory = np.empty((16, 4), dtype=np.float64)
+        self._trajectory_centroids = np.empty((16, 2), dtype=np.float64)
+        self._trajectory_repeats = np.empty(16, dtype=np.int64)
+        self._trajectory_length = 0
+        self._distance = 0.0
+        self._distance_length = 1
+        self.min_static_distance = int(os.getenv('MIN_STATIC_DISTANCE'))
+
+        # frozen -> True if the object has been stationary for a number of detections, see update_frozen.
+        # stationary_centroid -> The centroid the object is stationary around, stationary_count -> The number of detections since.
+        self.frozen = False
+        self.stationary_centroid = None
+        self.stationary_count = 0
+        self.add_trajectory(first_trajectory)
 
         self.object_colors_bgr = [
             first_object_colors_bgr] if first_object_colors_bgr is not None else []
@@ -75,6 +96,11 @@ class ClassificationObject:
             first_object_colors_str] if first_object_colors_str is not None else []
         self.object_color_str = []
 
+        # Instance variables for the best crop, only filled when thumbnails are created.
+        self.thumbnail = None
+        self.thumbnail_score = 0
+        self.thumbnail_frame = None
+
         # Instance variables inherited from the YOLOv3 pipeline, have no use here.
         self.valid = True
         self.w = 0
@@ -108,9 +134,19 @@ class ClassificationObject:
         """
 
         # Count the instances of each classification name.
-        word_counts = Counter(self.object_names)
         # object name with most instances becomes the 'best' classification name.
-        self.object_name = word_counts.most_common(1)[0][0]
+        # If the object is verified by the larger model of a cascade, only the verified names are voted on.
+        name_counts = self.verified_name_counts or Counter(self.object_names)
+        self.object_name = name_counts.most_common(1)[0][0]
+
+    def add_verified_name(self, verified_name: str):
+        """ Add a name verified by the larger model of a cascade, these names take precedence in the name voting.
+        :param verified_name: The verified object name.
+
+        """
+
+        self.verified_name_counts[verified_name] += 1
+        self.edit_object_name()
 
     def add_object_conf(self, new_object_conf: float):
         """ Add the new object's confidence score to the object_confs list.
@@ -122,19 +158,68 @@ class ClassificationObject:
         self.object_confs.append(new_object_conf)
 
     def add_trajectory(self, new_bbox_coordinates: list[float]):
-        """ Add bounding box coordinates to the trajectory list.
+        """ Add bounding box coordinates to the trajectory array, and its centroid to the trajectory-centroids array.
+        :param new_bbox_coordinates: The bbox coordinates of the detected object's position
+                                     [x11, y11, x12, y12]
+
+        """
+
+        # Double the capacity of the arrays when full, to keep the amortized cost per detection constant.
+        if self._trajectory_length == len(self._trajectory):
+            self._trajectory = np.concatenate([self._trajectory, np.empty_like(self._trajectory)])
+            self._trajectory_centroids = np.concatenate([self._trajectory_centroids, np.empty_like(self._trajectory_centroids)])
+            self._trajectory_repeats = np.concatenate([self._trajectory_repeats, np.empty_like(self._trajectory_repeats)])
+
+        # Append to objects trajectory and trajectory_centroids arrays.
+        centroid = self.find_centroid(new_bbox_coordinates)
+        self._trajectory[self._trajectory_length] = new_bbox_coordinates
+        self._trajectory_centroids[self._trajectory_length] = centroid
+        self._trajectory_repeats[self._trajectory_length] = 1
+        self._trajectory_length += 1
+
+        # Count the detections the object stays within MIN_STATIC_DISTANCE of the centroid where it stopped.
+        if self.stationary_centroid is not None and math.dist(centroid, self.stationary_centroid) <= self.min_static_distance:
+            self.stationary_count += 1
+        else:
+            self.stationary_centroid = centroid
+            self.stationary_count = 1
+
+    def update_frozen(self, freeze_detections: int):
+        """ Freeze the object if it has been stationary for freeze_detections detections.
+        :param freeze_detections: The number of detections an object should be stationary before it is frozen, if 0 objects are never frozen.
+
+        """
+
+        if freeze_detections > 0 and self.stationary_count >= freeze_detections:
+            self.frozen = True
+
+    def add_frozen_detection(self, new_object_name: str, new_object_conf: float, new_bbox_coordinates: list[float], new_frame_number: int) -> bool:
+        """ Add a detection of a frozen object, the name, confidence, frame number and occurences are updated as for any detection.
+        So frames, object_names and object_confs keep one element per detection.
+        The bounding box is added to the trajectory, if it is identical to the previous bounding box only the last row is repeated.
+        The trajectory is therefore lossless, only the colors and thumbnail are not updated while frozen.
+        If the object moved beyond MIN_STATIC_DISTANCE of where it stopped, it is unfrozen and the detection is not added.
+        :param new_object_name: The name of the detection.
+        :param new_object_conf: The confidence score of the detection.
         :param new_bbox_coordinates: The bbox coordinates of the detected object's position
                                      [x11, y11, x12, y12]
+        :param new_frame_number: The new number of the frame where object is also detected.
+        :returns: True if the detection is added, False if the object is unfrozen.
 
         """
 
-        # Append to objects trajectory list.
-        self.trajectory.append(new_bbox_coordinates)
+        if math.dist(self.find_centroid(new_bbox_coordinates), self.stationary_centroid) > self.min_static_distance:
+            self.frozen = False
+            return False
 
-        # Calculate centroid information about bbox.
-        centroid_coordinates = self.find_centroid(new_bbox_coordinates)
-        # Add centroid coordinates to the trajectory_centroids list.
-        self.add_trajectory_centroid(centroid_coordinates)
+        self.add_object_name(new_object_name)
+        self.add_object_conf(new_object_conf)
+        if np.array_equal(self._trajectory[self._trajectory_length - 1], new_bbox_coordinates):
+            self._trajectory_repeats[self._trajectory_length - 1] += 1
+        else:
+            self.add_trajectory(new_bbox_coordinates)
+        self.add_frame_number(new_frame_number)
+        return True
 
     def find_centroid(self, bbox_coordinates: list[float]) -> list[float]:
         """ Calculate centroid information about bbox.
@@ -146,17 +231,37 @@ class ClassificationObject:
 
         return [(bbox_coordinates[0]+bbox_coordinates[2])/2, (bbox_coordinates[1]+bbox_coordinates[3])/2]
 
-    def add_trajectory_centroid(self, new_trajectory_centroid: list[float]):
-        """ Add centroid coordinates to the trajectory-centroids list.
-        :param new_trajectory_centroid: The centroid coordinates of the detected object's position
-                                     [x11, y11, x12, y12]
+    @property
+    def trajectory(self) -> np.ndarray:
+        """ The bounding box coordinates, as an (n, 4) array view. Identical consecutive bounding boxes of a frozen object are stored once.
+
+        """
+
+        return self._trajectory[:self._trajectory_length]
+
+    @property
+    def trajectory_centroids(self) -> np.ndarray:
+        """ The centroids of the bounding boxes, as an (n, 2) array view. Identical consecutive bounding boxes of a frozen object are stored once.
+
+        """
+
+        return self._trajectory_centroids[:self._trajectory_length]
+
+    @property
+    def full_trajectory(self) -> np.ndarray:
+        """ The bounding box coordinates of each detection, as an (occurences, 4) array, with the repeated detections expanded.
+
+        """
+
+        return np.repeat(self.trajectory, self._trajectory_repeats[:self._trajectory_length], axis=0)
+
+    @property
+    def full_trajectory_centroids(self) -> np.ndarray:
+        """ The centroids of the bounding box of each detection, as an (occurences, 2) array, with the repeated detections expanded.
 
         """
 
-        # Append to objects trajectory_centroid list.
-        self.trajectory_centroids.append(new_trajectory_centroid)
-        self.add_distance()
-        self.edit_static_distance()
+        return np.repeat(self.trajectory_centroids, self._trajectory_repeats[:self._trajectory_length], axis=0)
 
     def add_occurence(self):
         """ +1 the occurences.
@@ -165,44 +270,38 @@ class ClassificationObject:
 
         self.occurences += 1
 
-    def add_distance(self):
-        """ Calculate the Euclidean distance travelled from previous centroid to new centroid. Add to total distance travelled.
+    @property
+    def distance(self) -> float:
+        """ The total Euclidean distance travelled between consecutive centroids.
+        Only the centroids added since the previous call are taken into account, in a single vectorized pass.
+        The distances are added one by one in order using cumsum, so the total is identical to adding them per detection.
 
         """
 
-        previous_centroid = self.trajectory_centroids[-2]
-        new_centroid = self.trajectory_centroids[-1]
+        if self._distance_length < self._trajectory_length:
+            steps = np.diff(self._trajectory_centroids[self._distance_length - 1:self._trajectory_length], axis=0)
+            distances = np.sqrt(steps[:, 0] ** 2 + steps[:, 1] ** 2)
+            self._distance = float(np.cumsum(np.concatenate([[self._distance], distances]))[-1])
+            self._distance_length = self._trajectory_length
+        return self._distance
 
-        # Calculate the Euclidean distance travelled from previous centroid to new centroid.
-        new_distance = math.sqrt(
-            (new_centroid[0]-previous_centroid[0])**2 + (new_centroid[1]-previous_centroid[1])**2)
-        # Add newly calculated distance to total distance travelled.
-        self.distance += new_distance
-
-    def edit_static_distance(self):
-        """ Calculate the Euclidean distance travelled from first centroid to last centroid. Add to total distance travelled.
+    @property
+    def static_distance(self) -> float:
+        """ The Euclidean distance travelled from first centroid to last centroid.
 
         """
 
-        first_centroid = self.trajectory_centroids[0]
-        last_centroid = self.trajectory_centroids[-1]
-
-        # Calculate the Euclidean distance travelled from first centroid to last centroid.
-        static_distance = math.sqrt(
-            (last_centroid[0]-first_centroid[0])**2 + (last_centroid[1]-first_centroid[1])**2)
-        # Add newly calculated distance to total distance travelled.
-        self.static_distance = static_distance
-        self.edit_is_static()
+        first_centroid = self._trajectory_centroids[0]
+        last_centroid = self._trajectory_centroids[self._trajectory_length - 1]
+        return math.sqrt((last_centroid[0] - first_centroid[0])**2 + (last_centroid[1] - first_centroid[1])**2)
 
-    def edit_is_static(self):
-        """ Check if static distance is smaller than a certain threshold.
+    @property
+    def is_static(self) -> bool:
+        """ True if the static distance is smaller than MIN_STATIC_DISTANCE.
 
         """
 
-        if self.static_distance <= int(os.getenv('MIN_STATIC_DISTANCE')):
-            self.is_static = True
-        else:
-            self.is_static = False
+        return self.static_distance <= self.min_static_distance
 
     def add_object_colors_bgr(self, new_object_colors_bgr: np.ndarray):
         """ Add the new object's colors to the object_colors_bgr list.
@@ -246,3 +345,27 @@ class ClassificationObject:
         # Get colors from most common list.
         colors = [color[0] for color in most_common]
         self.object_color_str = colors
+
+    def add_crop_candidate(self, frame, trajectory: list[float], object_conf: float, frame_number: int, thumbnail_size: int):
+        """ Keep the crop of the detection as thumbnail, if its quality score is higher than the current thumbnail.
+        The crop is only extracted and scored on sharpness if the confidence and size could beat the current score.
+        :param frame: The frame the detection belongs to.
+        :param trajectory: The bounding box coordinates of the detection [x1, y1, x2, y2].
+        :param object_conf: The confidence score of the detection.
+        :param frame_number: The frame number of the detection.
+        :param thumbnail_size: The maximum length of the longest side of the thumbnail in pixels.
+
+        """
+
+        size_score = crop_size_score(object_conf, trajectory, self.frame_width, self.frame_height)
+        if size_score <= self.thumbnail_score:
+            return
+
+        thumbnail = extract_thumbnail(frame, trajectory, thumbnail_size)
+        if thumbnail is None:
+            return
+        score = size_score * sharpness_score(thumbnail)
+        if score > self.thumbnail_score:
+            self.thumbnail = thumbnail
+            self.thumbnail_score = score
+            self.thumbnail_frame = frame_number
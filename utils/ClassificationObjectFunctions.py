@@ -1,5 +1,7 @@
 from utils.ClassificationObject import ClassificationObject
+from utils.Detections import Detections, create_translation_table
 import numpy as np
+import time
 
 
 def create_classification_object(id: str, first_object_name: str, first_object_conf: float, first_trajectory: list[float], first_frame: int, frame_width: int, frame_height: int, first_colors_bgr: np.ndarray = None, first_colors_hls: np.ndarray = None, first_colors_str: np.ndarray = None) -> ClassificationObject:
@@ -36,6 +38,19 @@ def edit_classification_object(id: str, object_name: str, object_conf: float, tr
     classification_object = find_classification_object(
         classification_object_list, id)
 
+    update_classification_object(classification_object, object_name, object_conf, trajectory, frame_number, colors_bgr, colors_hls, colors_str)
+
+
+def update_classification_object(classification_object: ClassificationObject, object_name: str, object_conf: float, trajectory: list[float], frame_number: int, colors_bgr: np.ndarray = None, colors_hls: np.ndarray = None, colors_str: np.ndarray = None, freeze_detections: int = 0):
+    """Edit a given ClassificationObject with a new detection.
+        :param classification_object: The ClassificationObject to edit.
+        :param freeze_detections: The number of detections an object should be stationary before it is frozen, if 0 objects are never frozen.
+        :params: Other parameter explanations can be found in edit_classification_object.
+    """
+    # A frozen object skips the color updates, unless it moved beyond MIN_STATIC_DISTANCE.
+    if classification_object.frozen and classification_object.add_frozen_detection(object_name, object_conf, trajectory, frame_number):
+        return
+
     # Edit/append object variables, such as: object name, coupled confidence score, bbox coordinates, current frame number.
     classification_object.add_object_name(object_name)
     classification_object.add_object_conf(object_conf)
@@ -46,6 +61,9 @@ def edit_classification_object(id: str, object_name: str, object_conf: float, tr
     classification_object.add_object_colors_hls(colors_hls) if colors_hls is not None else None
     classification_object.add_object_colors_str(colors_str) if colors_str is not None else None
 
+    # Freeze the object if it has been stationary for freeze_detections detections.
+    classification_object.update_frozen(freeze_detections)
+
 
 def find_classification_object(classification_object_list: list[ClassificationObject], target_id: str) -> ClassificationObject:
     """ Find object with matching ids from classification_object_list using target_id.
@@ -58,4 +76,124 @@ def find_classification_object(classification_object_list: list[ClassificationOb
             return obj
         # If there is no object found with the target-id, throw ValueError.
         else:
-            ValueError('No object found with this target-id')
\ No newline at end of file
+            ValueError('No object found with this target-id')
+
+
+def update_classification_objects(results, frame, frame_number: int, frame_width: int, frame_height: int, classification_object_list: list[ClassificationObject], classification_object_ids: list[int], color_detector=None, color_prediction_interval: int = 1, frame_objects: list[ClassificationObject] = None, thumbnail_size: int = 0, translation_table: np.ndarray = None, freeze_detections: int = 0, verified_names: list[str] = None, restore_object=None) -> float:
+    """ Create or edit the ClassificationObjects using the tracking results of a single frame.
+        The results are converted to NumPy arrays once, after which the objects are updated from plain Python lists.
+        :param results: The tracking results of the frame, as returned by the ultralytics YOLO.track function, or a Detections object.
+        :param frame: The frame the results belong to, used for the color detection.
+        :param frame_number: Frame number of the frame, i.e. current frame number.
+        :param frame_width: Width of the frame.
+        :param frame_height: Height of the frame.
+        :param classification_object_list: list of already existing objects, new objects are appended to this list.
+        :param classification_object_ids: list of the ids of already existing objects, new ids are appended to this list.
+        :param color_detector: FindObjectColors object used to find the dominant colors, if None no colors are calculated.
+        :param color_prediction_interval: The colors of existing objects are calculated every color_prediction_interval occurences.
+        :param frame_objects: list to which the objects detected in this frame are appended, e.g. to annotate only the visible objects.
+        :param thumbnail_size: The maximum size of the thumbnail kept per object, the best crop so far. If 0 no thumbnails are kept.
+        :param translation_table: Table mapping class indices to translated names, as created by create_translation_table(model.names).
+                                  If None, the table is created from the names of the results.
+        :param freeze_detections: The number of detections an object should be stationary before it is frozen, if 0 objects are never frozen.
+                                  Frozen objects skip the trajectory, color and thumbnail updates.
+        :param verified_names: The names verified by the larger model of a cascade, None for each detection that was not verified.
+                               A verified name replaces the name of the detection, and takes precedence in the name voting.
+        :param restore_object: A function returning the removed object of an id that is detected again, or None if the id is new.
+                               E.g. StreamingReturnJSON.restore_object, so a finalized object is continued when the tracker revives its id.
+        :returns: The time spent on color prediction in seconds.
+    """
+    time_color_prediction = 0
+
+    # Convert the results to NumPy arrays.
+    # If no tracked objects are detected, the postprocessing should not be done.
+    detections = results if isinstance(results, Detections) else Detections.from_results(results)
+    if detections is None or len(detections) == 0:
+        return time_color_prediction
+
+    # Name all detections at once, using the translation table.
+    if translation_table is None:
+        translation_table = create_translation_table(detections.names)
+    object_names = translation_table[detections.classes].tolist()
+    object_ids = detections.ids.tolist()
+    object_confs = detections.confs.tolist()
+    object_trajectories = detections.xyxy.tolist()
+    if verified_names is not None:
+        object_names = [object_name if verified_name is None else verified_name for object_name, verified_name in zip(object_names, verified_names)]
+
+    # Index the existing objects by id, so each detection is matched in constant time.
+    classification_objects_by_id = dict(zip(classification_object_ids, classification_object_list))
+
+    # Loop over the detections.
+    # The mask is only converted to a bitmap of the box when the colors are calculated, if a segmentation model was used.
+    # The crop_and_detect function will use trajectory instead if no mask is provided.
+    for index, (object_id, object_name, object_conf, object_trajectory) in enumerate(zip(object_ids, object_names, object_confs, object_trajectories)):
+        classification_object = classification_objects_by_id.get(object_id)
+
+        # A removed object is restored if its id is detected again, and then edited as an existing object.
+        if classification_object is None and restore_object is not None:
+            classification_object = restore_object(object_id)
+            if classification_object is not None:
+                classification_objects_by_id[object_id] = classification_object
+                classification_object_ids.append(object_id)
+                classification_object_list.append(classification_object)
+
+        # Calculate the dominant colors of the object if a color_detector is given.
+        # For existing objects only if the object has been detected a multiple of COLOR_PREDICTION_INTERVAL times, and is not frozen.
+        if color_detector is not None and (classification_object is None or (not classification_object.frozen and classification_object.occurences % color_prediction_interval == 0)):
+            start_time_color_prediction = time.perf_counter()
+            main_colors_bgr, main_colors_hls, main_colors_str = color_detector.crop_and_detect(
+                frame=frame,
+                trajectory=object_trajectory,
+                mask_bitmap=detections.mask_bitmap(index))
+            time_color_prediction += time.perf_counter() - start_time_color_prediction
+        else:
+            main_colors_bgr, main_colors_hls, main_colors_str = None, None, None
+
+        # If the id already exists, edit the classification object.
+        # Otherwise, create a new classification object.
+        if classification_object is not None:
+            update_classification_object(
+                classification_object=classification_object,
+                object_name=object_name,
+                object_conf=object_conf,
+                trajectory=object_trajectory,
+                frame_number=frame_number,
+                colors_bgr=main_colors_bgr,
+                colors_hls=main_colors_hls,
+                colors_str=main_colors_str,
+                freeze_detections=freeze_detections)
+
+        else:
+            classification_object = create_classification_object(
+                id=object_id,
+                first_object_name=object_name,
+                first_object_conf=object_conf,
+                first_trajectory=object_trajectory,
+                first_frame=frame_number,
+                frame_width=frame_width,
+                frame_height=frame_height,
+                first_colors_bgr=main_colors_bgr,
+                first_colors_hls=main_colors_hls,
+                first_colors_str=main_colors_str)
+
+            classification_objects_by_id[object_id] = classification_object
+            classification_object_ids.append(object_id)
+            classification_object_list.append(
+                classification_object)
+
+        # The verified name takes precedence in the name voting of the object.
+        classification_object.add_verified_name(verified_names[index]) if verified_names is not None and verified_names[index] is not None else None
+
+        # Keep track of the objects detected in this frame, if requested.
+        frame_objects.append(classification_object) if frame_objects is not None else None
+
+        # Keep the crop of the object as thumbnail, if it is better than the current thumbnail.
+        classification_object.add_crop_candidate(
+            frame=frame,
+            trajectory=object_trajectory,
+            object_conf=object_conf,
+            frame_number=frame_number,
+            thumbnail_size=thumbnail_size) if thumbnail_size > 0 and not classification_object.frozen else None
+
+    return time_color_prediction
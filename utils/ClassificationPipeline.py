@@ -0,0 +1,426 @@
+from utils.ReturnObject import ReturnJSON, StreamingReturnJSON
+from utils.Metrics import Metrics
+from utils.VariableClass import VariableClass
+from utils.VideoEncoder import AsyncVideoWriter
+from utils.ConvergenceCheck import ConvergenceCheck
+from utils.ClassificationObject import ClassificationObject
+from utils.Detections import Detections, create_translation_table, resolve_allowed_classes
+from utils.ModelCascade import ModelCascade
+from utils.AdaptiveSampler import AdaptiveSampler
+from utils.TiledInference import create_tiled_detector
+from utils.BatchInference import BatchInferenceClient
+from utils.ModelLoader import reset_model
+from utils.Checkpoint import VideoCheckpoint, ClassificationInterrupted, get_tracker_state, restore_tracker_state, seek_frame
+from utils.AnnotateFrame import FrameAnnotator, annotate_bbox_frame
+from utils.ClassificationObjectFunctions import update_classification_objects
+import cv2
+
+
+def classify_video(cap, model, var: VariableClass, metrics: Metrics = None, checkpoint: VideoCheckpoint = None, should_stop=None,
+                   inference_client: BatchInferenceClient = None, cascade_model=None) -> tuple[ReturnJSON, int]:
+    """ Classify the objects in a single video, this is the per-video part of the pipeline.
+    It is independent of the message queue and the Kerberos Vault, so it can also be used on local files.
+    Depending on the environment variables, the annotated video and bbox frame are created and saved.
+
+    :param cap: The opened video, a cv2.VideoCapture or StreamCapture object.
+    :param model: The ultralytics YOLO model used for detection and tracking, it is reused across videos as its tracking state is reset per video.
+    :param var: The VariableClass object, containing the environment variables.
+    :param metrics: The Metrics object used to measure the pipeline stages, if None nothing is measured.
+    :param checkpoint: The VideoCheckpoint used to periodically save the state, and to resume an interrupted classification of this video.
+    :param should_stop: A function called before each frame, if it returns True the state is checkpointed (if a checkpoint is given) and ClassificationInterrupted is raised.
+    :param inference_client: The BatchInferenceClient used to detect and track the frames, if several videos are classified at once.
+    :param cascade_model: The larger ultralytics YOLO model of the cascade, verifying new and uncertain detections. If None no cascade is used.
+    :returns: A tuple (return_json, predicted_frames), return_json is None if CREATE_RETURN_JSON is set to False.
+
+    """
+
+    if metrics is None:
+        metrics = Metrics(enabled=False)
+    return_json = None
+
+    # Initialize the adaptive sampler if the ADAPTIVE_SAMPLING is set to True, and the fps of the video is known.
+    # The sampling rate then follows the activity in the scene, otherwise the frames are sampled at the CLASSIFICATION_FPS.
+    sampler = AdaptiveSampler(
+        video_fps=cap.get(cv2.CAP_PROP_FPS),
+        min_fps=var.ADAPTIVE_MIN_FPS,
+        max_fps=var.ADAPTIVE_MAX_FPS,
+        budget_fps=var.ADAPTIVE_BUDGET_FPS) if var.ADAPTIVE_SAMPLING and cap.get(cv2.CAP_PROP_FPS) > 0 else None
+
+    # Initialize the video-writer if the SAVE_VIDEO is set to True.
+    # The frames are encoded in a separate thread, so the encoding overlaps with the classification.
+    # With adaptive sampling, the video is written at the maximum sampling rate, repeating the frames of the quiet stretches.
+    if var.SAVE_VIDEO:
+        video_out = AsyncVideoWriter(
+            filename=var.OUTPUT_MEDIA_SAVEPATH,
+            fps=sampler.max_fps if sampler is not None else var.CLASSIFICATION_FPS,
+            frame_size=(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+            backend=var.OUTPUT_VIDEO_BACKEND,
+            scale=var.OUTPUT_VIDEO_SCALE,
+            codec=var.OUTPUT_VIDEO_CODEC,
+            bitrate=var.OUTPUT_VIDEO_BITRATE,
+            threads=var.OUTPUT_VIDEO_THREADS,
+            queue_size=var.OUTPUT_VIDEO_QUEUE_SIZE)
+
+    # The color prediction package is only imported if the colors are predicted, as it is slow to import.
+    if var.FIND_DOMINANT_COLORS:
+        from utils.ColorDetector import FindObjectColors
+        color_detector = FindObjectColors(
+            downsample_factor=0.7,
+            min_clusters=var.MIN_CLUSTERS,
+            max_clusters=var.MAX_CLUSTERS,
+        )
+
+    # The model is loaded once per worker, the trackers of the previous video are removed.
+    # With batch inference the model belongs to the inference server, and the video is tracked by its own client instead.
+    reset_model(model) if inference_client is None else None
+
+    # The translated class names of the model are looked up once, instead of translating each detection.
+    # The allowed classifications are resolved once to class indices of the model, these are used to filter the detections.
+    translation_table = create_translation_table(model.names, var.TRANSLATED_CLASSIFICATIONS)
+    allowed_classes = resolve_allowed_classes(var.ALLOWED_CLASSIFICATIONS, model.names, translation_table)
+
+    # Initialize the model cascade if a CASCADE_MODEL_NAME is given.
+    # The small model then detects down to the lower end of the uncertainty band, the larger model verifies the uncertain detections.
+    cascade = ModelCascade(
+        model=cascade_model,
+        threshold=var.CLASSIFICATION_THRESHOLD,
+        uncertainty_band=var.CASCADE_UNCERTAINTY_BAND,
+        translations=var.TRANSLATED_CLASSIFICATIONS,
+        classes=resolve_allowed_classes(
+            var.ALLOWED_CLASSIFICATIONS,
+            cascade_model.names,
+            create_translation_table(cascade_model.names, var.TRANSLATED_CLASSIFICATIONS)) if cascade_model.task != 'classify' else None,
+        imgsz=var.CASCADE_IMGSZ) if cascade_model is not None else None
+
+    # Initialize the tiled detector if the TILED_INFERENCE is set to True, and the video is high-resolution or regions are configured.
+    # Otherwise, tiled_detector is None and the full frame is tracked.
+    # Tiled inference is not combined with batch inference, the model is only called by the inference server in that case.
+    # With a cascade, the tiles are detected down to the lower end of the uncertainty band, as by YOLO.track.
+    tiled_detector = create_tiled_detector(
+        model=model,
+        var=var,
+        frame_width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        frame_height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        classes=allowed_classes,
+        conf=cascade.min_conf if cascade is not None else var.CLASSIFICATION_THRESHOLD) if inference_client is None else None
+    detector = tiled_detector if tiled_detector is not None else inference_client
+
+    # Initialize the classification process.
+    # 2 lists are initialized:
+        # Classification objects
+        # Additional list for easy access to the ids.
+    classification_object_list: list[ClassificationObject] = []
+    classification_object_ids: list[int] = []
+
+    # Initialize the frame annotator if the SAVE_VIDEO or PLOT is set to True.
+    # frame_objects -> The objects detected in the current frame, only these objects are annotated.
+    if var.SAVE_VIDEO or var.PLOT:
+        frame_annotator = FrameAnnotator(
+            min_distance=var.MIN_DISTANCE,
+            min_detections=var.MIN_DETECTIONS)
+    frame_objects: list[ClassificationObject] = []
+
+    # Initialize the convergence check if the EARLY_EXIT is set to True.
+    # stopped_early -> True if the classification stopped because the results stabilized.
+    if var.EARLY_EXIT:
+        convergence_check = ConvergenceCheck(
+            stable_frames=var.EARLY_EXIT_FRAMES)
+    stopped_early = False
+
+    # frame_number -> The current frame number. Depending on the frame_skip_factor this can make jumps.
+    # predicted_frames -> The number of frames, that were used for the prediction. This goes up by one each prediction iteration.
+    # frame_skip_factor is the factor by which the input video frames are skipped.
+    # The frame_skip_factor is at least 1, as the fps of a stream can be unknown or lower than the CLASSIFICATION_FPS.
+    frame_number, predicted_frames = 0, 0
+    frame_skip_factor = max(1, int(cap.get(cv2.CAP_PROP_FPS) / var.CLASSIFICATION_FPS))
+
+    # Depending on the checkpoint, an interrupted classification of this video is resumed.
+    # The classification objects, tracker state and frame position are restored, and the video is seeked to the next frame.
+    # The annotated video only contains the frames classified after resuming.
+    # A checkpoint of a different frame size is discarded, together with the results file of its ReturnJSON.
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None and state['frame_size'] != (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)):
+        state['return_json'].close() if state.get('return_json') is not None else None
+        state = None
+    if state is not None:
+        frame_number, predicted_frames = state['frame_number'], state['predicted_frames']
+        classification_object_list = state['classification_object_list']
+        classification_object_ids = state['classification_object_ids']
+        bbox_frame = state['bbox_frame']
+        if var.EARLY_EXIT and state['convergence_check'] is not None:
+            convergence_check = state['convergence_check']
+        if var.CREATE_RETURN_JSON and state.get('return_json') is not None:
+            return_json = state['return_json']
+        if sampler is not None and state.get('sampler') is not None:
+            sampler = state['sampler']
+        restore_tracker_state(model, state['trackers'], state['track_count'], detector)
+        frame_annotator.register(classification_object_list) if var.SAVE_VIDEO or var.PLOT else None
+        seek_frame(cap, frame_number)
+        if var.LOGGING:
+            print(f'\t - Resuming from the checkpoint at frame {frame_number}, with {len(classification_object_list)} objects.')
+
+    # Initialize the streaming ReturnJSON if the RETURN_JSON_IDLE_FRAMES is larger than 0.
+    # Objects that are unseen for RETURN_JSON_IDLE_FRAMES frames are then finalized to a file and removed, this bounds the memory of long recordings.
+    # With a checkpoint the file is kept next to it, so the finalized objects are restored when resuming.
+    # The file is only created when the ReturnJSON is not restored from the checkpoint, creating it empties the file.
+    if var.CREATE_RETURN_JSON and var.RETURN_JSON_IDLE_FRAMES > 0 and return_json is None:
+        return_json = StreamingReturnJSON(
+            idle_frames=var.RETURN_JSON_IDLE_FRAMES,
+            min_detections=var.MIN_DETECTIONS,
+            thumbnail_options={'image_format': var.THUMBNAIL_FORMAT,
+                               'quality': var.THUMBNAIL_QUALITY,
+                               'inline': var.THUMBNAIL_INLINE,
+                               'save_directory': var.THUMBNAIL_SAVEPATH} if var.CREATE_THUMBNAILS else None,
+            analytics_options={'fps': cap.get(cv2.CAP_PROP_FPS),
+                               'stop_speed': var.TRAJECTORY_STOP_SPEED,
+                               'min_static_distance': var.MIN_STATIC_DISTANCE} if var.TRAJECTORY_ANALYTICS else None,
+            path=checkpoint.results_path if checkpoint is not None else None)
+
+    # Loop over the video frames, and perform object classification.
+    # The classification process is done until the counter reaches the MAX_NUMBER_OF_PREDICTIONS or the last frame is reached.
+    # The frame count of a stream is unknown up front, in which case the loop runs until no more frames can be read.
+    MAX_FRAME_NUMBER = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    if MAX_FRAME_NUMBER <= 0:
+        MAX_FRAME_NUMBER = float('inf')
+    if var.LOGGING:
+        print(f'5) Classifying frames')
+    while (predicted_frames < var.MAX_NUMBER_OF_PREDICTIONS) and (frame_number < MAX_FRAME_NUMBER):
+
+        # Checkpoint the state every CHECKPOINT_INTERVAL seconds, and when a shutdown is requested.
+        # On a shutdown the annotated video is closed, and the classification is interrupted.
+        stop = should_stop is not None and should_stop()
+        if checkpoint is not None and (stop or checkpoint.due()):
+            start_time_checkpoint = metrics.start()
+            trackers, track_count = get_tracker_state(model, detector)
+            checkpoint.save({
+                'frame_size': (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'frame_number': frame_number,
+                'predicted_frames': predicted_frames,
+                'classification_object_list': classification_object_list,
+                'classification_object_ids': classification_object_ids,
+                'bbox_frame': bbox_frame if var.CREATE_BBOX_FRAME and frame_number > 0 else None,
+                'convergence_check': convergence_check if var.EARLY_EXIT else None,
+                'return_json': return_json,
+                'sampler': sampler,
+                'trackers': trackers,
+                'track_count': track_count})
+            metrics.stop('checkpoint', start_time_checkpoint)
+        if stop:
+            video_out.release() if var.SAVE_VIDEO else None
+            return_json.close() if return_json is not None else None
+            raise ClassificationInterrupted(f'Classification interrupted at frame {frame_number}')
+
+        # Read the frame from the video-capture.
+        start_time_decode = metrics.start()
+        success, frame = cap.read()
+        metrics.stop('decode', start_time_decode)
+        if not success:
+            break
+
+        # Keep the first frame in memory, if the CREATE_BBOX_FRAME is set to True.
+        # This is used to draw the tracking results on.
+        if var.CREATE_BBOX_FRAME and frame_number == 0:
+            bbox_frame = frame.copy()
+
+        # Check if the frame_number corresponds to a frame that should be classified.
+        # With adaptive sampling, the frame was scheduled by the sampler when the previous frame was classified.
+        if sampler.should_sample(frame_number) if sampler is not None else frame_number % frame_skip_factor == 0:
+
+            # Perform object classification on the frame.
+            # persist=True -> The tracking results are stored in the model.
+            # persist should be kept True, as this provides unique IDs for each detection.
+            # More information about the tracking results via https://docs.ultralytics.com/reference/engine/results/
+            # With tiled inference, the tiles are detected in a single batch and the merged detections are tracked.
+            # With batch inference, the frame is detected in a batch with the frames of other videos, and tracked by the client.
+            start_time_inference = metrics.start()
+            results = detector.track(frame) if detector is not None else model.track(
+                source=frame,
+                persist=True,
+                verbose=False,
+                conf=cascade.min_conf if cascade is not None else var.CLASSIFICATION_THRESHOLD,
+                classes=allowed_classes)
+            metrics.stop('inference', start_time_inference)
+
+            # Depending on the cascade, the new and uncertain detections are verified by the larger model.
+            # The verified names take precedence in the name voting, unconfirmed detections below the threshold are dropped.
+            verified_names = None
+            if cascade is not None:
+                start_time_cascade = metrics.start()
+                results, verified_names = cascade.verify(
+                    frame=frame,
+                    detections=results if isinstance(results, Detections) else Detections.from_results(results),
+                    known_ids=classification_object_ids + list(return_json.parked) if isinstance(return_json, StreamingReturnJSON) else classification_object_ids,
+                    translation_table=translation_table)
+                metrics.stop('cascade', start_time_cascade)
+
+            # Update the classification objects with the detected objects in the frame.
+            # The dominant colors are only calculated if the FIND_DOMINANT_COLORS parameter is set to True.
+            # The color prediction is measured separately from the rest of the tracking update.
+            start_time_tracking_update = metrics.start()
+            frame_objects.clear()
+            time_color_prediction = update_classification_objects(
+                results=results,
+                frame=frame,
+                frame_number=frame_number,
+                frame_width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                frame_height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                classification_object_list=classification_object_list,
+                classification_object_ids=classification_object_ids,
+                color_detector=color_detector if var.FIND_DOMINANT_COLORS else None,
+                color_prediction_interval=var.COLOR_PREDICTION_INTERVAL,
+                frame_objects=frame_objects,
+                thumbnail_size=var.THUMBNAIL_SIZE if var.CREATE_THUMBNAILS and var.CREATE_RETURN_JSON else 0,
+                translation_table=translation_table,
+                freeze_detections=var.FREEZE_STATIC_DETECTIONS,
+                verified_names=verified_names,
+                restore_object=return_json.restore_object if isinstance(return_json, StreamingReturnJSON) else None)
+            # The start time is shifted by the color prediction time, to exclude it from the tracking update.
+            if metrics.enabled:
+                metrics.stop('tracking_update', start_time_tracking_update + int(time_color_prediction * 1e9))
+                metrics.observe('color', time_color_prediction) if var.FIND_DOMINANT_COLORS else None
+
+            # Depending on the ADAPTIVE_SAMPLING parameter, the next frame to classify is scheduled from the activity in this frame.
+            # The speed and number of the objects detected in this frame decide the sampling rate, the frame numbers stay those of the video.
+            sampler.update(frame_number, frame_objects) if sampler is not None else None
+
+            # Depending on the streaming ReturnJSON, the idle objects are finalized and removed.
+            # The finalized objects are drawn on the bbox frame now, as they are no longer in the classification_object_list at the end.
+            if isinstance(return_json, StreamingReturnJSON):
+                start_time_json_build = metrics.start()
+                finalized_objects = return_json.finalize_idle_objects(
+                    frame_number=frame_number,
+                    classification_object_list=classification_object_list,
+                    classification_object_ids=classification_object_ids)
+                metrics.stop('json_build', start_time_json_build)
+                if var.CREATE_BBOX_FRAME and finalized_objects:
+                    bbox_frame = annotate_bbox_frame(
+                        bbox_frame=bbox_frame,
+                        classification_object_list=finalized_objects)
+
+            # Depending on the SAVE_VIDEO or PLOT parameter, the frame is annotated.
+            # This is done using a custom annotator, which only draws the objects detected in this frame.
+            if var.SAVE_VIDEO or var.PLOT:
+                start_time_annotation = metrics.start()
+                annotated_frame = frame_annotator.annotate(
+                    frame=frame,
+                    frame_objects=frame_objects)
+                metrics.stop('annotation', start_time_annotation)
+
+                # Show the annotated frame if the PLOT parameter is set to True.
+                cv2.imshow("YOLOv8 Tracking",
+                           annotated_frame) if var.PLOT else None
+                cv2.waitKey(1) if var.PLOT else None
+
+                # Write the annotated frame to the video-writer if the SAVE_VIDEO parameter is set to True.
+                # Only the time waiting for a free place in the queue is measured, the encoding itself runs in the background.
+                if var.SAVE_VIDEO:
+                    start_time_encode = metrics.start()
+                    for _ in range(sampler.interval // sampler.min_interval if sampler is not None else 1):
+                        video_out.write(annotated_frame)
+                    metrics.stop('encode', start_time_encode)
+
+            # Increase the frame_number and predicted_frames by one.
+            predicted_frames += 1
+
+            # Stop the classification if the EARLY_EXIT is set to True and the results have stabilized.
+            # The frame_number is kept at the last classified frame.
+            if var.EARLY_EXIT and convergence_check.update(classification_object_list, frame_number):
+                stopped_early = True
+                break
+        frame_number += 1
+
+    if var.LOGGING and sampler is not None:
+        print(f"\t - Adaptive sampling classified {sampler.samples} frames, on average @ {round(sampler.average_fps(frame_number), 1)} fps.")
+    if var.LOGGING and cascade is not None:
+        print(f"\t - The cascade model verified {cascade.crops} of {cascade.detections} detections in {cascade.calls} calls, taking {round(cascade.time, 2)} seconds.")
+
+    # Depending on the CREATE_BBOX_FRAME parameter, the bbox_frame is annotated.
+    # This is done using a custom annotation function.
+    if var.CREATE_BBOX_FRAME:
+        if var.LOGGING:
+            print('6) Annotating bbox frame')
+        bbox_frame = annotate_bbox_frame(
+            bbox_frame=bbox_frame,
+            classification_object_list=classification_object_list)
+
+    # Depending on the CREATE_RETURN_JSON parameter, the detected objects are saved in a json file.
+    # Initialize the ReturnJSON object.
+    # This creates a json object with the correct structure.
+    start_time_json_build = metrics.start()
+    if var.CREATE_RETURN_JSON:
+        if var.LOGGING:
+            print('7) Creating ReturnJSON object')
+
+        # With the streaming ReturnJSON, the remaining objects are finalized in the same way as the idle objects.
+        # The thumbnails and trajectory analytics are added when an object is finalized.
+        if isinstance(return_json, StreamingReturnJSON):
+            return_json.finalize_objects(classification_object_list)
+            if var.LOGGING:
+                print(f"\t - {return_json.finalized_objects} objects where detected. Of which {len(return_json.entries)} objects where detected more than {var.MIN_DETECTIONS} times.")
+        else:
+            return_json = ReturnJSON()
+
+            # Depending on the user preference, the detected objects are filtered.
+            # In this case, the objects are filtered based on the MIN_DETECTIONS parameters.
+            filtered_classification_object_list = []
+            for classification_object in classification_object_list:
+                if classification_object.occurences >= var.MIN_DETECTIONS:
+                    filtered_classification_object_list.append(
+                        classification_object)
+                    return_json.add_detected_object(classification_object)
+            if var.LOGGING:
+                print(f"\t - {len(classification_object_list)} objects where detected. Of which {len(filtered_classification_object_list)} objects where detected more than {var.MIN_DETECTIONS} times.")
+
+            # Depending on the CREATE_THUMBNAILS parameter, the best crop of each object is added as thumbnail.
+            if var.CREATE_THUMBNAILS:
+                return_json.add_thumbnails(
+                    det_obj_list=filtered_classification_object_list,
+                    image_format=var.THUMBNAIL_FORMAT,
+                    quality=var.THUMBNAIL_QUALITY,
+                    inline=var.THUMBNAIL_INLINE,
+                    save_directory=var.THUMBNAIL_SAVEPATH)
+
+            # Depending on the TRAJECTORY_ANALYTICS parameter, the trajectories are analyzed in a single pass per object.
+            if var.TRAJECTORY_ANALYTICS:
+                return_json.add_trajectory_analytics(
+                    det_obj_list=filtered_classification_object_list,
+                    fps=cap.get(cv2.CAP_PROP_FPS),
+                    stop_speed=var.TRAJECTORY_STOP_SPEED,
+                    min_static_distance=var.MIN_STATIC_DISTANCE)
+
+        # Depending on the cascade, the report of how often the larger model was called and what it cost is added.
+        if cascade is not None:
+            return_json.add_cascade(
+                model_name=var.CASCADE_MODEL_NAME,
+                report=cascade.report())
+
+        # Depending on the EARLY_EXIT parameter, it is recorded if and where the classification stopped early.
+        if var.EARLY_EXIT:
+            return_json.add_early_exit(
+                stopped_early=stopped_early,
+                stopped_at_frame=frame_number)
+            if var.LOGGING and stopped_early:
+                print(f"\t - Classification stopped early at frame {frame_number}, as the results stabilized.")
+
+    # Depending on the SAVE_RETURN_JSON parameter, the return_json object is saved locally.
+    # The RETURN_JSON_SERIALIZER and RETURN_JSON_COMPACT parameters select the output format, by default a tab-indented json file.
+    return_json.save_returnjson(
+        var.RETURN_JSON_SAVEPATH,
+        serializer=var.RETURN_JSON_SERIALIZER,
+        compact=var.RETURN_JSON_COMPACT,
+        precision=var.RETURN_JSON_PRECISION) if var.SAVE_RETURN_JSON else None
+    metrics.stop('json_build', start_time_json_build)
+
+    # Depending on the SAVE_BBOX_FRAME parameter, the bbox_frame is saved locally.
+    cv2.imwrite(var.BBOX_FRAME_SAVEPATH,
+                bbox_frame) if var.SAVE_BBOX_FRAME else None
+
+    # If the videowriter was active, the remaining frames are encoded and the videowriter is released.
+    # This is done before returning, so the video is complete before the results are published.
+    if var.SAVE_VIDEO:
+        start_time_encode = metrics.start()
+        video_out.release()
+        metrics.stop('encode', start_time_encode)
+
+    return return_json, predicted_frames
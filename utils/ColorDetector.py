@@ -90,6 +90,28 @@ class FindObjectColors():
         return object_bgra
     
 
+    def segment_crop(self, frame, trajectory, mask_bitmap):
+        """ Segment the object from the background, within its bounding box only.
+
+        :param frame: The image to crop the object from.
+        :param trajectory: The bounding box coordinates of the object.
+        :param mask_bitmap: The mask of the object local to its bounding box, 0 outside the object.
+
+        """
+
+        # Crop the bounding box, in the same way as the mask bitmap is created.
+        x1, y1, x2, y2 = np.clip(trajectory, 0, [frame.shape[1], frame.shape[0], frame.shape[1], frame.shape[0]]).astype(int)
+        cropped_image = frame[y1:y2, x1:x2]
+        if mask_bitmap.shape != cropped_image.shape[:2]:
+            mask_bitmap = cv2.resize(mask_bitmap, (cropped_image.shape[1], cropped_image.shape[0]), interpolation=cv2.INTER_NEAREST)
+
+        # Convert the crop to BGRA, and set pixel values to (255, 255, 255, 0) where the mask is 0.
+        object_bgra = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2BGRA)
+        object_bgra[mask_bitmap == 0] = np.array([255, 255, 255, 0], dtype=np.uint8)
+
+        return object_bgra
+
+
     def detect_color(self, object_image, coding):
         """ Detect the main colors of the object in the image.
         
@@ -200,18 +222,22 @@ class FindObjectColors():
         return hls_color.tolist()
     
 
-    def crop_and_detect(self, frame, trajectory, mask_polygon = None):
+    def crop_and_detect(self, frame, trajectory, mask_polygon = None, mask_bitmap = None):
         """ Crop the object from the image and detect the colors of the object.
 
         :param frame: The image to crop the object from.
         :param trajectory: The trajectory of the object in the image.
         :param mask_polygon: The mask polygon of the object in the image.
+        :param mask_bitmap: The mask of the object local to its bounding box, used instead of the mask_polygon if given.
 
         """
 
-        # If no mask_polygon is given, crop the object from the image.
+        # If no mask is given, crop the object from the image.
         # Otherwise, segment the object from the background.
-        if mask_polygon is None:
+        if mask_bitmap is not None:
+            cropped_image = self.segment_crop(frame, trajectory, mask_bitmap)
+            bgr_centroid_colors = self.detect_color(cropped_image, 'BGRA').tolist()
+        elif mask_polygon is None:
             cropped_image = self.crop_detected_object(frame, trajectory)
             bgr_centroid_colors = self.detect_color(cropped_image, 'BGR').tolist()
         else:
@@ -0,0 +1,53 @@
+from utils.ClassificationObject import ClassificationObject
+
+
+class ConvergenceCheck:
+    """ Class to decide whether the classification of a video has stabilized.
+    The classification is considered converged when, for a given number of consecutive sampled frames,
+    no new object ids appeared and none of the active objects changed its majority name or its static state.
+
+    """
+
+    def __init__(self, stable_frames: int):
+        """ Initialize the class with the given parameters.
+
+        :param stable_frames: The number of consecutive sampled frames without any change, before the classification is considered converged.
+
+        """
+
+        self.stable_frames = stable_frames
+
+        # known_object_count -> The number of objects already seen, used to detect new ids.
+        # object_states -> The last known (object_name, is_static) state of each object, keyed by id.
+        # stable_count -> The number of consecutive sampled frames without any change.
+        self.known_object_count = 0
+        self.object_states = {}
+        self.stable_count = 0
+
+    def update(self, classification_object_list: list[ClassificationObject], frame_number: int) -> bool:
+        """ Update the convergence state with the result of the current sampled frame.
+
+        :param classification_object_list: The list of classification objects.
+        :param frame_number: The current frame number.
+        :returns: True if the classification has converged, False otherwise.
+
+        """
+
+        changed = False
+
+        # Only the objects detected in the current frame can be new, or change their name or static state.
+        # New objects are recognized by their first frame, as finalized objects can be removed from the classification_object_list.
+        for classification_object in classification_object_list:
+            if classification_object.first_frame == frame_number:
+                self.known_object_count += 1
+                changed = True
+            if classification_object.frames[-1] == frame_number:
+                state = (classification_object.object_name, classification_object.is_static)
+                if self.object_states.get(classification_object.id) != state:
+                    self.object_states[classification_object.id] = state
+                    changed = True
+
+        self.stable_count = 0 if changed else self.stable_count + 1
+
+        # At least one object should be found, otherwise an empty start of a recording would end the classification.
+        return self.known_object_count > 0 and self.stable_count >= self.stable_frames
@@ -0,0 +1,141 @@
+from utils.TranslateObject import translate
+import numpy as np
+import cv2
+
+
+class Detections():
+    """ Class holding the tracked detections of a single frame as NumPy arrays.
+    The ultralytics results are converted once per frame, instead of converting each box and mask tensor separately.
+    The masks of a segmentation model are kept as they are, a mask is only converted for the detections that need it, e.g. for the color detection.
+
+    """
+
+    def __init__(self, ids: np.ndarray, classes: np.ndarray, confs: np.ndarray, xyxy: np.ndarray, masks=None, frame_shape: tuple[int, int] = None, names: dict = None):
+        """ Initialize the class with the given parameters.
+
+        :param ids: The track ids, shape (n,).
+        :param classes: The class indices, shape (n,).
+        :param confs: The confidence scores, shape (n,).
+        :param xyxy: The bounding box coordinates [x1, y1, x2, y2], shape (n, 4).
+        :param masks: The binary masks at the inference resolution, a tensor or array of shape (n, mask height, mask width). None if no segmentation model is used.
+        :param frame_shape: The height and width of the frame, used to map the boxes to the masks.
+        :param names: The class names of the model, mapping class indices to names.
+
+        """
+
+        self.ids = ids
+        self.classes = classes
+        self.confs = confs
+        self.xyxy = xyxy
+        self.masks = masks
+        self.frame_shape = frame_shape
+        self.names = names
+
+    @classmethod
+    def from_results(cls, results):
+        """ Convert the tracking results of a frame to NumPy arrays.
+
+        :param results: The tracking results of the frame, as returned by the ultralytics YOLO.track function.
+        :returns: A Detections object, or None if no tracked objects are detected.
+
+        """
+
+        # If no object is tracked, the boxes have no ids.
+        if results is None or results[0].boxes is None or results[0].boxes.id is None:
+            return None
+
+        boxes = results[0].boxes.cpu().numpy()
+        return cls(
+            ids=boxes.id.astype(np.int64),
+            classes=boxes.cls.astype(np.int64),
+            confs=boxes.conf.astype(np.float64),
+            xyxy=boxes.xyxy.astype(np.float64),
+            masks=results[0].masks.data if results[0].masks is not None else None,
+            frame_shape=results[0].orig_shape,
+            names=results[0].names)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mask_bitmap(self, index: int) -> np.ndarray:
+        """ Get the mask of a detection as a bitmap local to its bounding box, as used by the color detection.
+        Only the box region of the mask is copied from the device and resized, instead of converting the full mask to a polygon.
+
+        :param index: The index of the detection.
+        :returns: The uint8 bitmap with the (integer) size of the bounding box, 255 inside the mask. None if no segmentation model is used.
+
+        """
+
+        if self.masks is None:
+            return None
+
+        # The masks are letterboxed to the inference resolution, the box is mapped in the same way as the frame.
+        frame_height, frame_width = self.frame_shape
+        mask_height, mask_width = self.masks.shape[1:]
+        gain = min(mask_height / frame_height, mask_width / frame_width)
+        pad_x, pad_y = (mask_width - frame_width * gain) / 2, (mask_height - frame_height * gain) / 2
+        x1, y1, x2, y2 = np.clip(self.xyxy[index], 0, [frame_width, frame_height, frame_width, frame_height]).astype(int)
+        mask_x1, mask_y1 = int(x1 * gain + pad_x), int(y1 * gain + pad_y)
+        mask_x2, mask_y2 = max(int(np.ceil(x2 * gain + pad_x)), mask_x1 + 1), max(int(np.ceil(y2 * gain + pad_y)), mask_y1 + 1)
+
+        mask_crop = self.masks[index, mask_y1:mask_y2, mask_x1:mask_x2]
+        mask_crop = mask_crop.cpu().numpy() if hasattr(mask_crop, 'cpu') else np.asarray(mask_crop)
+        bitmap = (mask_crop > 0.5).astype(np.uint8) * 255
+        return cv2.resize(bitmap, (max(x2 - x1, 1), max(y2 - y1, 1)), interpolation=cv2.INTER_NEAREST)
+
+    def select(self, indices: np.ndarray):
+        """ Select a subset of the detections.
+
+        :param indices: The indices of the detections to select.
+        :returns: A new Detections object, containing only the selected detections.
+
+        """
+
+        return Detections(
+            ids=self.ids[indices],
+            classes=self.classes[indices],
+            confs=self.confs[indices],
+            xyxy=self.xyxy[indices],
+            masks=self.masks[indices] if self.masks is not None else None,
+            frame_shape=self.frame_shape,
+            names=self.names)
+
+
+def create_translation_table(names: dict, translations: dict = None) -> np.ndarray:
+    """ Create a table mapping the class indices of a model to the translated class names.
+    The table is created once per model, so naming a detection is an array lookup instead of a translate call.
+
+    :param names: The class names of the model, mapping class indices to names, e.g. model.names.
+    :param translations: The translation table, mapping labels to translated labels. If None, the default translations are used.
+    :returns: An object array, where the element at a class index is the translated name.
+
+    """
+
+    translation_table = np.empty(max(names) + 1, dtype=object)
+    for class_index, name in names.items():
+        translation_table[class_index] = translate(name, translations)
+    return translation_table
+
+
+def resolve_allowed_classes(allowed_classifications: list, names: dict, translation_table: np.ndarray) -> list[int]:
+    """ Resolve the allowed classifications to class indices of the model, which are used to filter the detections.
+    The allowed classifications can be class indices, class names of the model or translated names, e.g. [0, 'car', 'animal'].
+
+    :param allowed_classifications: The allowed class indices and/or names.
+    :param names: The class names of the model, mapping class indices to names, e.g. model.names.
+    :param translation_table: The translation table, as created by create_translation_table.
+    :returns: The sorted class indices of the allowed classifications.
+
+    """
+
+    allowed_classes = set()
+    for allowed_classification in allowed_classifications:
+        if isinstance(allowed_classification, int):
+            allowed_classes.add(allowed_classification)
+            continue
+        matching_classes = [class_index for class_index, name in names.items()
+                            if allowed_classification in (name, translation_table[class_index])]
+        if not matching_classes:
+            raise ValueError(f'Unknown classification: {allowed_classification}, it is not a class or translated class of the model')
+        allowed_classes.update(matching_classes)
+    return sorted(allowed_classes)
@@ -0,0 +1,323 @@
+from utils.ReturnObject import ReturnJSON
+from utils.AnnotateFrame import FrameAnnotator
+from utils.ClassificationObject import ClassificationObject
+from utils.Detections import create_translation_table, resolve_allowed_classes
+from utils.TiledInference import create_tiled_detector
+from utils.ClassificationObjectFunctions import update_classification_objects
+import threading
+import os
+import time
+import cv2
+
+
+class LatestFrameReader():
+    """ Class to read a live stream in a separate thread, keeping only the latest frame in memory.
+    When the classification is slower than the stream, the frames in between are dropped instead of buffered,
+    so the classification never builds up latency.
+
+    """
+
+    def __init__(self, source: str, loop: bool = False):
+        """ Initialize the class with the given parameters, and start reading the stream.
+
+        :param source: The stream to read, e.g. rtsp://..., http://... or a path to a local file.
+        :param loop: Restart a local file when the end is reached. Local files are read at their own fps, as a stand-in for a camera stream.
+
+        """
+
+        self.source = source
+        self.loop = loop
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f'Unable to open stream: {source}')
+
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.frame_width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        # frame_number -> The number of the latest frame read from the stream, increasing over loops of a local file.
+        # dropped_frames -> The number of frames that were overwritten before they were retrieved.
+        self.frame = None
+        self.frame_number = -1
+        self.retrieved_frame_number = -1
+        self.dropped_frames = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.read_frames, daemon=True)
+        self.thread.start()
+
+    def read_frames(self):
+        """ Read the frames of the stream, this runs in a separate thread.
+
+        """
+
+        frame_interval = 1 / self.fps if os.path.isfile(self.source) and self.fps > 0 else 0
+        next_frame_time = time.time()
+        while not self.stopped:
+            success, frame = self.capture.read()
+            if not success:
+                # Restart the local file if loop is set, otherwise the stream has ended.
+                if self.loop and self.capture.get(cv2.CAP_PROP_POS_FRAMES) > 0:
+                    self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+
+            with self.condition:
+                if self.frame_number > self.retrieved_frame_number:
+                    self.dropped_frames += 1
+                self.frame = frame
+                self.frame_number += 1
+                self.condition.notify_all()
+
+            # A local file is paced at its own fps, a live stream is paced by the camera itself.
+            if frame_interval > 0:
+                next_frame_time += frame_interval
+                time.sleep(max(0, next_frame_time - time.time()))
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def read(self):
+        """ Retrieve the latest frame, waiting until a frame newer than the previous retrieved frame is available.
+        :returns: A tuple (frame_number, frame), frame is None if the stream has ended.
+
+        """
+
+        with self.condition:
+            while self.frame_number <= self.retrieved_frame_number and not self.stopped:
+                self.condition.wait()
+            if self.frame_number <= self.retrieved_frame_number:
+                return self.frame_number, None
+            self.retrieved_frame_number = self.frame_number
+            return self.frame_number, self.frame
+
+    def release(self):
+        """ Stop reading the stream and release the capture.
+
+        """
+
+        self.stopped = True
+        self.thread.join()
+        self.capture.release()
+
+
+class SlidingWindowEmitter():
+    """ Class to emit partial ReturnJSON results of a live stream, per time window or when a track ends.
+    Each result only contains the detections of a track since its previous result, so the size of a result does not grow with the lifetime of the tracks.
+    Ended tracks are evicted from the classification objects after they are emitted, this keeps the memory bounded.
+
+    """
+
+    def __init__(self, window_frames: int, track_timeout_frames: int, min_detections: int, emit):
+        """ Initialize the class with the given parameters.
+
+        :param window_frames: The length of a window in frames, after which the new detections of the active tracks are emitted.
+        :param track_timeout_frames: The number of frames a track should be unseen, before it is considered ended.
+        :param min_detections: The minimum amount of detections for a track to be emitted.
+        :param emit: Function called with a ReturnJSON object, each time results are emitted.
+
+        """
+
+        self.window_frames = window_frames
+        self.track_timeout_frames = track_timeout_frames
+        self.min_detections = min_detections
+        self.emit = emit
+        self.window_start_frame = None
+
+        # emitted -> The number of detections and colors of each track that were included in the previous results, keyed by id.
+        self.emitted = {}
+
+    def add_new_detections(self, return_json: ReturnJSON, classification_object_list: list[ClassificationObject]):
+        """ Add the detections of the tracks since their previous result, tracks without new detections are left out.
+
+        :param return_json: The ReturnJSON object of the result.
+        :param classification_object_list: The tracks to add, tracks with too few detections are left out.
+
+        """
+
+        for classification_object in classification_object_list:
+            if classification_object.occurences < self.min_detections:
+                continue
+            detections_start, colors_start = self.emitted.get(classification_object.id, (0, 0))
+            if classification_object.occurences > detections_start:
+                return_json.add_detected_object(classification_object, detections_start, colors_start)
+                self.emitted[classification_object.id] = (classification_object.occurences, len(classification_object.object_colors_bgr))
+
+    def update(self, frame_number: int, classification_object_list: list[ClassificationObject], classification_object_ids: list[int]):
+        """ Emit the results when the window has passed or tracks have ended, and evict the ended tracks.
+
+        :param frame_number: The current frame number.
+        :param classification_object_list: The list of classification objects, ended tracks are removed from this list.
+        :param classification_object_ids: The list of the ids of the classification objects, ended ids are removed from this list.
+
+        """
+
+        if self.window_start_frame is None:
+            self.window_start_frame = frame_number
+
+        # Split the classification objects in ended and active tracks.
+        ended_objects, active_objects = [], []
+        for classification_object in classification_object_list:
+            if frame_number - classification_object.frames[-1] > self.track_timeout_frames:
+                ended_objects.append(classification_object)
+            else:
+                active_objects.append(classification_object)
+
+        window_passed = frame_number - self.window_start_frame >= self.window_frames
+        if not window_passed and not ended_objects:
+            return
+
+        # The new detections of the ended tracks are always emitted, those of the active tracks only when the window has passed.
+        # Ended tracks with too few detections are evicted without emitting them.
+        ended_ids = [str(classification_object.id) for classification_object in ended_objects
+                     if classification_object.occurences >= self.min_detections]
+        if window_passed or ended_ids:
+            return_json = ReturnJSON()
+            self.add_new_detections(return_json, ended_objects + active_objects if window_passed else ended_objects)
+            return_json.add_window(
+                start_frame=self.window_start_frame,
+                end_frame=frame_number,
+                ended_ids=ended_ids)
+            self.emit(return_json)
+
+        # Evict the ended tracks, the lists are edited in place as they are shared with the classification loop.
+        for classification_object in ended_objects:
+            self.emitted.pop(classification_object.id, None)
+        classification_object_list[:] = active_objects
+        classification_object_ids[:] = [classification_object.id for classification_object in active_objects]
+        if window_passed:
+            self.window_start_frame = frame_number
+
+    def flush(self, frame_number: int, classification_object_list: list[ClassificationObject], classification_object_ids: list[int]):
+        """ Emit the partial window when the stream has ended, all remaining tracks are emitted as ended and evicted.
+
+        :param frame_number: The last frame number of the stream.
+        :param classification_object_list: The list of classification objects, this list is emptied.
+        :param classification_object_ids: The list of the ids of the classification objects, this list is emptied.
+
+        """
+
+        if self.window_start_frame is None:
+            return
+        return_json = ReturnJSON()
+        self.add_new_detections(return_json, classification_object_list)
+        return_json.add_window(
+            start_frame=self.window_start_frame,
+            end_frame=frame_number,
+            ended_ids=[str(classification_object.id) for classification_object in classification_object_list
+                       if classification_object.occurences >= self.min_detections])
+        self.emit(return_json)
+
+        self.emitted.clear()
+        classification_object_list.clear()
+        classification_object_ids.clear()
+        self.window_start_frame = None
+
+
+def classify_live_stream(model, var, emit, color_detector=None):
+    """ Classify the objects in a live stream, emitting partial results per time window or when a track ends.
+    The stream is classified at CLASSIFICATION_FPS, frames are dropped when the classification can't keep up.
+
+    :param model: The ultralytics YOLO model used for detection and tracking.
+    :param var: The VariableClass object, containing the environment variables.
+    :param emit: Function called with a ReturnJSON object, each time results are emitted.
+    :param color_detector: FindObjectColors object used to find the dominant colors, if None no colors are calculated.
+
+    """
+
+    reader = LatestFrameReader(
+        source=var.LIVE_STREAM_URL,
+        loop=var.LIVE_LOOP)
+
+    # The window and timeout are configured in seconds, but handled in frames of the stream.
+    stream_fps = reader.fps if reader.fps > 0 else var.CLASSIFICATION_FPS
+    emitter = SlidingWindowEmitter(
+        window_frames=int(var.LIVE_WINDOW_SECONDS * stream_fps),
+        track_timeout_frames=int(var.LIVE_TRACK_TIMEOUT * stream_fps),
+        min_detections=var.MIN_DETECTIONS,
+        emit=emit)
+
+    # The translated class names of the model are looked up once, instead of translating each detection.
+    # The allowed classifications are resolved once to class indices of the model, these are used to filter the detections.
+    translation_table = create_translation_table(model.names, var.TRANSLATED_CLASSIFICATIONS)
+    allowed_classes = resolve_allowed_classes(var.ALLOWED_CLASSIFICATIONS, model.names, translation_table)
+
+    # Use tiled inference for high-resolution streams or configured regions, if the TILED_INFERENCE is set to True.
+    tiled_detector = create_tiled_detector(
+        model=model,
+        var=var,
+        frame_width=reader.frame_width,
+        frame_height=reader.frame_height,
+        classes=allowed_classes)
+
+    classification_object_list: list[ClassificationObject] = []
+    classification_object_ids: list[int] = []
+
+    # Only the objects detected in the current frame are annotated, if the PLOT is set to True.
+    frame_annotator = FrameAnnotator(
+        min_distance=var.MIN_DISTANCE,
+        min_detections=var.MIN_DETECTIONS)
+    frame_objects: list[ClassificationObject] = []
+
+    # The next frame is classified at the next tick of the CLASSIFICATION_FPS clock.
+    # If a tick is missed because the classification took too long, the clock is reset instead of catching up.
+    classification_interval = 1 / var.CLASSIFICATION_FPS
+    next_classification_time = time.time()
+    try:
+        while True:
+            frame_number, frame = reader.read()
+            if frame is None:
+                break
+
+            results = tiled_detector.track(frame) if tiled_detector is not None else model.track(
+                source=frame,
+                persist=True,
+                verbose=False,
+                conf=var.CLASSIFICATION_THRESHOLD,
+                classes=allowed_classes)
+
+            frame_objects.clear()
+            update_classification_objects(
+                results=results,
+                frame=frame,
+                frame_number=frame_number,
+                frame_width=reader.frame_width,
+                frame_height=reader.frame_height,
+                classification_object_list=classification_object_list,
+                classification_object_ids=classification_object_ids,
+                color_detector=color_detector,
+                color_prediction_interval=var.COLOR_PREDICTION_INTERVAL,
+                frame_objects=frame_objects,
+                translation_table=translation_table,
+                freeze_detections=var.FREEZE_STATIC_DETECTIONS)
+
+            if var.PLOT:
+                annotated_frame = frame_annotator.annotate(
+                    frame=frame,
+                    frame_objects=frame_objects)
+                cv2.imshow("YOLOv8 Tracking", annotated_frame)
+                cv2.waitKey(1)
+
+            emitter.update(
+                frame_number=frame_number,
+                classification_object_list=classification_object_list,
+                classification_object_ids=classification_object_ids)
+
+            next_classification_time += classification_interval
+            delay = next_classification_time - time.time()
+            if delay < 0:
+                next_classification_time -= delay
+            time.sleep(max(0, delay))
+
+        # The stream has ended, the active tracks and the partial window are emitted so their results are not lost.
+        emitter.flush(
+            frame_number=frame_number,
+            classification_object_list=classification_object_list,
+            classification_object_ids=classification_object_ids)
+    finally:
+        if var.LOGGING:
+            print(f'\t - Live stream stopped, {reader.dropped_frames} frames were dropped.')
+        reader.release()
+        cv2.destroyAllWindows() if var.PLOT else None
@@ -0,0 +1,138 @@
+from uugai_python_dynamic_queue.MessageBrokers import RabbitMQ
+import queue
+import json
+import time
+import pika
+
+
+def connection_url(host: str, username: str, password: str) -> str:
+    """ Create the url of a RabbitMQ connection, in the same way as the RabbitMQ class of uugai_python_dynamic_queue.
+
+    :param host: The host, optionally prefixed with amqp:// or amqps://.
+    :param username: The username to authenticate with.
+    :param password: The password to authenticate with.
+
+    """
+
+    protocol = 'amqps' if host.startswith('amqps://') else 'amqp'
+    host = host.replace('amqps://', '').replace('amqp://', '')
+    return f'{protocol}://{username}:{password}@{host}/'
+
+
+class AcknowledgingRabbitMQ(RabbitMQ):
+    """ RabbitMQ message broker, which acknowledges a message only after its results are published.
+    The received message stays unacknowledged while the video is classified, so it is redelivered if the worker is stopped or crashes.
+
+    """
+
+    def __init__(self, *args, keep_alive_interval: float = 10, **kwargs):
+        """ Initialize the class with the given parameters, the other parameters are passed to RabbitMQ.
+
+        :param keep_alive_interval: The minimum time in seconds between processing the heartbeats of the connection.
+
+        """
+
+        # delivery_tag -> The delivery tag of the message that is being classified.
+        # settlements -> The (delivery_tag, published) of the messages whose results were published by the ResultPublisher.
+        #                These are acknowledged or requeued by the thread using the connection, as a connection is not thread-safe.
+        self.delivery_tag = None
+        self.settlements = queue.Queue()
+        self.keep_alive_interval = keep_alive_interval
+        self.last_keep_alive_time = time.monotonic()
+        super().__init__(*args, **kwargs)
+
+    def receive_message(self) -> dict:
+        """ Receive a message from the queue, without acknowledging it.
+        :returns: The message, or an empty list if no message is available.
+
+        """
+
+        # Check if the connection and read channel are open, if not, reconnect.
+        if not self.connection.is_open:
+            print("Connection to RabbitMQ is not open")
+            self.connect()
+        if self.readChannel.is_closed:
+            print("Channel to RabbitMQ is closed")
+            self.readChannel = self.connection.channel()
+        self.settle()
+
+        method_frame, header_frame, body = self.readChannel.basic_get(self.queue_name, auto_ack=False)
+        if body is None:
+            return []
+        self.delivery_tag = method_frame.delivery_tag
+        return json.loads(body)
+
+    def keep_alive(self):
+        """ Process the heartbeats of the connection, at most every keep_alive_interval seconds.
+        This should be called regularly while classifying, otherwise the broker closes the connection and redelivers the message.
+
+        """
+
+        self.settle()
+        if time.monotonic() - self.last_keep_alive_time < self.keep_alive_interval:
+            return
+        self.last_keep_alive_time = time.monotonic()
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError as error:
+            print(f'Unable to process the RabbitMQ heartbeats: {error}')
+
+    def ack(self, delivery_tag: int = None):
+        """ Acknowledge a received message, once its results are published.
+
+        :param delivery_tag: The delivery tag of the message, if None the last received message is acknowledged.
+
+        """
+
+        delivery_tag = delivery_tag if delivery_tag is not None else self.detach()
+        if delivery_tag is None:
+            return
+        try:
+            self.readChannel.basic_ack(delivery_tag=delivery_tag)
+        except pika.exceptions.AMQPError as error:
+            print(f'Unable to acknowledge the message, it will be redelivered: {error}')
+
+    def reject(self, requeue: bool = True, delivery_tag: int = None):
+        """ Reject a received message, e.g. when the classification is interrupted by a shutdown.
+
+        :param requeue: Requeue the message, so it is redelivered to this or another worker.
+        :param delivery_tag: The delivery tag of the message, if None the last received message is rejected.
+
+        """
+
+        delivery_tag = delivery_tag if delivery_tag is not None else self.detach()
+        if delivery_tag is None:
+            return
+        try:
+            self.readChannel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+        except pika.exceptions.AMQPError as error:
+            print(f'Unable to reject the message, it will be redelivered: {error}')
+
+    def detach(self) -> int:
+        """ Detach the last received message, so it can be settled later while the next message is received.
+        :returns: The delivery tag of the message, or None if no message is unsettled.
+
+        """
+
+        delivery_tag, self.delivery_tag = self.delivery_tag, None
+        return delivery_tag
+
+    def settle_later(self, delivery_tag: int, published: bool):
+        """ Settle a detached message from another thread, e.g. the thread of the ResultPublisher.
+        The message is acknowledged or requeued on the next call of receive_message, keep_alive or settle.
+
+        :param delivery_tag: The delivery tag of the detached message.
+        :param published: True if the results were published, otherwise the message is requeued.
+
+        """
+
+        self.settlements.put((delivery_tag, published))
+
+    def settle(self):
+        """ Acknowledge the messages whose results were published, and requeue the messages whose results could not be published.
+
+        """
+
+        while not self.settlements.empty():
+            delivery_tag, published = self.settlements.get()
+            self.ack(delivery_tag) if published else self.reject(requeue=True, delivery_tag=delivery_tag)
@@ -0,0 +1,307 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager, nullcontext
+import threading
+import bisect
+import json
+import time
+
+
+# Upper bounds of the histogram buckets in seconds, the last bucket is +Inf.
+DEFAULT_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# The pipeline stages, in the order they are reported.
+# The startup stages are measured once per worker, before the first message is received.
+STAGES = ['startup_import', 'startup_model_load', 'startup_warm_up', 'receive', 'download', 'model_load', 'decode', 'inference', 'tracking_update', 'color',
+          'annotation', 'encode', 'json_build', 'publish', 'video']
+
+
+class Histogram:
+    """ Class to aggregate durations in fixed buckets, in the same way as a Prometheus histogram.
+
+    """
+
+    def __init__(self, buckets: list[float] = DEFAULT_BUCKETS):
+        """ Initialize the histogram with the given buckets.
+
+        :param buckets: Upper bounds of the buckets in seconds.
+
+        """
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """ Add a duration to the histogram.
+
+        :param value: The duration in seconds.
+
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q: float) -> float:
+        """ Estimate a percentile, by linear interpolation within the bucket containing it.
+
+        :param q: The percentile as a fraction, e.g. 0.99.
+        :returns: The estimated duration in seconds.
+
+        """
+
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                # The +Inf bucket has no upper bound, in which case the lower bound is returned.
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """ Class to measure the duration of the pipeline stages, using time.perf_counter_ns.
+    The durations are aggregated in histograms across messages, and per message in totals.
+    When disabled, the start and stop functions return immediately, so the overhead is negligible.
+
+    """
+
+    def __init__(self, enabled: bool = True, buckets: list[float] = DEFAULT_BUCKETS):
+        """ Initialize the class with the given parameters.
+
+        :param enabled: Measure the durations, if False all functions are no-ops.
+        :param buckets: Upper bounds of the histogram buckets in seconds.
+
+        """
+
+        self.enabled = enabled
+        self.buckets = buckets
+        self.histograms: dict[str, Histogram] = {}
+        self.message_totals: dict[str, float] = {}
+        self.messages = 0
+        self.lock = threading.Lock()
+        self.last_dump_time = time.time()
+
+    def start(self) -> int:
+        """ Start measuring a stage.
+        :returns: The start time in nanoseconds, or 0 if disabled.
+
+        """
+
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def stop(self, stage: str, start_time: int):
+        """ Stop measuring a stage, and add the duration to the stage's histogram and message total.
+
+        :param stage: The name of the stage.
+        :param start_time: The start time in nanoseconds, as returned by start.
+
+        """
+
+        if self.enabled:
+            self.observe(stage, (time.perf_counter_ns() - start_time) / 1e9)
+
+    def observe(self, stage: str, duration: float):
+        """ Add a duration to the stage's histogram and message total.
+
+        :param stage: The name of the stage.
+        :param duration: The duration in seconds.
+
+        """
+
+        if not self.enabled:
+            return
+        with self.lock:
+            self.observe_histogram(stage, duration)
+            self.message_totals[stage] = self.message_totals.get(stage, 0.0) + duration
+
+    def observe_histogram(self, stage: str, duration: float):
+        """ Add a duration to the stage's histogram only, the lock should be held by the caller.
+
+        """
+
+        if stage not in self.histograms:
+            self.histograms[stage] = Histogram(self.buckets)
+        self.histograms[stage].observe(duration)
+
+    @contextmanager
+    def _span(self, stage: str):
+        start_time = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter_ns() - start_time) / 1e9)
+
+    def span(self, stage: str):
+        """ Context manager measuring a stage, e.g. with metrics.span('download'): ...
+
+        :param stage: The name of the stage.
+
+        """
+
+        return self._span(stage) if self.enabled else nullcontext()
+
+    def start_message(self):
+        """ Reset the per message totals, at the start of a new message.
+
+        """
+
+        with self.lock:
+            self.message_totals = {}
+            self.messages += 1
+
+    def total(self, stage: str) -> float:
+        """ Get the total duration of a stage for the current message.
+
+        :param stage: The name of the stage.
+        :returns: The total duration in seconds.
+
+        """
+
+        return self.message_totals.get(stage, 0.0)
+
+    def ordered_stages(self) -> list[str]:
+        """ Get the measured stages, the known pipeline stages first.
+
+        """
+
+        return [stage for stage in STAGES if stage in self.histograms] + sorted(
+            stage for stage in self.histograms if stage not in STAGES)
+
+    def to_dict(self) -> dict:
+        """ Summarize the histograms, including count, sum and percentiles per stage.
+
+        """
+
+        with self.lock:
+            return {'messages': self.messages,
+                    'stages': {stage: {'count': self.histograms[stage].count,
+                                       'sum': self.histograms[stage].sum,
+                                       'p50': self.histograms[stage].percentile(0.5),
+                                       'p90': self.histograms[stage].percentile(0.9),
+                                       'p99': self.histograms[stage].percentile(0.99)}
+                               for stage in self.ordered_stages()}}
+
+    def to_prometheus(self) -> str:
+        """ Format the histograms in the Prometheus text exposition format.
+
+        """
+
+        lines = ['# HELP classification_stage_duration_seconds Duration of the classification pipeline stages.',
+                 '# TYPE classification_stage_duration_seconds histogram']
+        with self.lock:
+            for stage in self.ordered_stages():
+                histogram = self.histograms[stage]
+                cumulative = 0
+                for bucket, bucket_count in zip(self.buckets + ['+Inf'], histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'classification_stage_duration_seconds_bucket{{stage="{stage}",le="{bucket}"}} {cumulative}')
+                lines.append(f'classification_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'classification_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append('# HELP classification_messages_total Number of processed messages.')
+            lines.append('# TYPE classification_messages_total counter')
+            lines.append(f'classification_messages_total {self.messages}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_json(self, path: str, interval: float = 0):
+        """ Dump the summary to a json file, if the interval has passed since the last dump.
+
+        :param path: Path where the json file should be saved.
+        :param interval: Minimum time in seconds between two dumps.
+
+        """
+
+        if not self.enabled or time.time() - self.last_dump_time < interval:
+            return
+        self.last_dump_time = time.time()
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent='\t')
+
+    def worker_view(self) -> 'MetricsView':
+        """ Create a view for a worker thread, which shares the histograms but keeps its own per message totals.
+        This is needed when several videos are classified at once, as start_message would otherwise reset the totals of the other workers.
+
+        """
+
+        return MetricsView(self)
+
+    def start_http_server(self, port: int) -> ThreadingHTTPServer:
+        """ Expose the histograms on http://0.0.0.0:port/metrics, in the Prometheus text format.
+        The server runs in a separate daemon thread.
+
+        :param port: The port to listen on.
+
+        """
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class MetricsView():
+    """ View of a Metrics object for a single worker thread.
+    The durations are added to the shared histograms, the per message totals and the current message are kept per worker.
+    The other functions, e.g. ordered_stages and dump_json, are those of the shared Metrics object.
+
+    """
+
+    def __init__(self, metrics: Metrics):
+        """ Initialize the view of the given Metrics object.
+
+        :param metrics: The shared Metrics object.
+
+        """
+
+        self.metrics = metrics
+        self.message_totals: dict[str, float] = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self.metrics, name)
+
+    # The measuring functions only use enabled and observe, so they are shared with Metrics.
+    start = Metrics.start
+    stop = Metrics.stop
+    span = Metrics.span
+    _span = Metrics._span
+    total = Metrics.total
+
+    def observe(self, stage: str, duration: float):
+        """ Add a duration to the shared histogram of the stage, and to the message total of this worker.
+
+        """
+
+        if not self.enabled:
+            return
+        with self.metrics.lock:
+            self.metrics.observe_histogram(stage, duration)
+        self.message_totals[stage] = self.message_totals.get(stage, 0.0) + duration
+
+    def start_message(self):
+        """ Reset the per message totals of this worker, at the start of a new message.
+
+        """
+
+        with self.metrics.lock:
+            self.metrics.messages += 1
+        self.message_totals = {}
@@ -0,0 +1,167 @@
+from utils.Detections import Detections, create_translation_table
+import numpy as np
+import time
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """ The intersection over union between a box and each of the boxes, shape (len(boxes),).
+
+    """
+
+    intersection_width = np.maximum(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0)
+    intersection_height = np.maximum(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0)
+    intersection = intersection_width * intersection_height
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def cascade_min_conf(threshold: float, uncertainty_band: float) -> float:
+    """ The confidence threshold of the small model of a cascade, the lower end of the uncertainty band.
+    This is also used by the detectors that are created before the cascade, e.g. the BatchInferenceServer.
+
+    """
+
+    return max(threshold - uncertainty_band, 0.01)
+
+
+class ModelCascade():
+    """ Class to verify the uncertain detections of a small model, using a larger detection or classification model on the crops.
+    The larger model is only called for detections of new track ids, and for detections whose confidence is within the uncertainty band
+    around the classification threshold. All crops of a frame are predicted in a single batched call.
+    The label of the larger model takes precedence in the name voting of the track, and detections below the threshold are only kept if confirmed.
+
+    """
+
+    def __init__(self, model, threshold: float, uncertainty_band: float = 0.1, translations: dict = None, classes: list[int] = None,
+                 crop_padding: float = 0.2, imgsz: int = 320, match_iou: float = 0.3):
+        """ Initialize the class with the given parameters.
+
+        :param model: The larger ultralytics YOLO model, a detection, segmentation or classification model.
+        :param threshold: The classification threshold.
+        :param uncertainty_band: The detections with a confidence within this distance of the threshold are verified.
+        :param translations: The translation table of the class names, if None the default translations are used.
+        :param classes: The class indices of the larger model to detect, if None all classes are detected.
+        :param crop_padding: The padding added around a crop, as a fraction of the width and height of the detection.
+        :param imgsz: The inference size of the crops.
+        :param match_iou: The minimum intersection over union between a detection and a detection of the larger model.
+
+        """
+
+        self.model = model
+        self.threshold = threshold
+        self.uncertainty_band = uncertainty_band
+        self.translation_table = create_translation_table(model.names, translations)
+        self.classes = classes
+        self.crop_padding = crop_padding
+        self.imgsz = imgsz
+        self.match_iou = match_iou
+
+        # The report of the cascade for the video:
+        # calls -> The number of calls of the larger model, at most once per frame.
+        # crops -> The number of verified detections, i.e. the crops predicted by the larger model.
+        # detections -> The number of detections of the small model.
+        # rejected -> The number of detections below the threshold, which were not confirmed and dropped.
+        # relabeled -> The number of verified detections, for which the larger model predicted a different label.
+        # time -> The time spent in the larger model, in seconds.
+        self.calls = 0
+        self.crops = 0
+        self.detections = 0
+        self.rejected = 0
+        self.relabeled = 0
+        self.time = 0.0
+
+    @property
+    def min_conf(self) -> float:
+        """ The confidence threshold of the small model, the lower end of the uncertainty band.
+
+        """
+
+        return cascade_min_conf(self.threshold, self.uncertainty_band)
+
+    def crop(self, frame, box: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ Crop the detection with padding, for context.
+        :returns: The crop, and the box of the detection in crop coordinates.
+
+        """
+
+        padding = self.crop_padding * (box[2:] - box[:2])
+        x1, y1 = np.maximum(box[:2] - padding, 0).astype(int)
+        x2, y2 = np.maximum(np.minimum(box[2:] + padding, [frame.shape[1], frame.shape[0]]).astype(int), [x1 + 1, y1 + 1])
+        return frame[y1:y2, x1:x2], box - [x1, y1, x1, y1]
+
+    def label(self, crop_results, crop_box: np.ndarray) -> str:
+        """ The label predicted by the larger model for a crop.
+        :returns: The translated label, or None if the larger model did not confirm the detection.
+
+        """
+
+        # A classification model predicts the class of the whole crop.
+        if crop_results.probs is not None:
+            return self.translation_table[crop_results.probs.top1] if float(crop_results.probs.top1conf) >= self.threshold else None
+
+        # A detection model should detect the object at the same position in the crop.
+        boxes = crop_results.boxes.cpu().numpy()
+        if len(boxes) == 0:
+            return None
+        iou = box_iou(crop_box, boxes.xyxy)
+        best = int(np.argmax(iou))
+        return self.translation_table[int(boxes.cls[best])] if iou[best] >= self.match_iou else None
+
+    def verify(self, frame, detections: Detections, known_ids: list[int], translation_table: np.ndarray) -> tuple[Detections, list[str]]:
+        """ Verify the detections of new track ids and the uncertain detections of the frame, using the larger model.
+
+        :param frame: The frame of the detections.
+        :param detections: The tracked detections of the small model.
+        :param known_ids: The track ids of the existing objects.
+        :param translation_table: The translation table of the small model, as created by create_translation_table.
+        :returns: A tuple (detections, verified_names), the kept detections and the label of the larger model for each kept detection.
+                  The verified name is None for the detections that were not verified or not confirmed.
+
+        """
+
+        if detections is None or len(detections) == 0:
+            return detections, []
+        self.detections += len(detections)
+
+        uncertain = np.abs(detections.confs - self.threshold) < self.uncertainty_band
+        new = ~np.isin(detections.ids, known_ids)
+        selected = np.flatnonzero(uncertain | new)
+        verified_names = [None] * len(detections)
+        if len(selected) == 0:
+            return detections, verified_names
+
+        start_time = time.perf_counter()
+        crops, crop_boxes = zip(*(self.crop(frame, detections.xyxy[index]) for index in selected))
+        results = self.model.predict(
+            source=list(crops),
+            imgsz=self.imgsz,
+            conf=self.threshold,
+            classes=self.classes,
+            verbose=False)
+        for index, crop_box, crop_results in zip(selected, crop_boxes, results):
+            verified_names[index] = self.label(crop_results, crop_box)
+            self.relabeled += verified_names[index] is not None and verified_names[index] != translation_table[detections.classes[index]]
+        self.calls += 1
+        self.crops += len(selected)
+        self.time += time.perf_counter() - start_time
+
+        # The detections below the threshold are only kept if the larger model confirmed them.
+        keep = np.array([name is not None or conf >= self.threshold for name, conf in zip(verified_names, detections.confs)])
+        if keep.all():
+            return detections, verified_names
+        self.rejected += int((~keep).sum())
+        kept_indices = np.flatnonzero(keep)
+        return detections.select(kept_indices), [verified_names[index] for index in kept_indices]
+
+    def report(self) -> dict:
+        """ The report of how often the larger model was called, and what it cost.
+
+        """
+
+        return {'calls': self.calls,
+                'crops': self.crops,
+                'detections': self.detections,
+                'rejected': self.rejected,
+                'relabeled': self.relabeled,
+                'time': round(self.time, 3)}
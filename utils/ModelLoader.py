@@ -0,0 +1,73 @@
+import os
+import time
+import numpy as np
+from ultralytics import YOLO
+
+
+# The callbacks added by YOLO.track and by restore_tracker_state, these are removed when the model is reused for a new video.
+TRACKER_CALLBACK_MODULES = ['ultralytics.trackers.track', 'utils.Checkpoint']
+
+
+def resolve_model_path(model_name: str, model_dir: str = '') -> str:
+    """ Resolve the model to load, preferring the weights or exported models pre-baked in the MODEL_DIR.
+    An exported model (e.g. yolov8n-seg_openvino_model or yolov8n-seg.onnx) is used by setting it as the model name.
+
+    :param model_name: The model name or path, e.g. yolov8n-seg.pt.
+    :param model_dir: The directory containing the pre-baked models, if empty only the model name is used.
+    :returns: The path of the pre-baked model if it exists, otherwise the model name, which ultralytics downloads if needed.
+
+    """
+
+    if os.path.exists(model_name) or not model_dir:
+        return model_name
+    model_path = os.path.join(model_dir, os.path.basename(model_name))
+    if os.path.exists(model_path):
+        return model_path
+    print(f'Model {model_name} is not pre-baked in {model_dir}, it is downloaded on first use')
+    return model_name
+
+
+def load_model(model_name: str, model_dir: str = '', device: str = 'cpu'):
+    """ Load a YOLO model, from the MODEL_DIR if it is pre-baked there.
+
+    :param model_name: The model name or path, e.g. yolov8n-seg.pt.
+    :param model_dir: The directory containing the pre-baked models.
+    :param device: The device to run the model on, an exported model is run on the device of its format instead.
+
+    """
+
+    model_path = resolve_model_path(model_name, model_dir)
+    model = YOLO(model_path)
+    # Only a PyTorch model can be moved to a device.
+    return model.to(device) if str(model_path).endswith('.pt') else model
+
+
+def warm_up(model, imgsz: int = 640) -> float:
+    """ Run a single inference on a blank frame, so the first video does not pay for the lazy initialization of the model.
+    The predictor, the fused layers and the kernels of the device are initialized by this inference.
+
+    :param model: The ultralytics YOLO model.
+    :param imgsz: The size of the blank frame.
+    :returns: The duration of the warm-up in seconds.
+
+    """
+
+    start_time = time.perf_counter()
+    model.predict(source=np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+    return time.perf_counter() - start_time
+
+
+def reset_model(model):
+    """ Reset the tracking state of a model, so it can be reused for the next video without reloading it.
+    The tracker callbacks are removed and the trackers deleted, the next YOLO.track call registers new ones.
+    The predictor is kept, so the model stays warm.
+
+    :param model: The ultralytics YOLO model.
+
+    """
+
+    for event in ['on_predict_start', 'on_predict_postprocess_end']:
+        model.callbacks[event] = [callback for callback in model.callbacks[event]
+                                  if getattr(callback, 'func', callback).__module__ not in TRACKER_CALLBACK_MODULES]
+    if model.predictor is not None and hasattr(model.predictor, 'trackers'):
+        del model.predictor.trackers
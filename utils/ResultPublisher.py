@@ -0,0 +1,229 @@
+from utils.Serializer import serialize_batch
+from utils.MessageBroker import connection_url
+import threading
+import queue
+import gzip
+import time
+import pika
+
+
+# The sentinel submitted by close, after which the publisher thread stops.
+CLOSE = object()
+
+# The content type of the published messages, per serializer.
+CONTENT_TYPES = {'json': 'application/json', 'orjson': 'application/json', 'msgpack': 'application/msgpack'}
+
+
+class PublishRequest():
+    """ A result message submitted to the ResultPublisher, and the function called once it is published or dropped.
+
+    """
+
+    def __init__(self, body: bytes, on_published=None):
+        self.body = body
+        self.on_published = on_published
+        self.submit_time = time.perf_counter()
+
+
+class ResultPublisher():
+    """ Class to publish the result messages in a separate thread, with its own RabbitMQ connection and channel.
+    The channel uses publisher confirms, a message is only reported as published once the broker confirmed it.
+    The blocking channel waits for the confirm of each message before the next message is published, the confirms are not pipelined.
+    Small messages are optionally combined in a single message, which is confirmed once, and large messages are optionally compressed.
+    A combined message is an array of the results with a batchSize header, so combining changes the message format for the consumers.
+    The failed publishes are retried with exponential backoff in the publisher thread, so the classification of the next video continues.
+
+    """
+
+    def __init__(self, host: str, username: str, password: str, exchange: str, routing_key: str, serializer: str = 'json',
+                 batch_size: int = 1, batch_wait_ms: float = 50, batch_max_bytes: int = 65536, compress_min_bytes: int = 0,
+                 max_retries: int = 5, max_pending: int = 100, initial_backoff: float = 1, max_backoff: float = 30):
+        """ Initialize the class with the given parameters, and start the publisher thread.
+
+        :param host: The host of RabbitMQ, optionally prefixed with amqp:// or amqps://.
+        :param username: The username to authenticate with.
+        :param password: The password to authenticate with.
+        :param exchange: The exchange the messages are published to.
+        :param routing_key: The routing key of the messages, i.e. the target queue.
+        :param serializer: The serializer of the messages, either 'json', 'orjson' or 'msgpack'. Used for the content type and batches.
+        :param batch_size: The maximum number of messages combined in a single message, 1 disables batching.
+        :param batch_wait_ms: The maximum time in milliseconds a message waits for other messages to combine with.
+        :param batch_max_bytes: The maximum size of a message to be combined with other messages, larger messages are published alone.
+        :param compress_min_bytes: The minimum size of a message to be compressed using gzip, 0 disables compression.
+        :param max_retries: The number of retries of a failed publish, after which the message is reported as not published.
+        :param max_pending: The maximum number of messages waiting to be published, publish blocks when this is reached.
+        :param initial_backoff: The time in seconds before the first retry, doubled for each next retry.
+        :param max_backoff: The maximum time in seconds between two retries.
+
+        """
+
+        self.url = connection_url(host, username, password)
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.serializer = serializer
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.batch_max_bytes = batch_max_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        # published, failed -> The number of published messages, and the number of messages that could not be published.
+        # batches -> The number of published (combined) messages.
+        self.published = 0
+        self.failed = 0
+        self.batches = 0
+        self.connection = None
+        self.channel = None
+        self.next_request = None
+        self.aborted = threading.Event()
+        self.requests = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def publish(self, body, on_published=None):
+        """ Submit a message to be published, this only blocks if max_pending messages are waiting.
+
+        :param body: The serialized message, a string or bytes.
+        :param on_published: A function called from the publisher thread with True once the message is confirmed,
+                             or with False if it could not be published.
+
+        """
+
+        self.requests.put(PublishRequest(body.encode() if isinstance(body, str) else body, on_published))
+
+    def connect(self):
+        """ Open the connection and the channel, with publisher confirms enabled.
+
+        """
+
+        self.connection = pika.BlockingConnection(pika.URLParameters(self.url))
+        self.channel = self.connection.channel()
+        self.channel.confirm_delivery()
+
+    def disconnect(self):
+        """ Close the connection, errors are ignored as the connection is usually already lost.
+
+        """
+
+        try:
+            self.connection.close() if self.connection is not None and self.connection.is_open else None
+        except (pika.exceptions.AMQPError, OSError):
+            pass
+        self.connection, self.channel = None, None
+
+    def collect_batch(self, first_request: PublishRequest) -> list[PublishRequest]:
+        """ Collect the messages to combine with the first message, a large message is published alone.
+
+        """
+
+        batch = [first_request]
+        if self.batch_size <= 1 or len(first_request.body) > self.batch_max_bytes:
+            return batch
+        deadline = first_request.submit_time + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is CLOSE or len(request.body) > self.batch_max_bytes:
+                self.next_request = request
+                break
+            batch.append(request)
+        return batch
+
+    def prepare(self, batch: list[PublishRequest]) -> tuple[bytes, pika.BasicProperties]:
+        """ Create the body and properties of the message to publish, combining and compressing the messages.
+
+        """
+
+        body = batch[0].body if len(batch) == 1 else serialize_batch([request.body for request in batch], self.serializer)
+        compressed = self.compress_min_bytes > 0 and len(body) >= self.compress_min_bytes
+        properties = pika.BasicProperties(
+            content_type=CONTENT_TYPES.get(self.serializer),
+            content_encoding='gzip' if compressed else None,
+            headers={'batchSize': len(batch)} if len(batch) > 1 else None,
+            delivery_mode=2)
+        return gzip.compress(body) if compressed else body, properties
+
+    def send(self, batch: list[PublishRequest]):
+        """ Publish a batch, and wait for the confirm of the broker. The publish is retried with exponential backoff.
+
+        """
+
+        body, properties = self.prepare(batch)
+        published = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.channel is None or self.channel.is_closed:
+                    self.disconnect()
+                    self.connect()
+                # With publisher confirms, basic_publish returns once the broker confirmed the message, and raises if it is nacked.
+                self.channel.basic_publish(exchange=self.exchange, routing_key=self.routing_key, body=body, properties=properties)
+                published = True
+                break
+            except (pika.exceptions.AMQPError, OSError) as error:
+                backoff = min(self.initial_backoff * 2 ** attempt, self.max_backoff)
+                print(f'Unable to publish {len(batch)} result message(s), attempt {attempt + 1} of {self.max_retries + 1}: {error!r}')
+                if not isinstance(error, pika.exceptions.NackError):
+                    self.disconnect()
+                if attempt == self.max_retries or self.aborted.wait(backoff):
+                    break
+
+        if published:
+            self.published += len(batch)
+            self.batches += 1
+        else:
+            self.failed += len(batch)
+        for request in batch:
+            request.on_published(published) if request.on_published is not None else None
+
+    def run(self):
+        """ The publisher thread, publishing the messages until the publisher is closed.
+        The heartbeats of the connection are processed while no messages are waiting.
+
+        """
+
+        while not self.aborted.is_set():
+            request, self.next_request = self.next_request, None
+            if request is None:
+                try:
+                    request = self.requests.get(timeout=1)
+                except queue.Empty:
+                    try:
+                        self.connection.process_data_events(time_limit=0) if self.connection is not None else None
+                    except (pika.exceptions.AMQPError, OSError):
+                        self.disconnect()
+                    continue
+            if request is CLOSE:
+                break
+            self.send(self.collect_batch(request))
+        self.disconnect()
+
+    def close(self, timeout: float = 30):
+        """ Publish the submitted messages and stop the publisher thread.
+        The retries are aborted after the timeout, the messages that are not published yet are then reported as not published.
+
+        :param timeout: The maximum time in seconds to wait for the submitted messages.
+
+        """
+
+        self.requests.put(CLOSE)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self.aborted.set()
+            # A publish that is waiting for its confirm is not interrupted, the thread is given at most the timeout to finish it.
+            self.thread.join(timeout)
+
+        # The messages that were not picked up by the thread are reported as not published, so their messages are requeued.
+        pending = [self.next_request] if self.next_request not in (None, CLOSE) else []
+        while not self.requests.empty():
+            pending.append(self.requests.get())
+        for request in pending:
+            if request is not CLOSE:
+                self.failed += 1
+                request.on_published(False) if request.on_published is not None else None
@@ -1,5 +1,15 @@
 from utils.ClassificationObject import ClassificationObject
+from utils.Serializer import serialize, compact_return_object
+from utils.Thumbnail import thumbnail_details
+from utils.TrajectoryAnalytics import analyze_trajectory
+import tempfile
+import pickle
 import json
+import os
+
+
+# Placeholder of the details in the serialized skeleton of a StreamingReturnJSON, it is replaced by the streamed details.
+DETAILS_PLACEHOLDER = '\x00details\x00'
 
 
 class ReturnJSON:
@@ -21,9 +31,12 @@ class ReturnJSON:
                               }
                               }
 
-    def add_detected_object(self, det_obj: ClassificationObject):
+    def add_detected_object(self, det_obj: ClassificationObject, detections_start: int = 0, colors_start: int = 0):
         """ Adds a detected object to the ReturnJSON class object.
         :param det_obj: ClassificationObject whose characteristics should be saved in the ReturnJSON object.
+        :param detections_start: The index of the first detection to add, the frames and trajectory before it are left out.
+                                 Used by the live stream results, which only contain the detections since the previous result.
+        :param colors_start: The index of the first colors to add, the colors before it are left out.
 
         """
         
@@ -39,13 +52,13 @@ class ReturnJSON:
                         'frameWidth': det_obj.frame_width,
                         'frameHeight': det_obj.frame_height,
                         'frame': det_obj.first_frame,
-                        'frames': det_obj.frames,
+                        'frames': det_obj.frames[detections_start:],
                         'occurence': det_obj.occurences,
-                        'traject': det_obj.trajectory,
-                        'trajectCentroids': det_obj.trajectory_centroids,
-                        'colorsBGR': det_obj.object_colors_bgr,
-                        'colorsHLS': det_obj.object_colors_hls,
-                        'colorsStr': det_obj.object_colors_str,
+                        'traject': det_obj.full_trajectory[detections_start:].tolist(),
+                        'trajectCentroids': det_obj.full_trajectory_centroids[detections_start:].tolist(),
+                        'colorsBGR': det_obj.object_colors_bgr[colors_start:],
+                        'colorsHLS': det_obj.object_colors_hls[colors_start:],
+                        'colorsStr': det_obj.object_colors_str[colors_start:],
                         'colorStr': det_obj.object_color_str,
                         'valid': det_obj.valid,
                         'w': det_obj.w,
@@ -63,11 +76,373 @@ class ReturnJSON:
         for det_obj in det_obj_list:
             self.add_detected_object(det_obj)
 
-    def save_returnjson(self, path: str):
+    def add_early_exit(self, stopped_early: bool, stopped_at_frame: int):
+        """ Adds the early exit information to the ReturnJSON class object.
+        :param stopped_early: True if the classification stopped before the end of the video, because the results stabilized.
+        :param stopped_at_frame: Frame number at which the classification stopped.
+
+        """
+
+        self.return_object['data']['stoppedEarly'] = stopped_early
+        self.return_object['data']['stoppedAtFrame'] = stopped_at_frame
+
+    def add_cascade(self, model_name: str, report: dict):
+        """ Adds the report of the model cascade to the ReturnJSON class object.
+        :param model_name: The name of the larger model of the cascade.
+        :param report: The report of how often the larger model was called, and what it cost.
+
+        """
+
+        self.return_object['data']['cascade'] = {'model': model_name, **report}
+
+    def add_window(self, start_frame: int, end_frame: int, ended_ids: list[str]):
+        """ Adds the window information of a partial live stream result to the ReturnJSON class object.
+        :param start_frame: Frame number where the window started.
+        :param end_frame: Frame number where the window ended, i.e. the frame at which the results are emitted.
+        :param ended_ids: Ids of the objects that ended in this window, these objects are not emitted again.
+
+        """
+
+        self.return_object['data']['window'] = {'startFrame': start_frame,
+                                                'endFrame': end_frame,
+                                                'endedIds': ended_ids
+                                                }
+
+    def add_thumbnails(self, det_obj_list: list[ClassificationObject], image_format: str = 'jpg', quality: int = 80, inline: bool = False, save_directory: str = None):
+        """ Adds the thumbnails, i.e. the best crop of each object, to the details of the detected objects.
+        :param det_obj_list: List containing the ClassificationObjects that were added to the ReturnJSON object.
+        :param image_format: The image format of the thumbnails, either 'jpg' or 'webp'.
+        :param quality: The quality of the compression, between 0 and 100.
+        :param inline: Add the thumbnails as base64 strings, instead of saving them to files.
+        :param save_directory: The directory where the thumbnails are saved, if not inline.
+
+        """
+
+        details_by_id = {details['id']: details for details in self.return_object['data']['details']}
+        for det_obj in det_obj_list:
+            if det_obj.thumbnail is not None and str(det_obj.id) in details_by_id:
+                details_by_id[str(det_obj.id)]['thumbnail'] = thumbnail_details(
+                    thumbnail=det_obj.thumbnail,
+                    object_id=det_obj.id,
+                    frame_number=det_obj.thumbnail_frame,
+                    score=det_obj.thumbnail_score,
+                    image_format=image_format,
+                    quality=quality,
+                    inline=inline,
+                    save_directory=save_directory)
+
+    def add_trajectory_analytics(self, det_obj_list: list[ClassificationObject], fps: float = 0, stop_speed: float = 20, min_static_distance: float = 50):
+        """ Adds the trajectory analytics, i.e. speed, heading, dwell time, stop/go segments and a robust static test,
+        to the details of the detected objects.
+        :param det_obj_list: List containing the ClassificationObjects that were added to the ReturnJSON object.
+        :param fps: The fps of the video, if 0 the speeds and times are in frames.
+        :param stop_speed: The speed below which an object is considered stopped.
+        :param min_static_distance: The radius around the median position, within which a static object stays.
+
+        """
+
+        details_by_id = {details['id']: details for details in self.return_object['data']['details']}
+        for det_obj in det_obj_list:
+            if str(det_obj.id) in details_by_id:
+                details_by_id[str(det_obj.id)]['analytics'] = analyze_trajectory(
+                    centroids=det_obj.full_trajectory_centroids,
+                    frames=det_obj.frames,
+                    fps=fps,
+                    stop_speed=stop_speed,
+                    min_static_distance=min_static_distance)
+
+    def to_message(self, message: dict, serializer: str = 'json', compact: bool = False, precision: int = 2):
+        """ Add the results to the original message, and serialize it to be sent to the target queue.
+        :param message: The message received from the queue, the operation and data are added to it.
+        :param serializer: The serializer to use, either 'json', 'orjson' or 'msgpack'.
+        :param compact: Use the compact schema, with rounded floats, delta-encoded frames and packed trajectories.
+        :param precision: The number of decimals floats are rounded to in the compact schema.
+        :returns: The serialized message, a string for the json serializer and bytes otherwise.
+
+        """
+
+        return_object = compact_return_object(
+            self.return_object, precision, binary=serializer == 'msgpack') if compact else self.return_object
+        message['operation'] = return_object['operation']
+        message['data'] = return_object['data']
+        return json.dumps(message) if serializer == 'json' else serialize(message, serializer)
+
+    def serialize(self, serializer: str = 'json', compact: bool = False, precision: int = 2, indent: bool = False) -> bytes:
+        """ Serialize the ReturnJSON object.
+        :param serializer: The serializer to use, either 'json', 'orjson' or 'msgpack'.
+        :param compact: Use the compact schema, with rounded floats, delta-encoded frames and packed trajectories.
+        :param precision: The number of decimals floats are rounded to in the compact schema.
+        :param indent: Indent the output, only used by the json serializers.
+
+        """
+
+        return_object = compact_return_object(
+            self.return_object, precision, binary=serializer == 'msgpack') if compact else self.return_object
+        return serialize(return_object, serializer, indent)
+
+    def save_returnjson(self, path: str, serializer: str = 'json', compact: bool = False, precision: int = 2):
         """ Save the ReturnJSON object to a json file.
+        By default the json file is tab-indented, other serializers or the compact schema are written as bytes.
         :param path: Path where the json file should be saved.
+        :param serializer: The serializer to use, either 'json', 'orjson' or 'msgpack'.
+        :param compact: Use the compact schema, with rounded floats, delta-encoded frames and packed trajectories.
+        :param precision: The number of decimals floats are rounded to in the compact schema.
+
+        """
+
+        if serializer == 'json' and not compact:
+            with open(path, 'w') as file:
+                json.dump(self.return_object, file, indent='\t')
+        else:
+            with open(path, 'wb') as file:
+                file.write(self.serialize(serializer, compact, precision, indent=True))
+
+
+class StreamingReturnJSON(ReturnJSON):
+    """ ReturnJSON with a bounded memory, for long recordings.
+    Objects that have not been seen for idle_frames frames are finalized: their details are written to a temporary file, and the objects are dropped.
+    The details are streamed from the file when the result is saved or sent, in the order the objects were created.
+    The tracker can revive a lost track after any number of frames, so the finalized objects are also pickled to the file.
+    When a finalized id is detected again, its object is restored and continued, instead of adding a second object with the same id.
+    With the default json serializer the output is identical to the output of ReturnJSON, the other serializers and the compact schema
+    load the details in memory first.
+
+    """
+
+    def __init__(self, idle_frames: int, min_detections: int, thumbnail_options: dict = None, analytics_options: dict = None, path: str = None):
+        """ Initialize the class with the given parameters.
+        :param idle_frames: The number of frames an object should be unseen, before it is finalized.
+        :param min_detections: The minimum amount of detections for an object to be added, other objects are dropped when finalized.
+        :param thumbnail_options: The parameters of add_thumbnails, if None no thumbnails are added.
+        :param analytics_options: The parameters of add_trajectory_analytics, if None no trajectory analytics are added.
+        :param path: The path of the file the details are written to, which is kept for a checkpoint. If None an anonymous temporary file is used.
+
+        """
+
+        super().__init__()
+        self.idle_frames = idle_frames
+        self.min_detections = min_detections
+        self.thumbnail_options = thumbnail_options
+        self.analytics_options = analytics_options
+        self.path = path
+        self.file = open(path, 'w+b') if path is not None else tempfile.TemporaryFile()
+
+        # indices -> The creation index of each active object, keyed by id. The details are ordered by this index.
+        # entries -> The (index, offset, length, object_name, is_static) of each written object, the details are only kept in the file.
+        # finalized_objects -> The number of finalized objects, including the objects with less than min_detections detections.
+        # parked -> The (index, offset, length) of the pickled object of each finalized id, used to restore the object if the id reappears.
+        self.indices = {}
+        self.next_index = 0
+        self.entries = []
+        self.finalized_objects = 0
+        self.parked = {}
+
+    def __getstate__(self) -> dict:
+        """ Pickle the state without the file, the file is flushed and its size is kept so it can be reopened.
+
+        """
+
+        if self.path is None:
+            raise TypeError('A StreamingReturnJSON without a path can not be pickled')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        state = dict(self.__dict__)
+        state['file'] = None
+        state['file_size'] = self.file.seek(0, os.SEEK_END)
+        return state
+
+    def __setstate__(self, state: dict):
+        """ Restore the pickled state, the details written after the state was pickled are removed from the file.
+
+        """
+
+        file_size = state.pop('file_size')
+        self.__dict__.update(state)
+        self.file = open(self.path, 'r+b')
+        self.file.truncate(file_size)
+
+    def close(self):
+        """ Close the file of the details, once the result is sent or saved. The file is kept if it belongs to a checkpoint.
+
+        """
+
+        self.file.close()
+
+    def index_objects(self, det_obj_list: list[ClassificationObject]):
+        """ Record the creation index of the new objects, the restored objects keep their original index.
+
+        """
+
+        for det_obj in det_obj_list:
+            if det_obj.id not in self.indices:
+                self.indices[det_obj.id] = self.next_index
+                self.next_index += 1
+
+    def write_detected_object(self, det_obj: ClassificationObject):
+        """ Finalize an object, its details are written to the file if it has at least min_detections detections.
+        The object itself is pickled to the file, so it can be restored if its id reappears.
+
+        """
+
+        self.finalized_objects += 1
+        index = self.indices.pop(det_obj.id)
+        data = pickle.dumps(det_obj, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        self.parked[det_obj.id] = (index, offset, len(data))
+        if det_obj.occurences < self.min_detections:
+            return
+
+        # The details are created in the same way as by ReturnJSON, so the output is identical.
+        part = ReturnJSON()
+        part.add_detected_object(det_obj)
+        part.add_thumbnails([det_obj], **self.thumbnail_options) if self.thumbnail_options is not None else None
+        part.add_trajectory_analytics([det_obj], **self.analytics_options) if self.analytics_options is not None else None
+        line = json.dumps(part.details[0]).encode()
+
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(line + b'\n')
+        self.entries.append((index, offset, len(line), det_obj.object_name, det_obj.is_static))
+
+    def restore_object(self, object_id: int) -> ClassificationObject:
+        """ Restore a finalized object whose id is detected again, its details are removed until it is finalized again.
+        :param object_id: The id of the detected object.
+        :returns: The restored object with its original creation index, or None if the id was not finalized.
+
+        """
+
+        if object_id not in self.parked:
+            return None
+        index, offset, length = self.parked.pop(object_id)
+        self.file.flush()
+        self.file.seek(offset)
+        det_obj = pickle.loads(self.file.read(length))
+        self.indices[object_id] = index
+        self.entries = [entry for entry in self.entries if entry[0] != index]
+        self.finalized_objects -= 1
+        return det_obj
+
+    def finalize_idle_objects(self, frame_number: int, classification_object_list: list[ClassificationObject], classification_object_ids: list[int]) -> list[ClassificationObject]:
+        """ Finalize the objects that have not been seen for idle_frames frames, and remove them.
+        :param frame_number: The current frame number.
+        :param classification_object_list: The list of classification objects, finalized objects are removed from this list.
+        :param classification_object_ids: The list of the ids of the classification objects, finalized ids are removed from this list.
+        :returns: The finalized objects.
+
+        """
+
+        self.index_objects(classification_object_list)
+        idle_objects = [classification_object for classification_object in classification_object_list
+                        if frame_number - classification_object.frames[-1] > self.idle_frames]
+        if not idle_objects:
+            return idle_objects
+
+        for classification_object in idle_objects:
+            self.write_detected_object(classification_object)
+
+        # The lists are edited in place as they are shared with the classification loop.
+        classification_object_list[:] = [classification_object for classification_object in classification_object_list
+                                          if frame_number - classification_object.frames[-1] <= self.idle_frames]
+        classification_object_ids[:] = [classification_object.id for classification_object in classification_object_list]
+        return idle_objects
+
+    def finalize_objects(self, classification_object_list: list[ClassificationObject]):
+        """ Finalize the remaining objects at the end of the video, and add the object count and properties.
+        :param classification_object_list: The list of the remaining classification objects, this list is not altered.
+
+        """
+
+        self.index_objects(classification_object_list)
+        for classification_object in classification_object_list:
+            self.write_detected_object(classification_object)
+
+        self.entries.sort()
+        self.return_object['data']['objectCount'] = sum(not is_static for _, _, _, _, is_static in self.entries)
+        self.properties[:] = [object_name for _, _, _, object_name, is_static in self.entries if not is_static]
+
+    def iter_details(self):
+        """ Read the serialized details from the file, in the order the objects were created.
+
+        """
+
+        self.file.flush()
+        for _, offset, length, _, _ in self.entries:
+            self.file.seek(offset)
+            yield self.file.read(length).decode()
+
+    def iter_json(self, data: dict, indent: bool = False):
+        """ Serialize data containing the return object as json, streaming the details from the file.
+        The data is serialized with a placeholder for the details, which is replaced by the details in the same format json.dumps uses.
+        :param data: The return object, or a message containing its data.
+        :param indent: Indent the output using tabs.
+
+        """
+
+        self.return_object['data']['details'] = DETAILS_PLACEHOLDER
+        try:
+            skeleton = json.dumps(data, indent='\t' if indent else None)
+        finally:
+            self.return_object['data']['details'] = self.details
+        prefix, suffix = skeleton.split(json.dumps(DETAILS_PLACEHOLDER))
+
+        yield prefix
+        if not self.entries:
+            yield '[]'
+        elif not indent:
+            yield '['
+            for index, details in enumerate(self.iter_details()):
+                yield ', ' + details if index > 0 else details
+            yield ']'
+        else:
+            # The details are indented one level deeper than the line containing the details key.
+            line = prefix[prefix.rindex('\n') + 1:]
+            outer_indent = line[:len(line) - len(line.lstrip('\t'))]
+            inner_indent = outer_indent + '\t'
+            yield '['
+            for index, details in enumerate(self.iter_details()):
+                yield (',\n' if index > 0 else '\n') + inner_indent + json.dumps(json.loads(details), indent='\t').replace('\n', '\n' + inner_indent)
+            yield '\n' + outer_indent + ']'
+        yield suffix
+
+    def load_details(self):
+        """ Load the details in memory, this is needed for the other serializers and the compact schema.
+
+        """
+
+        if not self.details:
+            self.details.extend(json.loads(details) for details in self.iter_details())
+
+    def to_message(self, message: dict, serializer: str = 'json', compact: bool = False, precision: int = 2):
+        """ Add the results to the original message, and serialize it to be sent to the target queue.
+        With the json serializer the details are streamed from the file, otherwise they are loaded in memory first.
+
+        """
+
+        if serializer != 'json' or compact or self.details:
+            self.load_details()
+            return super().to_message(message, serializer, compact, precision)
+        message['operation'] = self.return_object['operation']
+        message['data'] = self.return_object['data']
+        return ''.join(self.iter_json(message))
+
+    def serialize(self, serializer: str = 'json', compact: bool = False, precision: int = 2, indent: bool = False) -> bytes:
+        """ Serialize the StreamingReturnJSON object, the details are streamed from the file with the json serializer.
+
+        """
+
+        if serializer != 'json' or compact or self.details:
+            self.load_details()
+            return super().serialize(serializer, compact, precision, indent)
+        return ''.join(self.iter_json(self.return_object, indent)).encode()
+
+    def save_returnjson(self, path: str, serializer: str = 'json', compact: bool = False, precision: int = 2):
+        """ Save the StreamingReturnJSON object, the details are streamed from the file to the json file one object at a time.
 
         """
 
+        if serializer != 'json' or compact or self.details:
+            self.load_details()
+            return super().save_returnjson(path, serializer, compact, precision)
         with open(path, 'w') as file:
-            json.dump(self.return_object, file, indent='\t')
+            for chunk in self.iter_json(self.return_object, indent=True):
+                file.write(chunk)
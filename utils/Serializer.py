@@ -0,0 +1,135 @@
+import base64
+import json
+import numpy as np
+
+# The orjson and msgpack serializers are optional dependencies, only needed when selected.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+SERIALIZERS = ['json', 'orjson', 'msgpack']
+
+
+def serialize(data: dict, serializer: str = 'json', indent: bool = False) -> bytes:
+    """ Serialize a (ReturnJSON) dictionary using the given serializer.
+
+    :param data: The dictionary to serialize.
+    :param serializer: The serializer to use, either 'json', 'orjson' or 'msgpack'.
+    :param indent: Indent the output, only used by the json serializers. The json serializer indents using tabs, orjson using 2 spaces.
+    :returns: The serialized dictionary as bytes.
+
+    """
+
+    if serializer == 'json':
+        return json.dumps(data, indent='\t' if indent else None).encode()
+
+    if serializer == 'orjson':
+        if orjson is None:
+            raise ImportError('The orjson serializer requires the orjson package, install it using: pip install orjson')
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+
+    if serializer == 'msgpack':
+        if msgpack is None:
+            raise ImportError('The msgpack serializer requires the msgpack package, install it using: pip install msgpack')
+        return msgpack.packb(data, use_bin_type=True)
+
+    raise ValueError(f'Unknown serializer: {serializer}, choose one of {SERIALIZERS}')
+
+
+def serialize_batch(bodies: list[bytes], serializer: str = 'json') -> bytes:
+    """ Combine serialized messages into a single array, without deserializing them.
+
+    :param bodies: The serialized messages.
+    :param serializer: The serializer the messages were serialized with, either 'json', 'orjson' or 'msgpack'.
+    :returns: A json array of the messages, or a msgpack array for the msgpack serializer.
+
+    """
+
+    if serializer == 'msgpack':
+        # A msgpack array is a header with the number of elements, followed by the serialized elements.
+        header = bytes([0x90 | len(bodies)]) if len(bodies) < 16 else (
+            b'\xdc' + len(bodies).to_bytes(2, 'big') if len(bodies) < 2**16 else b'\xdd' + len(bodies).to_bytes(4, 'big'))
+        return header + b''.join(bodies)
+    return b'[' + b','.join(bodies) + b']'
+
+
+def pack_array(values, dtype: str, binary: bool):
+    """ Pack a (nested) list of numbers into a flat little-endian array.
+
+    :param values: The (nested) list of numbers to pack.
+    :param dtype: The numpy dtype of the packed array, e.g. '<f4'.
+    :param binary: Return raw bytes if True (msgpack), otherwise a base64 encoded string (json).
+
+    """
+
+    packed = np.asarray(values, dtype=dtype).tobytes()
+    return packed if binary else base64.b64encode(packed).decode()
+
+
+def round_nested(values, precision: int) -> list:
+    """ Round a nested list of floats, e.g. the colors of all detections of an object.
+    The rounding is vectorized if all elements have the same shape, which is the case for a fixed number of clusters.
+
+    :param values: The nested list of floats to round.
+    :param precision: The number of decimals floats are rounded to.
+
+    """
+
+    try:
+        return np.round(np.asarray(values, dtype=np.float64), precision).tolist()
+    except ValueError:
+        return [round_nested(value, precision) for value in values]
+
+
+# The float fields of the trajectory analytics, which are rounded in the compact schema.
+ANALYTICS_FLOATS = ['speedMean', 'speedMax', 'speedProfile', 'heading', 'dwellTime', 'stoppedTime']
+
+
+def compact_return_object(return_object: dict, precision: int = 2, binary: bool = False) -> dict:
+    """ Convert a ReturnJSON object to the compact schema.
+    The compact schema is a copy of the return object where:
+        - floats are rounded to the given precision.
+        - frames are delta-encoded, the first element is the first frame, followed by the differences between consecutive frames.
+        - trajectories are packed as flat little-endian float32 arrays, [x11, y11, x12, y12, x21, ...] and [x1, y1, x2, ...].
+    The original return object is not altered.
+
+    :param return_object: The return_object of a ReturnJSON object.
+    :param precision: The number of decimals floats are rounded to.
+    :param binary: Pack the trajectories as raw bytes if True (msgpack), otherwise as base64 encoded strings (json).
+    :returns: The return object in the compact schema.
+
+    """
+
+    compact_details = []
+    for details in return_object['data']['details']:
+        compact = dict(details)
+        compact['distance'] = round(details['distance'], precision)
+        compact['staticDistance'] = round(details['staticDistance'], precision)
+
+        del compact['frames']
+        compact['framesDelta'] = np.diff(details['frames'], prepend=0).tolist()
+
+        del compact['traject'], compact['trajectCentroids']
+        compact['trajectPacked'] = pack_array(details['traject'], '<f4', binary)
+        compact['trajectCentroidsPacked'] = pack_array(details['trajectCentroids'], '<f4', binary)
+
+        compact['colorsBGR'] = round_nested(details['colorsBGR'], precision)
+        compact['colorsHLS'] = round_nested(details['colorsHLS'], precision)
+        if 'analytics' in details:
+            compact['analytics'] = dict(details['analytics'])
+            for key in ANALYTICS_FLOATS:
+                compact['analytics'][key] = round_nested(details['analytics'][key], precision)
+        compact_details.append(compact)
+
+    compact_object = dict(return_object)
+    compact_object['data'] = dict(return_object['data'])
+    compact_object['data']['schema'] = 'compact'
+    compact_object['data']['details'] = compact_details
+    return compact_object
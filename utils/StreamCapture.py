@@ -0,0 +1,256 @@
+import subprocess
+import threading
+import requests
+import cv2
+import numpy as np
+
+
+class StreamCapture():
+    """ Class to decode a video while it is still being received, without writing it to disk first.
+    The video is decoded by an ffmpeg subprocess, which outputs raw frames in the YUV4MPEG2 format.
+    The class mimics the cv2.VideoCapture interface (isOpened, read, get, release), so it can be used as a drop-in replacement.
+
+    """
+
+    def __init__(self, source, fallback_path: str = None, ffmpeg_path: str = 'ffmpeg'):
+        """ Initialize the class with the given parameters.
+
+        :param source: The video source, this can be one of the following:
+                       - A string, containing a (streaming) url or path that ffmpeg can open, e.g. rtsp://..., http://...
+                       - A bytes-like object, containing the complete video in memory.
+                       - A file-like object with a read function, e.g. a pipe.
+                       - A streamed requests.Response, as returned by stream_media.
+                       - An iterable of bytes chunks, e.g. requests.Response.iter_content().
+        :param fallback_path: Path where the received bytes are written, if the video can't be decoded while receiving.
+                              This is the case for mp4 files with the moov atom at the end of the file.
+        :param ffmpeg_path: Path to the ffmpeg executable.
+
+        """
+
+        self.source = source
+        self.fallback_path = fallback_path
+
+        # capture -> cv2.VideoCapture, only used if the video can't be decoded while receiving.
+        # frame_count -> The number of frames read so far, the total number of frames is unknown up front.
+        # received_chunks -> Copy of the received bytes, used for the fallback. Dropped once decoding starts.
+        self.capture = None
+        self.frame_count = 0
+        self.bytes_received = 0
+        self.received_chunks = []
+        self.keep_received_chunks = fallback_path is not None
+        self.width, self.height, self.fps = 0, 0, 0.0
+
+        # Strings are directly opened by ffmpeg, all other sources are fed to ffmpeg using stdin.
+        input_argument = source if isinstance(source, str) else 'pipe:0'
+        self.process = subprocess.Popen(
+            [ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+             '-i', input_argument,
+             '-an', '-sn',
+             '-fps_mode', 'passthrough',
+             '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+             '-pix_fmt', 'yuv420p',
+             '-f', 'yuv4mpegpipe', 'pipe:1'],
+            stdin=subprocess.DEVNULL if isinstance(source, str) else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=1024**2)
+
+        # stopped -> Set by release, after which the feeder stops receiving the source.
+        self.stopped = threading.Event()
+        self.feeder = None
+        if not isinstance(source, str):
+            self.feeder = threading.Thread(target=self.feed_source, daemon=True)
+            self.feeder.start()
+
+        # The YUV4MPEG2 header is written once the first frame is decoded,
+        # if no header is received the video is opened from the fallback instead.
+        if not self.read_header():
+            self.open_fallback()
+        self.keep_received_chunks = False
+        self.received_chunks = []
+
+    def iterate_source(self):
+        """ Iterate over the bytes chunks of the source.
+
+        """
+
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            yield bytes(self.source)
+        elif isinstance(self.source, requests.Response):
+            yield from self.source.iter_content(chunk_size=1024**2)
+        elif hasattr(self.source, 'read'):
+            while True:
+                chunk = self.source.read(1024**2)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            yield from self.source
+
+    def feed_source(self):
+        """ Feed the source to the stdin of the ffmpeg process, this runs in a separate thread.
+        If ffmpeg stops reading, the source is still consumed for the fallback, until the capture is released.
+
+        """
+
+        try:
+            for chunk in self.iterate_source():
+                if self.stopped.is_set():
+                    break
+                self.bytes_received += len(chunk)
+                if self.keep_received_chunks:
+                    self.received_chunks.append(chunk)
+                if self.process.stdin is None:
+                    continue
+                try:
+                    self.process.stdin.write(chunk)
+                except (BrokenPipeError, ValueError):
+                    # ffmpeg stopped reading, e.g. because the video can't be decoded while receiving.
+                    self.process.stdin = None
+        except Exception:
+            # Closing the response in release interrupts the receiving, which is expected.
+            if not self.stopped.is_set():
+                raise
+
+        if self.process.stdin is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read_header(self) -> bool:
+        """ Read the YUV4MPEG2 header, containing the width, height and fps of the video.
+        :returns: True if the header is read successfully, False otherwise.
+
+        """
+
+        header = self.process.stdout.readline()
+        if not header.startswith(b'YUV4MPEG2'):
+            return False
+
+        for parameter in header.decode().split()[1:]:
+            if parameter[0] == 'W':
+                self.width = int(parameter[1:])
+            elif parameter[0] == 'H':
+                self.height = int(parameter[1:])
+            elif parameter[0] == 'F':
+                numerator, denominator = parameter[1:].split(':')
+                self.fps = int(numerator) / int(denominator) if int(denominator) != 0 else 0.0
+        return True
+
+    def open_fallback(self):
+        """ Open the video using cv2.VideoCapture, after the complete video is received.
+        Urls are opened directly, other sources are written to the fallback_path first.
+
+        """
+
+        self.process.kill()
+        self.process.wait()
+        if self.feeder is not None:
+            self.feeder.join()
+
+        if isinstance(self.source, str):
+            self.capture = cv2.VideoCapture(self.source)
+        elif self.fallback_path is not None:
+            with open(self.fallback_path, 'wb') as file:
+                for chunk in self.received_chunks:
+                    file.write(chunk)
+            self.capture = cv2.VideoCapture(self.fallback_path)
+
+    def isOpened(self) -> bool:
+        """ Check if the video is opened.
+
+        """
+
+        if self.capture is not None:
+            return self.capture.isOpened()
+        return self.width > 0 and self.height > 0
+
+    def read(self):
+        """ Read the next frame of the video.
+        :returns: A tuple (success, frame), in the same way as cv2.VideoCapture.read().
+
+        """
+
+        if self.capture is not None:
+            return self.capture.read()
+        if self.width == 0 or self.height == 0:
+            return False, None
+
+        # Every frame starts with a FRAME line, followed by the planar YUV420 data.
+        frame_header = self.process.stdout.readline()
+        if not frame_header.startswith(b'FRAME'):
+            return False, None
+        frame_size = self.width * self.height * 3 // 2
+        frame_data = self.process.stdout.read(frame_size)
+        if len(frame_data) != frame_size:
+            return False, None
+
+        yuv_frame = np.frombuffer(frame_data, dtype=np.uint8).reshape(
+            self.height * 3 // 2, self.width)
+        self.frame_count += 1
+        return True, cv2.cvtColor(yuv_frame, cv2.COLOR_YUV2BGR_I420)
+
+    def get(self, property_id: int) -> float:
+        """ Get a property of the video, in the same way as cv2.VideoCapture.get().
+        The total number of frames is unknown while receiving, in which case 0 is returned.
+
+        :param property_id: The cv2.CAP_PROP_* property to get.
+
+        """
+
+        if self.capture is not None:
+            return self.capture.get(property_id)
+        if property_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if property_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if property_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if property_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frame_count)
+        return 0.0
+
+    def release(self):
+        """ Release the video, this stops the ffmpeg process, the feeder thread and closes the source.
+        A response is closed while the feeder receives it, so the rest of the video is not downloaded.
+        Other sources are closed once the feeder stopped, as e.g. a generator can't be closed while it is iterated.
+
+        """
+
+        self.stopped.set()
+        if self.capture is not None:
+            self.capture.release()
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        if isinstance(self.source, requests.Response):
+            self.source.close()
+        if self.feeder is not None:
+            self.feeder.join()
+        if hasattr(self.source, 'close'):
+            self.source.close()
+
+
+def stream_media(message, storage_uri: str, storage_access_key: str, storage_secret_key: str):
+    """ Stream media from the Kerberos Vault, instead of writing it to disk.
+    This uses the same storage request as KerberosVault.retrieve_media, but the response is read in chunks by the StreamCapture.
+
+    :param message: The message received from the queue, containing the media information.
+    :param storage_uri: The uri of the Kerberos Vault.
+    :param storage_access_key: The access key of the Kerberos Vault.
+    :param storage_secret_key: The secret key of the Kerberos Vault.
+    :returns: The streamed requests.Response, which can be used as source of a StreamCapture. It is closed when the capture is released.
+
+    """
+
+    headers = {
+        'X-Kerberos-Storage-FileName': message['payload']['key'],
+        'X-Kerberos-Storage-Provider': message['source'],
+        'X-Kerberos-Storage-AccessKey': storage_access_key,
+        'X-Kerberos-Storage-SecretAccessKey': storage_secret_key,
+    }
+    response = requests.get(
+        storage_uri + '/storage/blob', headers=headers, stream=True, timeout=10)
+    response.raise_for_status()
+    return response
@@ -0,0 +1,108 @@
+import base64
+import math
+import os
+import cv2
+
+
+# The Laplacian variance at which the sharpness factor is 0.5, the factor approaches 1 for sharper crops.
+SHARPNESS_HALF_VARIANCE = 100
+
+THUMBNAIL_FORMATS = {'jpg': cv2.IMWRITE_JPEG_QUALITY, 'webp': cv2.IMWRITE_WEBP_QUALITY}
+
+
+def crop_size_score(object_conf: float, trajectory: list[float], frame_width: int, frame_height: int) -> float:
+    """ Score a detection on confidence and size, this is an upper bound of the crop score, as the sharpness factor is at most 1.
+    The size is the square root of the fraction of the frame covered by the bounding box.
+
+    :param object_conf: The confidence score of the detection.
+    :param trajectory: The bounding box coordinates [x1, y1, x2, y2].
+    :param frame_width: Width of the frame.
+    :param frame_height: Height of the frame.
+
+    """
+
+    area = max(0.0, trajectory[2] - trajectory[0]) * max(0.0, trajectory[3] - trajectory[1])
+    return object_conf * math.sqrt(area / (frame_width * frame_height))
+
+
+def sharpness_score(crop) -> float:
+    """ Score the sharpness of a crop, using the variance of the Laplacian of the grayscale crop.
+    The variance is mapped to [0, 1), so blurry crops (e.g. motion blur) get a low score.
+
+    :param crop: The BGR crop.
+
+    """
+
+    variance = cv2.Laplacian(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
+    return float(variance / (variance + SHARPNESS_HALF_VARIANCE))
+
+
+def extract_thumbnail(frame, trajectory: list[float], thumbnail_size: int):
+    """ Crop the bounding box from the frame, and downscale it so the longest side is at most thumbnail_size.
+    The thumbnail is a copy, so the frame is not kept in memory.
+
+    :param frame: The frame to crop from.
+    :param trajectory: The bounding box coordinates [x1, y1, x2, y2].
+    :param thumbnail_size: The maximum length of the longest side of the thumbnail in pixels.
+    :returns: The thumbnail, or None if the bounding box is empty.
+
+    """
+
+    x1, y1 = max(0, int(trajectory[0])), max(0, int(trajectory[1]))
+    x2, y2 = min(frame.shape[1], int(trajectory[2])), min(frame.shape[0], int(trajectory[3]))
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    crop = frame[y1:y2, x1:x2]
+    scale = thumbnail_size / max(crop.shape[:2])
+    if scale >= 1:
+        return crop.copy()
+    return cv2.resize(crop, (max(1, int((x2 - x1) * scale)), max(1, int((y2 - y1) * scale))), interpolation=cv2.INTER_AREA)
+
+
+def encode_thumbnail(thumbnail, image_format: str = 'jpg', quality: int = 80) -> bytes:
+    """ Encode a thumbnail as a compressed image.
+
+    :param thumbnail: The BGR thumbnail.
+    :param image_format: The image format, either 'jpg' or 'webp'.
+    :param quality: The quality of the compression, between 0 and 100.
+
+    """
+
+    if image_format not in THUMBNAIL_FORMATS:
+        raise ValueError(f'Unknown thumbnail format: {image_format}, choose one of {list(THUMBNAIL_FORMATS)}')
+    success, encoded_thumbnail = cv2.imencode('.' + image_format, thumbnail, [THUMBNAIL_FORMATS[image_format], quality])
+    if not success:
+        raise RuntimeError(f'Unable to encode the thumbnail as {image_format}')
+    return encoded_thumbnail.tobytes()
+
+
+def thumbnail_details(thumbnail, object_id, frame_number: int, score: float, image_format: str = 'jpg', quality: int = 80,
+                      inline: bool = False, save_directory: str = None) -> dict:
+    """ Encode a thumbnail and create its ReturnJSON details, the thumbnail is either saved to a file or added inline.
+
+    :param thumbnail: The BGR thumbnail.
+    :param object_id: The id of the object, used as file name.
+    :param frame_number: The frame number the thumbnail was cropped from.
+    :param score: The quality score of the thumbnail.
+    :param image_format: The image format, either 'jpg' or 'webp'.
+    :param quality: The quality of the compression, between 0 and 100.
+    :param inline: Add the encoded thumbnail as a base64 string, instead of saving it to a file.
+    :param save_directory: The directory where the thumbnail is saved, if not inline.
+
+    """
+
+    encoded_thumbnail = encode_thumbnail(thumbnail, image_format, quality)
+    details = {'frame': frame_number,
+               'score': score,
+               'format': image_format,
+               'width': thumbnail.shape[1],
+               'height': thumbnail.shape[0]}
+    if inline:
+        details['data'] = base64.b64encode(encoded_thumbnail).decode()
+    elif save_directory:
+        os.makedirs(save_directory, exist_ok=True)
+        details['path'] = os.path.join(save_directory, f'{object_id}.{image_format}')
+        with open(details['path'], 'wb') as file:
+            file.write(encoded_thumbnail)
+    return details
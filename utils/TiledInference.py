@@ -0,0 +1,216 @@
+from utils.Detections import Detections
+import numpy as np
+
+
+def parse_regions(regions_str: str) -> list[tuple[int, int, int, int]]:
+    """ Parse the regions to tile from a string, e.g. "0, 0, 1920, 1080; 1920, 0, 3840, 1080".
+
+    :param regions_str: The semicolon separated regions, each as comma separated x1, y1, x2, y2 pixel coordinates.
+
+    """
+
+    return [tuple(int(value.strip()) for value in region.split(',')) for region in regions_str.split(';') if region.strip()]
+
+
+def tile_positions(start: int, end: int, tile_size: int, stride: int) -> list[int]:
+    """ Get the start positions of the tiles along one axis, the last tile is aligned with the end.
+
+    """
+
+    if end - start <= tile_size:
+        return [start]
+    positions = list(range(start, end - tile_size, stride))
+    return positions + [end - tile_size]
+
+
+def create_tiles(frame_width: int, frame_height: int, tile_size: int = 640, overlap: float = 0.2, regions: list = None) -> list[tuple[int, int, int, int]]:
+    """ Create overlapping tiles covering the frame, or only the given regions of the frame.
+
+    :param frame_width: Width of the frame.
+    :param frame_height: Height of the frame.
+    :param tile_size: The width and height of a tile, the native input size of the model.
+    :param overlap: The overlap between neighbouring tiles, as a fraction of the tile size.
+    :param regions: The regions (x1, y1, x2, y2) to tile, if None the whole frame is tiled.
+    :returns: The tiles as (x1, y1, x2, y2) pixel coordinates.
+
+    """
+
+    stride = max(1, int(tile_size * (1 - overlap)))
+    tiles = []
+    for x1, y1, x2, y2 in regions or [(0, 0, frame_width, frame_height)]:
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(frame_width, x2), min(frame_height, y2)
+        for tile_y in tile_positions(y1, y2, tile_size, stride):
+            for tile_x in tile_positions(x1, x2, tile_size, stride):
+                tiles.append((tile_x, tile_y, min(tile_x + tile_size, x2), min(tile_y + tile_size, y2)))
+    return tiles
+
+
+def merge_detections(xyxy: np.ndarray, confs: np.ndarray, classes: np.ndarray, match_threshold: float = 0.6):
+    """ Merge the duplicate detections of overlapping tiles, using a greedy class-aware non-maximum suppression.
+    Detections are matched on the intersection over the smaller box, as an object cut at a tile border is (mostly) inside the full detection.
+    The kept box is extended to the union of the boxes it suppressed, so a cut object gets its full bounding box.
+
+    :param xyxy: The bounding boxes in frame coordinates, shape (n, 4).
+    :param confs: The confidence scores, shape (n,).
+    :param classes: The class indices, shape (n,).
+    :param match_threshold: The minimum intersection over the smaller box, for two detections of the same class to be merged.
+    :returns: A tuple (xyxy, confs, classes) of the merged detections.
+
+    """
+
+    areas = np.maximum(xyxy[:, 2] - xyxy[:, 0], 0) * np.maximum(xyxy[:, 3] - xyxy[:, 1], 0)
+    order = np.argsort(-confs, kind='stable')
+    merged_xyxy, keep = [], []
+    while order.size > 0:
+        i, rest = order[0], order[1:]
+        intersection_width = np.maximum(np.minimum(xyxy[i, 2], xyxy[rest, 2]) - np.maximum(xyxy[i, 0], xyxy[rest, 0]), 0)
+        intersection_height = np.maximum(np.minimum(xyxy[i, 3], xyxy[rest, 3]) - np.maximum(xyxy[i, 1], xyxy[rest, 1]), 0)
+        intersection_over_smaller = intersection_width * intersection_height / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        matches = rest[(intersection_over_smaller > match_threshold) & (classes[rest] == classes[i])]
+
+        matched_xyxy = xyxy[np.concatenate([[i], matches])]
+        merged_xyxy.append(np.concatenate([matched_xyxy[:, :2].min(axis=0), matched_xyxy[:, 2:].max(axis=0)]))
+        keep.append(i)
+        order = rest[~np.isin(rest, matches)]
+
+    return np.array(merged_xyxy, dtype=np.float64).reshape(-1, 4), confs[keep], classes[keep]
+
+
+class TrackerInput():
+    """ The detections in the format expected by the ultralytics trackers, in the same way as ultralytics Boxes.
+
+    """
+
+    def __init__(self, xyxy: np.ndarray, confs: np.ndarray, classes: np.ndarray):
+        self.xyxy = xyxy
+        self.conf = confs
+        self.cls = classes
+        self.xywh = np.concatenate([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class TiledDetector():
+    """ Class to detect and track small objects in high-resolution frames, using tiled inference.
+    The frame is split in overlapping tiles at the native input size of the model, and all tiles are detected in a single batched call.
+    The detections are merged across tiles, and fed to a ByteTrack tracker, in the same way as YOLO.track does for a full frame.
+
+    """
+
+    def __init__(self, model, tile_size: int = 640, overlap: float = 0.2, regions: list = None, full_frame: bool = True,
+                 conf: float = 0.3, classes: list[int] = None, match_threshold: float = 0.6, tracker: str = 'bytetrack.yaml'):
+        """ Initialize the class with the given parameters.
+
+        :param model: The ultralytics YOLO model used for detection.
+        :param tile_size: The width and height of a tile, the native input size of the model.
+        :param overlap: The overlap between neighbouring tiles, as a fraction of the tile size.
+        :param regions: The regions (x1, y1, x2, y2) to tile, if None the whole frame is tiled.
+        :param full_frame: Also detect the full (downscaled) frame in the same batch, for large objects and the area outside the regions.
+        :param conf: The confidence threshold of the detections.
+        :param classes: The class indices to detect, if None all classes are detected.
+        :param match_threshold: The minimum intersection over the smaller box, for detections of neighbouring tiles to be merged.
+        :param tracker: The ultralytics tracker configuration.
+
+        """
+
+        # The ultralytics trackers are only imported when tiled inference is used.
+        from ultralytics.trackers.byte_tracker import BYTETracker
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.regions = regions
+        self.full_frame = full_frame
+        self.conf = conf
+        self.classes = classes
+        self.match_threshold = match_threshold
+        self.tiles = None
+        self.tracker = BYTETracker(args=IterableSimpleNamespace(**yaml_load(check_yaml(tracker))), frame_rate=30)
+
+    def detect(self, frame):
+        """ Detect the objects in all tiles of the frame, and merge the detections.
+
+        :param frame: The frame to detect.
+        :returns: A tuple (xyxy, confs, classes) of the merged detections in frame coordinates.
+
+        """
+
+        # The tiles are created once, as all frames of a video have the same size.
+        if self.tiles is None:
+            self.tiles = create_tiles(frame.shape[1], frame.shape[0], self.tile_size, self.overlap, self.regions)
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.tiles]
+        offsets = [(x1, y1) for x1, y1, _, _ in self.tiles]
+        if self.full_frame:
+            crops.append(frame)
+            offsets.append((0, 0))
+
+        # All tiles are detected in a single batched call, each tile is letterboxed to the tile size.
+        results = self.model.predict(
+            source=crops,
+            imgsz=self.tile_size,
+            conf=self.conf,
+            classes=self.classes,
+            verbose=False)
+
+        xyxy, confs, classes = [], [], []
+        for tile_results, (offset_x, offset_y) in zip(results, offsets):
+            boxes = tile_results.boxes.cpu().numpy()
+            xyxy.append(boxes.xyxy.astype(np.float64) + [offset_x, offset_y, offset_x, offset_y])
+            confs.append(boxes.conf.astype(np.float64))
+            classes.append(boxes.cls.astype(np.float64))
+
+        return merge_detections(np.concatenate(xyxy), np.concatenate(confs), np.concatenate(classes), self.match_threshold)
+
+    def track(self, frame) -> Detections:
+        """ Detect the objects in the frame using tiled inference, and track them.
+
+        :param frame: The frame to detect and track.
+        :returns: A Detections object of the tracked objects, or None if no objects are tracked.
+
+        """
+
+        xyxy, confs, classes = self.detect(frame)
+        # In the same way as YOLO.track, the tracker is not updated without detections.
+        if len(confs) == 0:
+            return None
+        tracks = self.tracker.update(TrackerInput(xyxy, confs, classes), frame)
+        if len(tracks) == 0:
+            return None
+
+        # The tracks contain x1, y1, x2, y2, track id, confidence, class and the index of the detection.
+        return Detections(
+            ids=tracks[:, 4].astype(np.int64),
+            classes=tracks[:, 6].astype(np.int64),
+            confs=tracks[:, 5].astype(np.float64),
+            xyxy=tracks[:, :4].astype(np.float64),
+            names=self.model.names)
+
+
+def create_tiled_detector(model, var, frame_width: int, frame_height: int, classes: list[int] = None, conf: float = None) -> TiledDetector:
+    """ Create a TiledDetector if tiled inference should be used for a video, depending on the environment variables.
+    Tiled inference is used if TILED_INFERENCE is set to True, and regions are configured or the frame is high-resolution.
+
+    :param model: The ultralytics YOLO model used for detection.
+    :param var: The VariableClass object, containing the environment variables.
+    :param frame_width: Width of the frames of the video.
+    :param frame_height: Height of the frames of the video.
+    :param classes: The class indices to detect, if None all classes are detected.
+    :param conf: The confidence threshold of the detections, if None the CLASSIFICATION_THRESHOLD is used.
+    :returns: A TiledDetector object, or None if the full frame should be tracked using YOLO.track.
+
+    """
+
+    if not var.TILED_INFERENCE or (not var.TILED_REGIONS and max(frame_width, frame_height) < var.TILED_MIN_RESOLUTION):
+        return None
+    return TiledDetector(
+        model=model,
+        tile_size=var.TILE_SIZE,
+        overlap=var.TILE_OVERLAP,
+        regions=var.TILED_REGIONS or None,
+        full_frame=var.TILED_FULL_FRAME,
+        conf=conf if conf is not None else var.CLASSIFICATION_THRESHOLD,
+        classes=classes,
+        match_threshold=var.TILED_MATCH_THRESHOLD)
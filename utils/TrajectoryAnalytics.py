@@ -0,0 +1,82 @@
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+
+
+def smooth_centroids(centroids: np.ndarray, window: int = 5) -> np.ndarray:
+    """ Smooth the centroids using a moving median, this removes the jitter of the bounding boxes.
+    The trajectory is padded at both ends, so the smoothed trajectory has the same length.
+
+    :param centroids: The centroids of the trajectory, shape (n, 2).
+    :param window: The number of centroids in the moving median, an odd number.
+
+    """
+
+    if len(centroids) < window:
+        return centroids
+    padded_centroids = np.pad(centroids, ((window // 2, window // 2), (0, 0)), mode='edge')
+    return np.median(sliding_window_view(padded_centroids, window, axis=0), axis=2)
+
+
+def stop_go_segments(moving: np.ndarray, frames: np.ndarray) -> list[dict]:
+    """ Split a trajectory in segments where the object is stopped or moving.
+
+    :param moving: True for each step between consecutive detections where the object is moving, shape (n - 1,).
+    :param frames: The frame numbers of the detections, shape (n,).
+    :returns: A list of segments {'state': 'stop' or 'go', 'startFrame': ..., 'endFrame': ...}.
+
+    """
+
+    if len(moving) == 0:
+        return []
+    # The steps where the state changes, a segment runs from a change up to the next change.
+    changes = np.flatnonzero(np.diff(moving.astype(np.int8))) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [len(moving)]])
+    return [{'state': 'go' if moving[start] else 'stop',
+             'startFrame': int(frames[start]),
+             'endFrame': int(frames[end])}
+            for start, end in zip(starts, ends)]
+
+
+def analyze_trajectory(centroids: np.ndarray, frames, fps: float = 0, stop_speed: float = 20, min_static_distance: float = 50, smoothing_window: int = 5) -> dict:
+    """ Analyze the trajectory of an object in a single vectorized pass, at the end of the clip.
+    Speeds are in pixels per second and times in seconds, or in pixels per frame and frames if the fps is unknown.
+
+    :param centroids: The centroids of the trajectory, shape (n, 2).
+    :param frames: The frame numbers of the detections, shape (n,).
+    :param fps: The fps of the video, if 0 the speeds and times are in frames.
+    :param stop_speed: The speed below which the object is considered stopped.
+    :param min_static_distance: The radius around the median position, within which a static object stays.
+    :param smoothing_window: The number of centroids in the moving median used to remove jitter.
+    :returns: A dictionary containing:
+        - speedMean, speedMax: The mean and maximum speed.
+        - speedProfile: The speed between each pair of consecutive detections.
+        - heading: The direction from the first to the last position in degrees, 0 is to the right and 90 is down.
+        - dwellTime: The time between the first and last detection.
+        - stoppedTime: The time the object was stopped.
+        - segments: The stop/go segments.
+        - isStaticRobust: True if 95% of the (smoothed) positions are within min_static_distance of the median position.
+
+    """
+
+    frames = np.asarray(frames, dtype=np.float64)
+    time_scale = fps if fps > 0 else 1
+    smoothed_centroids = smooth_centroids(np.asarray(centroids, dtype=np.float64), smoothing_window)
+
+    # The speed between consecutive detections, the time step depends on the sampled frames.
+    steps = np.diff(smoothed_centroids, axis=0)
+    time_steps = np.maximum(np.diff(frames), 1) / time_scale
+    speeds = np.hypot(steps[:, 0], steps[:, 1]) / time_steps
+    moving = speeds >= stop_speed
+
+    displacement = smoothed_centroids[-1] - smoothed_centroids[0]
+    radii = np.hypot(*(smoothed_centroids - np.median(smoothed_centroids, axis=0)).T)
+
+    return {'speedMean': float(speeds.mean()) if len(speeds) else 0.0,
+            'speedMax': float(speeds.max()) if len(speeds) else 0.0,
+            'speedProfile': speeds.tolist(),
+            'heading': float(np.degrees(np.arctan2(displacement[1], displacement[0])) % 360),
+            'dwellTime': float((frames[-1] - frames[0]) / time_scale),
+            'stoppedTime': float(time_steps[~moving].sum()),
+            'segments': stop_go_segments(moving, frames),
+            'isStaticRobust': bool(np.percentile(radii, 95) <= min_static_distance)}
@@ -1,23 +1,35 @@
-def translate(label):
+# The default translations of the object labels to a common format.
+# These can be changed per deployment using the TRANSLATED_CLASSIFICATIONS environment variable.
+DEFAULT_TRANSLATIONS = {'person': 'pedestrian',
+                        'truck': 'lorry',
+                        'van': 'car',
+                        'bicycle': 'cyclist',
+                        'dog': 'animal',
+                        'cat': 'animal',
+                        'bird': 'animal'}
+
+
+def parse_translations(translations_str: str) -> dict:
+    """Parse a translation table from a string, e.g. "person: pedestrian, truck: lorry, dog: animal".
+
+    param translations_str: The comma separated label: translation pairs.
+
+    """
+
+    translations = {}
+    for item in translations_str.split(','):
+        if item.strip():
+            label, translated = item.split(':')
+            translations[label.strip()] = translated.strip()
+    return translations
+
+
+def translate(label, translations: dict = None):
     """Translate object labels to a common format.
     
     param label: The object label to be translated.
+    param translations: The translation table, labels without translation are kept. If None, the default translations are used.
     
     """
     
-    translated = label
-    if label == 'person':
-        translated = 'pedestrian'
-    if label == 'truck':
-        translated = 'lorry'
-    if label == 'van':
-        translated = 'car'
-    if label == 'bicycle':
-        translated = 'cyclist'
-    if label == 'dog':
-        translated = 'animal'
-    if label == 'cat':
-        translated = 'animal'
-    if label == 'bird':
-        translated = 'animal'
-    return translated
\ No newline at end of file
+    return (DEFAULT_TRANSLATIONS if translations is None else translations).get(label, label)
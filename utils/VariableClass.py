@@ -1,5 +1,8 @@
 import os
+import copy
 from dotenv import load_dotenv
+from utils.TranslateObject import parse_translations
+from utils.TiledInference import parse_regions
 
 
 
@@ -18,7 +21,16 @@ class VariableClass:
 
         # Model parameters
         self.MODEL_NAME = os.getenv("MODEL_NAME")
+        # The directory containing the models pre-baked in the image, a model missing there is downloaded on first use.
+        self.MODEL_DIR = os.getenv("MODEL_DIR", "")
+        # The larger model of the cascade, verifying the detections of new tracks and the detections within CASCADE_UNCERTAINTY_BAND of the threshold.
+        # An empty CASCADE_MODEL_NAME disables the cascade.
+        self.CASCADE_MODEL_NAME = os.getenv("CASCADE_MODEL_NAME", "")
+        self.CASCADE_UNCERTAINTY_BAND = float(os.getenv("CASCADE_UNCERTAINTY_BAND", "0.1"))
+        self.CASCADE_IMGSZ = int(os.getenv("CASCADE_IMGSZ", "320"))
         self.MEDIA_SAVEPATH = os.getenv("MEDIA_SAVEPATH")
+        # The MEDIA_INPUT_MODE is either "file" (written to disk first) or "stream" (decoded while received).
+        self.MEDIA_INPUT_MODE = os.getenv("MEDIA_INPUT_MODE", "file")
 
         # Queue parameters
         self.QUEUE_NAME = os.getenv("QUEUE_NAME")
@@ -27,6 +39,29 @@ class VariableClass:
         self.QUEUE_HOST = os.getenv("QUEUE_HOST")
         self.QUEUE_USERNAME = os.getenv("QUEUE_USERNAME")
         self.QUEUE_PASSWORD = os.getenv("QUEUE_PASSWORD")
+        # The results are published by a separate thread with its own connection, using publisher confirms.
+        # Up to PUBLISH_BATCH_SIZE messages smaller than PUBLISH_BATCH_MAX_BYTES are combined, waiting at most PUBLISH_BATCH_WAIT_MS milliseconds.
+        # A combined message contains an array of the results with a batchSize header, which changes the message format of the target queue.
+        # Messages of at least PUBLISH_COMPRESS_MIN_BYTES bytes are compressed using gzip, 0 disables compression.
+        self.PUBLISH_ASYNC = os.getenv("PUBLISH_ASYNC", "False") == "True"
+        self.PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "1"))
+        self.PUBLISH_BATCH_WAIT_MS = float(os.getenv("PUBLISH_BATCH_WAIT_MS", "50"))
+        self.PUBLISH_BATCH_MAX_BYTES = int(os.getenv("PUBLISH_BATCH_MAX_BYTES", "65536"))
+        self.PUBLISH_COMPRESS_MIN_BYTES = int(os.getenv("PUBLISH_COMPRESS_MIN_BYTES", "0"))
+        self.PUBLISH_MAX_RETRIES = int(os.getenv("PUBLISH_MAX_RETRIES", "5"))
+        self.PUBLISH_MAX_PENDING = int(os.getenv("PUBLISH_MAX_PENDING", "100"))
+
+        # Checkpoint parameters
+        # The classification state is saved in CHECKPOINT_DIR every CHECKPOINT_INTERVAL seconds, an empty CHECKPOINT_DIR disables checkpointing.
+        self.CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "")
+        self.CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "60"))
+
+        # Batch inference parameters
+        # CONCURRENT_VIDEOS videos are classified at once, their frames are detected in batches of at most BATCH_MAX_SIZE frames.
+        # A frame waits at most BATCH_MAX_WAIT_MS milliseconds for the frames of the other videos.
+        self.CONCURRENT_VIDEOS = int(os.getenv("CONCURRENT_VIDEOS", "1"))
+        self.BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+        self.BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
 
         # Kerberos Vault parameters
         self.STORAGE_URI = os.getenv("STORAGE_URI")
@@ -41,6 +76,13 @@ class VariableClass:
 
         self.LOGGING = os.getenv("LOGGING") == "True"
 
+        # The METRICS parameters expose per-stage duration histograms across messages.
+        # On http://0.0.0.0:METRICS_PORT/metrics if METRICS_PORT > 0, and/or as a json file every METRICS_DUMP_INTERVAL seconds.
+        self.METRICS = os.getenv("METRICS") == "True"
+        self.METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+        self.METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", "")
+        self.METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+
         self.CREATE_BBOX_FRAME = os.getenv("CREATE_BBOX_FRAME") == "True"
         self.SAVE_BBOX_FRAME = os.getenv("SAVE_BBOX_FRAME") == "True"
         self.BBOX_FRAME_SAVEPATH = os.getenv("BBOX_FRAME_SAVEPATH")
@@ -50,11 +92,35 @@ class VariableClass:
         self.CREATE_RETURN_JSON = os.getenv("CREATE_RETURN_JSON") == "True"
         self.SAVE_RETURN_JSON = os.getenv("SAVE_RETURN_JSON") == "True"
         self.RETURN_JSON_SAVEPATH = os.getenv("RETURN_JSON_SAVEPATH")
+        # The RETURN_JSON_SERIALIZER is either "json", "orjson" or "msgpack".
+        # The compact schema rounds floats to RETURN_JSON_PRECISION decimals, delta-encodes frames and packs trajectories.
+        self.RETURN_JSON_SERIALIZER = os.getenv("RETURN_JSON_SERIALIZER", "json")
+        self.RETURN_JSON_COMPACT = os.getenv("RETURN_JSON_COMPACT") == "True"
+        self.RETURN_JSON_PRECISION = int(os.getenv("RETURN_JSON_PRECISION", "2"))
+        # If RETURN_JSON_IDLE_FRAMES is larger than 0, objects unseen for this many frames are finalized to a temporary file and dropped from memory.
+        self.RETURN_JSON_IDLE_FRAMES = int(os.getenv("RETURN_JSON_IDLE_FRAMES", "0"))
         if self.SAVE_RETURN_JSON:
             self.CREATE_RETURN_JSON = True
 
         self.SAVE_VIDEO = os.getenv("SAVE_VIDEO") == "True"
         self.OUTPUT_MEDIA_SAVEPATH = os.getenv("OUTPUT_MEDIA_SAVEPATH")
+        # The annotated video is encoded in a separate thread, using opencv or an ffmpeg subprocess.
+        # The output resolution can be scaled down, and the ffmpeg backend supports a codec (e.g. h264_nvenc), bitrate and threads.
+        self.OUTPUT_VIDEO_BACKEND = os.getenv("OUTPUT_VIDEO_BACKEND", "opencv")
+        self.OUTPUT_VIDEO_SCALE = float(os.getenv("OUTPUT_VIDEO_SCALE", "1"))
+        self.OUTPUT_VIDEO_CODEC = os.getenv("OUTPUT_VIDEO_CODEC", "")
+        self.OUTPUT_VIDEO_BITRATE = os.getenv("OUTPUT_VIDEO_BITRATE", "")
+        self.OUTPUT_VIDEO_THREADS = int(os.getenv("OUTPUT_VIDEO_THREADS", "0"))
+        self.OUTPUT_VIDEO_QUEUE_SIZE = int(os.getenv("OUTPUT_VIDEO_QUEUE_SIZE", "32"))
+
+        # The best crop of each object, scored on confidence, size and sharpness, is added to the ReturnJSON as thumbnail.
+        # The thumbnails are saved in THUMBNAIL_SAVEPATH, or added inline as base64 strings if THUMBNAIL_INLINE is set to True.
+        self.CREATE_THUMBNAILS = os.getenv("CREATE_THUMBNAILS") == "True"
+        self.THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "160"))
+        self.THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "jpg")
+        self.THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+        self.THUMBNAIL_INLINE = os.getenv("THUMBNAIL_INLINE") == "True"
+        self.THUMBNAIL_SAVEPATH = os.getenv("THUMBNAIL_SAVEPATH", "")
 
         self.FIND_DOMINANT_COLORS = os.getenv("FIND_DOMINANT_COLORS") == "True"
         self.COLOR_PREDICTION_INTERVAL = int(os.getenv("COLOR_PREDICTION_INTERVAL"))
@@ -66,9 +132,62 @@ class VariableClass:
         self.CLASSIFICATION_THRESHOLD = float(os.getenv("CLASSIFICATION_THRESHOLD"))
         self.MAX_NUMBER_OF_PREDICTIONS = int(os.getenv("MAX_NUMBER_OF_PREDICTIONS"))
         self.MIN_DISTANCE = int(os.getenv("MIN_DISTANCE"))
-        self.MIN_STATIC_DISTANCE = int(os.getenv("MIN_DISTANCE"))
+        self.MIN_STATIC_DISTANCE = int(os.getenv("MIN_STATIC_DISTANCE"))
         self.MIN_DETECTIONS = int(os.getenv("MIN_DETECTIONS"))
+        # The trajectory analytics add speed, heading, dwell time, stop/go segments and a robust static test to the ReturnJSON.
+        # An object is considered stopped when its speed in pixels per second is below TRAJECTORY_STOP_SPEED.
+        self.TRAJECTORY_ANALYTICS = os.getenv("TRAJECTORY_ANALYTICS") == "True"
+        self.TRAJECTORY_STOP_SPEED = float(os.getenv("TRAJECTORY_STOP_SPEED", "20"))
+        # Objects that stay within MIN_STATIC_DISTANCE for FREEZE_STATIC_DETECTIONS detections are frozen, 0 disables freezing.
+        self.FREEZE_STATIC_DETECTIONS = int(os.getenv("FREEZE_STATIC_DETECTIONS", "0"))
+        # The adaptive sampling classifies busy stretches at up to ADAPTIVE_MAX_FPS and quiet stretches at ADAPTIVE_MIN_FPS, instead of at CLASSIFICATION_FPS.
+        # The average rate per video stays within ADAPTIVE_BUDGET_FPS, by default the CLASSIFICATION_FPS.
+        self.ADAPTIVE_SAMPLING = os.getenv("ADAPTIVE_SAMPLING") == "True"
+        self.ADAPTIVE_MIN_FPS = float(os.getenv("ADAPTIVE_MIN_FPS", "1"))
+        self.ADAPTIVE_MAX_FPS = float(os.getenv("ADAPTIVE_MAX_FPS", "15"))
+        self.ADAPTIVE_BUDGET_FPS = float(os.getenv("ADAPTIVE_BUDGET_FPS") or self.CLASSIFICATION_FPS)
+
+        # Tiled inference parameters
+        # High-resolution frames (or the configured regions) are split in overlapping tiles of TILE_SIZE, detected in a single batch.
+        # The regions are semicolon separated x1, y1, x2, y2 pixel coordinates, e.g. "0, 1000, 1920, 2160; 1920, 1000, 3840, 2160".
+        self.TILED_INFERENCE = os.getenv("TILED_INFERENCE") == "True"
+        self.TILED_MIN_RESOLUTION = int(os.getenv("TILED_MIN_RESOLUTION", "1920"))
+        self.TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+        self.TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+        self.TILED_REGIONS = parse_regions(os.getenv("TILED_REGIONS", ""))
+        self.TILED_FULL_FRAME = os.getenv("TILED_FULL_FRAME", "True") == "True"
+        self.TILED_MATCH_THRESHOLD = float(os.getenv("TILED_MATCH_THRESHOLD", "0.6"))
+        # The allowed classifications can be class indices, class names or translated class names, e.g. "0, car, animal".
         ALLOWED_CLASSIFICATIONS_STR = os.getenv("ALLOWED_CLASSIFICATIONS")
-        self.ALLOWED_CLASSIFICATIONS = [int(item.strip()) for item in ALLOWED_CLASSIFICATIONS_STR.split(',')]
-        TRANSLATED_CLASSIFICATIONS_STR = os.getenv("ALLOWED_CLASSIFICATIONS")
-        self.TRANSLATED_CLASSIFICATIONS = [item.strip() for item in TRANSLATED_CLASSIFICATIONS_STR.split(',')]
\ No newline at end of file
+        self.ALLOWED_CLASSIFICATIONS = [int(item.strip()) if item.strip().isdigit() else item.strip() for item in ALLOWED_CLASSIFICATIONS_STR.split(',')]
+        # The translations of the class names, e.g. "person: pedestrian, dog: animal". If not set, the default translations are used.
+        TRANSLATED_CLASSIFICATIONS_STR = os.getenv("TRANSLATED_CLASSIFICATIONS")
+        self.TRANSLATED_CLASSIFICATIONS = parse_translations(TRANSLATED_CLASSIFICATIONS_STR) if TRANSLATED_CLASSIFICATIONS_STR else None
+
+        # Early exit parameters
+        # The classification stops once the results did not change for EARLY_EXIT_FRAMES sampled frames.
+        self.EARLY_EXIT = os.getenv("EARLY_EXIT") == "True"
+        self.EARLY_EXIT_FRAMES = int(os.getenv("EARLY_EXIT_FRAMES", "10"))
+
+
+        # Live stream parameters
+        # In live mode a camera stream (or a looping local file) is classified continuously, instead of recordings from the queue.
+        self.LIVE_MODE = os.getenv("LIVE_MODE") == "True"
+        self.LIVE_STREAM_URL = os.getenv("LIVE_STREAM_URL")
+        self.LIVE_LOOP = os.getenv("LIVE_LOOP") == "True"
+        self.LIVE_WINDOW_SECONDS = float(os.getenv("LIVE_WINDOW_SECONDS", "10"))
+        self.LIVE_TRACK_TIMEOUT = float(os.getenv("LIVE_TRACK_TIMEOUT", "5"))
+
+    def for_worker(self, worker_index: int):
+        """This function is used to create a copy of the variables for a worker, if several videos are classified at once.
+        The worker index is added to the save paths, so the workers don't overwrite each other's files.
+
+        """
+
+        worker_var = copy.copy(self)
+        for name in ["MEDIA_SAVEPATH", "OUTPUT_MEDIA_SAVEPATH", "BBOX_FRAME_SAVEPATH", "RETURN_JSON_SAVEPATH"]:
+            path = getattr(self, name)
+            if path:
+                root, extension = os.path.splitext(path)
+                setattr(worker_var, name, f"{root}_{worker_index}{extension}")
+        return worker_var
@@ -0,0 +1,112 @@
+import subprocess
+import threading
+import queue
+import cv2
+
+
+class AsyncVideoWriter():
+    """ Class to encode a video in a separate thread, so the encoding overlaps with the classification.
+    The frames are passed through a bounded queue, when the encoder can't keep up the write function blocks,
+    instead of buffering an unbounded amount of frames in memory.
+    The same write and release functions as a cv2.VideoWriter are provided.
+
+    """
+
+    def __init__(self, filename: str, fps: float, frame_size: tuple[int, int], backend: str = 'opencv', scale: float = 1.0,
+                 codec: str = '', bitrate: str = '', threads: int = 0, queue_size: int = 32, ffmpeg_path: str = 'ffmpeg'):
+        """ Initialize the class with the given parameters, and start the encoder thread.
+
+        :param filename: Path where the video should be saved.
+        :param fps: The fps of the output video.
+        :param frame_size: The (width, height) of the input frames.
+        :param backend: Either 'opencv', using a cv2.VideoWriter, or 'ffmpeg', piping raw frames to an ffmpeg subprocess.
+        :param scale: Scale factor of the output resolution, e.g. 0.5 halves the width and height.
+        :param codec: The codec, a fourcc for opencv (default avc1), or an ffmpeg encoder (default libx264, e.g. h264_nvenc for hardware encoding).
+        :param bitrate: The target bitrate, e.g. 1M, only used by the ffmpeg backend.
+        :param threads: The number of encoder threads, only used by the ffmpeg backend. 0 lets ffmpeg decide.
+        :param queue_size: The maximum number of frames waiting to be encoded.
+        :param ffmpeg_path: Path to the ffmpeg executable.
+
+        """
+
+        self.frame_size = frame_size
+        # The output size should be even, as required by the yuv420p pixel format of H.264.
+        self.output_size = (max(2, int(frame_size[0] * scale) // 2 * 2),
+                            max(2, int(frame_size[1] * scale) // 2 * 2)) if scale != 1 else frame_size
+
+        if backend == 'opencv':
+            self.writer = cv2.VideoWriter(
+                filename=filename,
+                fourcc=cv2.VideoWriter.fourcc(*(codec or 'avc1')),
+                fps=fps,
+                frameSize=self.output_size)
+            self.process = None
+        elif backend == 'ffmpeg':
+            self.writer = None
+            self.process = subprocess.Popen(
+                [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+                 '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.output_size[0]}x{self.output_size[1]}', '-r', str(fps), '-i', 'pipe:0',
+                 '-c:v', codec or 'libx264', '-pix_fmt', 'yuv420p']
+                + (['-b:v', bitrate] if bitrate else [])
+                + (['-threads', str(threads)] if threads > 0 else [])
+                + [filename],
+                stdin=subprocess.PIPE)
+        else:
+            raise ValueError(f'Unknown video encoder backend: {backend}, choose either opencv or ffmpeg')
+
+        # frames -> The bounded queue of frames waiting to be encoded, None marks the end of the video.
+        # error -> The exception raised in the encoder thread, re-raised by write or release.
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.encode_frames, daemon=True)
+        self.thread.start()
+
+    def encode_frames(self):
+        """ Encode the frames from the queue, this runs in a separate thread.
+
+        """
+
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                # Keep consuming the queue after an error, so write never blocks.
+                continue
+            try:
+                if self.output_size != self.frame_size:
+                    frame = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA)
+                if self.writer is not None:
+                    self.writer.write(frame)
+                else:
+                    self.process.stdin.write(frame.tobytes())
+            except Exception as error:
+                self.error = error
+
+    def write(self, frame):
+        """ Add a frame to the queue, blocking when the queue is full.
+        The frame should not be altered after it is written, as it is encoded later on.
+
+        :param frame: The frame to encode, with the frame_size given at initialization.
+
+        """
+
+        if self.error is not None:
+            raise RuntimeError('Video encoding failed') from self.error
+        self.frames.put(frame)
+
+    def release(self):
+        """ Flush the queue, wait until all frames are encoded and close the video.
+
+        """
+
+        self.frames.put(None)
+        self.thread.join()
+        if self.writer is not None:
+            self.writer.release()
+        else:
+            self.process.stdin.close()
+            if self.process.wait() != 0 and self.error is None:
+                self.error = RuntimeError(f'ffmpeg exited with code {self.process.returncode}')
+        if self.error is not None:
+            raise RuntimeError('Video encoding failed') from self.error